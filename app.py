@@ -1,437 +1,155 @@
+import time
+
 import streamlit as st
-import yfinance as yf
-import pandas as pd
 import numpy as np
-import requests
-import concurrent.futures
-import twstock
-
-# --- 設定區 ---
-TELEGRAM_BOT_TOKEN = '您的_BOT_TOKEN' 
-TELEGRAM_CHAT_ID = '您的_CHAT_ID'
-
-# --- 全局參數 ---
-RF = 0.015  # 無風險利率
-MRP = 0.055 # 市場風險溢酬
-G_GROWTH = 0.02 
-COST_OF_DEBT_NET = 0.022 # 稅後債務成本
+import pandas as pd
+from scanner import global_params, rank_results
+from result_table import build_table, format_results
+from screener import DEFAULT_WEIGHTS, SCORE_TERMS, Screen
+from scan_scheduler import SCAN_INTERVAL_SEC, ScanScheduler
+from providers import get_provider
+from universe import MARKETS, load_universe
+from factor_history import load_history
+from price_store import PriceStore
+from valuation import PARAM_NAMES, grid_frame, monte_carlo, sensitivity_grid, valuation_inputs
+from metrics import REGISTRY
+
+LIVE_REFRESH_SEC = 3  # 掃描途中重繪 Top 100 的間隔
+HISTORY_MAX_TICKERS = 5  # 因子走勢圖一次比較的檔數
+HISTORY_CHARTS = {"Beta": 'beta', "年化波動度": 'volatility', "CGO": 'cgo', "VWAP-60": 'vwap_60', "意圖因子": 'intent_ratio'}
+GLOBAL_PARAMS = global_params()
 
 # --- 核心功能函數 ---
 
-def send_telegram_message(message):
-    if TELEGRAM_BOT_TOKEN == '您的_BOT_TOKEN': return
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": TELEGRAM_CHAT_ID, "text": message, "parse_mode": "Markdown"}
-    try: requests.post(url, json=payload)
-    except: pass
-
-@st.cache_data(ttl=3600) 
-def get_market_data():
-    try:
-        market = yf.download("^TWII", period="1y", interval="1d", progress=False)
-        if isinstance(market.columns, pd.MultiIndex):
-            market.columns = market.columns.get_level_values(0)
-        market['Return'] = market['Close'].pct_change()
-        return market['Return'].dropna()
-    except:
-        return pd.Series()
-
-@st.cache_data(ttl=3600) 
-def get_all_tw_tickers():
-    tickers = []
-    name_map = {}
-    try:
-        for code, info in twstock.codes.items():
-            if info.type == '股票':
-                suffix = ".TW" if info.market == '上市' else ".TWO"
-                full_ticker = code + suffix
-                tickers.append(full_ticker)
-                name_map[full_ticker] = info.name
-        return tickers, name_map
-    except Exception as e:
-        return [], {}
-
-def get_realtime_price_robust(stock_code):
-    price = None
-    try:
-        ticker = yf.Ticker(stock_code)
-        hist = ticker.history(period="5d")
-        if not hist.empty:
-            price = float(hist['Close'].iloc[-1])
-    except: pass
-
-    if price is None:
-        try:
-            code = stock_code.split('.')[0]
-            realtime = twstock.realtime.get(code)
-            if realtime['success']:
-                rt_price = realtime['realtime']['latest_trade_price']
-                if rt_price and rt_price != '-' and float(rt_price) > 0:
-                    price = float(rt_price)
-                else:
-                    best_bid = realtime['realtime']['best_bid_price'][0]
-                    if best_bid and best_bid != '-' and float(best_bid) > 0:
-                        price = float(best_bid)
-        except: pass
-    return price
-
-def get_financial_metrics_deep(ticker_obj):
-    """
-    【V9.9 大戶法人旗艦版】
-    新增提取: ROI(ROA), ROE, EPS, 淨利, 總資產, 總負債, 合約負債
-    新增提取: 年營收成長率, 季營收成長率
-    """
-    metrics = {
-        'roic': None,
-        'fcf_yield': None,
-        'peg': None,
-        'pb': None,
-        'div_rate': None,
-        'total_debt': 0,      
-        'total_equity': 0,
-        # 獲利指標
-        'roe': None,
-        'roa': None, 
-        'eps': None,
-        'net_income': None, 
-        'total_assets': None, 
-        'book_value': None,
-        # 新增：合約負債 (營收先行指標)
-        'contract_liabilities': 0,
-        # 新增：營收動能
-        'rev_growth_year': None, 
-        'rev_growth_qr': None    
-    }
+@st.cache_resource
+def get_scheduler():
+    # 整個 Streamlit 程序只有一個排程器，所有 session 共用同一份掃描快照
+    scheduler = ScanScheduler()
+    scheduler.start_schedule(SCAN_INTERVAL_SEC)
+    return scheduler
+
+@st.cache_resource
+def get_price_store():
+    # 因子走勢只讀本地日K資料庫，不連網
+    return PriceStore()
+
+@st.cache_data(ttl=3600)
+def get_industry_groups():
+    # 股票池索引存在本地，這裡只取產業別清單給選單用
+    return sorted(load_universe(get_provider())['group'].dropna().unique())
+
+def describe_scope(scope):
+    if not scope: return "全市場"
+    parts = []
+    if scope.get('markets'): parts.append("/".join(scope['markets']))
+    if scope.get('groups'): parts.append("、".join(scope['groups']))
+    if scope.get('watchlist'): parts.append(f"自選 {len(scope['watchlist'])} 檔")
+    if scope.get('limit'): parts.append(f"流動性前 {scope['limit']} 檔")
+    return "｜".join(parts)
+
+def show_results(table, title):
+    st.subheader(title)
     
-    try:
-        info = ticker_obj.info
-        metrics['pb'] = info.get('priceToBook')
-        metrics['peg'] = info.get('pegRatio')
-        metrics['div_rate'] = info.get('dividendRate')
-        
-        # 獲利指標
-        metrics['roe'] = info.get('returnOnEquity')
-        metrics['roa'] = info.get('returnOnAssets')
-        metrics['eps'] = info.get('trailingEps')
-        metrics['book_value'] = info.get('bookValue')
-        metrics['rev_growth_qr'] = info.get('revenueGrowth')
-
-        fin = ticker_obj.financials
-        bs = ticker_obj.balance_sheet
-        cf = ticker_obj.cashflow
-        mkt_cap = info.get('marketCap')
-
-        # WACC 數據 & 資產負債表數據
-        total_debt = 0
-        if 'Total Debt' in bs.index: total_debt = bs.loc['Total Debt'].iloc[0]
-        elif 'TotalDebt' in bs.index: total_debt = bs.loc['TotalDebt'].iloc[0]
-        metrics['total_debt'] = total_debt
-
-        stockholders_equity = 0
-        if 'Stockholders Equity' in bs.index: stockholders_equity = bs.loc['Stockholders Equity'].iloc[0]
-        elif 'StockholdersEquity' in bs.index: stockholders_equity = bs.loc['StockholdersEquity'].iloc[0]
-        metrics['total_equity'] = stockholders_equity
-
-        # 總資產
-        if 'Total Assets' in bs.index: metrics['total_assets'] = bs.loc['Total Assets'].iloc[0]
-        elif 'TotalAssets' in bs.index: metrics['total_assets'] = bs.loc['TotalAssets'].iloc[0]
-
-        # 合約負債 (Contract Liabilities) - 營收先行指標
-        # 註：有些公司財報會分 Current 與 Non Current，這裡嘗試抓取總和或流動部分
-        if 'Contract Liabilities' in bs.index: 
-            metrics['contract_liabilities'] = bs.loc['Contract Liabilities'].iloc[0]
-        elif 'Current Contract Liabilities' in bs.index:
-            metrics['contract_liabilities'] = bs.loc['Current Contract Liabilities'].iloc[0]
-
-        # 淨利
-        if 'Net Income' in fin.index: metrics['net_income'] = fin.loc['Net Income'].iloc[0]
-        elif 'NetIncome' in fin.index: metrics['net_income'] = fin.loc['NetIncome'].iloc[0]
-
-        # 計算年營收成長率
-        try:
-            rev_series = None
-            if 'Total Revenue' in fin.index: rev_series = fin.loc['Total Revenue']
-            elif 'TotalRevenue' in fin.index: rev_series = fin.loc['TotalRevenue']
-            
-            if rev_series is not None and len(rev_series) >= 2:
-                this_year = rev_series.iloc[0]
-                last_year = rev_series.iloc[1]
-                if last_year > 0:
-                    metrics['rev_growth_year'] = (this_year - last_year) / last_year
-        except: pass
-
-        # ROIC 計算
-        try:
-            ebit = None
-            if 'EBIT' in fin.index: ebit = fin.loc['EBIT'].iloc[0]
-            elif 'Operating Income' in fin.index: ebit = fin.loc['Operating Income'].iloc[0]
-            elif 'OperatingIncome' in fin.index: ebit = fin.loc['OperatingIncome'].iloc[0]
-            
-            cash = 0
-            if 'Cash And Cash Equivalents' in bs.index: cash = bs.loc['Cash And Cash Equivalents'].iloc[0]
-            
-            if ebit and stockholders_equity:
-                invested_capital = total_debt + stockholders_equity - cash
-                if invested_capital > 0:
-                    metrics['roic'] = (ebit * 0.8) / invested_capital
-        except: pass
-
-        # FCF 計算
-        try:
-            ocf = None
-            if 'Operating Cash Flow' in cf.index: ocf = cf.loc['Operating Cash Flow'].iloc[0]
-            elif 'Total Cash From Operating Activities' in cf.index: ocf = cf.loc['Total Cash From Operating Activities'].iloc[0]
-            
-            capex = 0
-            if 'Capital Expenditure' in cf.index: capex = cf.loc['Capital Expenditure'].iloc[0]
-            
-            fcf_val = None
-            if 'Free Cash Flow' in cf.index: 
-                fcf_val = cf.loc['Free Cash Flow'].iloc[0]
-            elif ocf is not None:
-                fcf_val = ocf + capex
-            
-            if fcf_val and mkt_cap:
-                metrics['fcf_yield'] = fcf_val / mkt_cap
-        except: pass
-            
-    except: pass
-    return metrics
-
-def calculate_theoretical_factors(ticker_symbol, name_map, market_returns):
-    try:
-        stock_name = name_map.get(ticker_symbol, ticker_symbol)
-        current_price = get_realtime_price_robust(ticker_symbol)
-        if current_price is None or current_price <= 0: return None
-
-        data = yf.download(ticker_symbol, period="1y", interval="1d", progress=False)
-        if len(data) < 60: return None 
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = data.columns.get_level_values(0)
-        
-        # --- 深層挖掘 ---
-        ticker = yf.Ticker(ticker_symbol)
-        deep_metrics = get_financial_metrics_deep(ticker)
-        
-        roic = deep_metrics['roic']
-        fcf_yield = deep_metrics['fcf_yield']
-        pb = deep_metrics['pb']
-        peg_ratio = deep_metrics['peg']
-        div_rate = deep_metrics['div_rate']
-
-        # 獲利與財報指標
-        roe = deep_metrics['roe']
-        roa = deep_metrics['roa'] # ROI
-        eps = deep_metrics['eps']
-        book_value = deep_metrics['book_value']
-        net_income = deep_metrics['net_income']
-        total_debt = deep_metrics['total_debt']
-        total_assets = deep_metrics['total_assets']
-        contract_liabilities = deep_metrics['contract_liabilities'] # 合約負債
-        
-        # 營收指標
-        rev_growth_year = deep_metrics['rev_growth_year']
-        rev_growth_qr = deep_metrics['rev_growth_qr']
-
-        # 技術指標準備 (為了安全濾網)
-        close_series = data['Close']
-        ma60 = close_series.rolling(60).mean().iloc[-1]
-
-        # ==========================================
-        # 🛡️ 【安全防禦過濾系統】 
-        # ==========================================
-        
-        # 1. 現金流濾網：FCF Yield < 10% (0.10) 淘汰
-        if fcf_yield is None or fcf_yield < 0.10:
-            return None
-            
-        # 2. 趨勢濾網 (避開價值陷阱)：股價必須在季線之上
-        if current_price < ma60:
-            return None
-
-        # 3. 品質濾網 (避開爛公司)：ROIC 必須大於 8%
-        if roic is None or roic < 0.08:
-            return None
-        # ==========================================
-
-        # --- 1. CAPM 與 Beta ---
-        stock_returns = close_series.pct_change().dropna()
-        aligned = pd.concat([stock_returns, market_returns], axis=1, join='inner').dropna()
-        aligned.columns = ['Stock', 'Market']
-        
-        beta = 1.0
-        if len(aligned) > 30:
-            cov = aligned.cov().iloc[0, 1]
-            mkt_var = aligned['Market'].var()
-            beta = cov / mkt_var if mkt_var != 0 else 1.0
-        
-        ke = RF + beta * MRP 
-
-        # --- 2. WACC 計算 ---
-        wacc = None
-        total_equity = deep_metrics['total_equity']
-        if total_equity > 0:
-            total_capital = total_equity + total_debt
-            weight_equity = total_equity / total_capital
-            weight_debt = total_debt / total_capital
-            wacc = (ke * weight_equity) + (COST_OF_DEBT_NET * weight_debt)
-
-        # --- 3. CGO 與 VWAP ---
-        df_60 = data.tail(60)
-        vwap_60 = (df_60['Close'] * df_60['Volume']).sum() / df_60['Volume'].sum()
-        cgo_status = ""
-        cgo_score = 0
-        if vwap_60 > 0:
-            cgo_val = (current_price - vwap_60) / vwap_60
-            if cgo_val > 0.05:
-                cgo_status = "籌碼獲利🔥"
-                cgo_score = 10
-            elif cgo_val > 0:
-                cgo_status = "成本之上✅"
-                cgo_score = 5
-            else:
-                cgo_status = "套牢壓力🥶"
-
-        # --- 4. Smart Beta 低波動 ---
-        volatility = stock_returns.std() * (252**0.5)
-        is_low_vol = False
-        if volatility < 0.25 or (beta < 0.8 and volatility < 0.35):
-            is_low_vol = True
-
-        # --- 原有指標計算 ---
-        days = 60
-        volume_series = data['Volume']
-        price_60_ago = close_series.iloc[-days]
-        s_return = (current_price / price_60_ago) - 1
-        v_variability = close_series.pct_change().abs().tail(days).sum()
-        avg_volume = volume_series.tail(days).mean()
-        
-        intent_factor = 0
-        score_intent = 0
-        is_intent_candidate = False 
-        
-        if v_variability > 0 and avg_volume > 500: 
-            raw_intent = s_return / v_variability
-            if 0 < s_return < 0.3: 
-                intent_factor = raw_intent
-                is_intent_candidate = True
-                score_intent = 15
-            elif s_return < -0.05:
-                score_intent = 5 
-
-        # --- 評分系統 ---
-        score = 0
-        factors = []
-        
-        ma20 = close_series.rolling(20).mean().iloc[-1]
-        
-        if current_price > ma20: score += 20 
-        if current_price > ma60: score += 10 
-        if is_intent_candidate: 
-            score += score_intent
-            factors.append("💎主力軌跡")
-        
-        # CGO 加分
-        score += cgo_score
-
-        # 低波動加分
-        if is_low_vol: 
-            score += 10
-            factors.append("🛡️低波動")
-
-        # ROIC / WACC 判斷
-        inst_view = "" 
-        if roic is not None:
-            if wacc and roic > wacc: 
-                score += 25
-                factors.append(f"價值創造(ROIC>WACC)")
-                inst_view = f"✅價值創造 (ROIC {roic:.1%} > WACC {wacc:.1%})"
-            elif roic > 0.15:
-                score += 25
-                factors.append(f"高資本效率(ROIC {roic:.1%})")
-                inst_view = "✅高資本效率"
-            else:
-                inst_view = "資本效率尚可"
-        
-        # FCF 加分
-        if fcf_yield > 0.15:
-            score += 30
-            factors.append(f"超高現金流({fcf_yield:.1%})")
-        else:
-            score += 20
-            factors.append(f"高現金流({fcf_yield:.1%})")
-
-        volatility_old = stock_returns.std() * (252**0.5)
-        if volatility_old < 0.35: score += 10
-        
-        # 合理價
-        fair_value = np.nan
-        if div_rate:
-            k_minus_g = max(ke - G_GROWTH, 0.015)
-            fair_value = div_rate / k_minus_g
-
-        # --- 生成文字 ---
-        if score >= 15: 
-            roic_str = f"{roic:.1%}" if roic is not None else "N/A"
-            fcf_str = f"{fcf_yield:.1%}" 
-            peg_str = f"{peg_ratio}" if peg_ratio else "N/A"
-            wacc_str = f"{wacc:.1%}" if wacc else "N/A"
-            
-            # 數據格式化
-            roe_str = f"{roe:.1%}" if roe else "N/A"
-            roa_str = f"{roa:.1%}" if roa else "N/A"
-            eps_str = f"{eps:.2f}" if eps else "N/A"
-            
-            rev_growth_y_str = f"{rev_growth_year:.1%}" if rev_growth_year else "N/A"
-            rev_growth_q_str = f"{rev_growth_qr:.1%}" if rev_growth_qr else "N/A"
-            
-            # 簡化財報數據為易讀格式 (單位: 億/千萬)
-            def format_large_num(num):
-                if not num: return "N/A"
-                return f"{num/1e8:.1f}億"
-            
-            debt_str = format_large_num(total_debt)
-            net_income_str = format_large_num(net_income)
-            cl_str = format_large_num(contract_liabilities) # 合約負債
-            bv_str = f"{book_value:.2f}" if book_value else "N/A"
-
-            path_diagnosis = f"趨勢向上 (+{s_return:.1%})" if s_return > 0 else f"趨勢修正 ({s_return:.1%})"
-            
-            final_advice = (
-                f"📊 **AI 深度解析**：\n"
-                f"1. **品質**：{inst_view} | ROE {roe_str} | EPS {eps_str}\n"
-                f"2. **估值**：FCF Yield {fcf_str} (已過濾 FCF < 10%)\n"
-                f"3. **技術**：{path_diagnosis} | Beta {beta:.2f} | 站穩季線\n"
-                f"4. **風險**：CGO {cgo_status} | 合約負債 {cl_str}"
-            )
-
-            return {
-                "代號": ticker_symbol.replace(".TW", "").replace(".TWO", ""),
-                "名稱": stock_name,
-                "現價": float(current_price),
-                "合理價": round(fair_value, 2) if not np.isnan(fair_value) else 0,
-                "AI綜合評分": round(score, 1),
-                "AI綜合建議": final_advice,
-                "意圖因子": round(intent_factor, 2), 
-                "ROIC": roic_str,     
-                "FCF Yield": fcf_str, 
-                "WACC": wacc_str,     
-                "CGO": cgo_status,
-                # 顯示欄位
-                "EPS": eps_str,
-                "ROE": roe_str,
-                "ROI(ROA)": roa_str,
-                "合約負債": cl_str, # 新增
-                "年營收成長": rev_growth_y_str,
-                "季營收成長": rev_growth_q_str,
-                "每股淨值": bv_str,
-                "總負債": debt_str,
-                "本期淨利": net_income_str,
-                "亮點": " | ".join(factors)
-            }
-    except Exception as e:
-        return None
-    return None
+    # 文字欄位與 AI綜合建議只替顯示的列產生
+    st.dataframe(
+        format_results(table),
+        use_container_width=True,
+        hide_index=True,
+        column_order=[
+            "代號", "名稱", "現價", "合理價", 
+            "AI綜合評分", "AI綜合建議", 
+            "ROIC", "FCF Yield", 
+            "EPS", "ROE", "ROI(ROA)", 
+            "合約負債", # 新增
+            "年營收成長", "季營收成長", 
+            "WACC", "CGO",       
+            "每股淨值", "總負債", "本期淨利", 
+            "亮點"
+        ],
+        column_config={
+            "代號": st.column_config.TextColumn(width="small"),
+            "現價": st.column_config.NumberColumn(format="$%.2f"),
+            "合理價": st.column_config.NumberColumn(format="$%.2f"),
+            "AI綜合評分": st.column_config.ProgressColumn(format="%.1f", min_value=0, max_value=100),
+            "AI綜合建議": st.column_config.TextColumn(width="large"),
+
+            # 詳細說明欄位 (Tooltips)
+            "ROIC": st.column_config.TextColumn(help="投入資本回報率 (>8% 品質保證)：衡量公司運用資本賺錢的效率"),
+            "FCF Yield": st.column_config.TextColumn(help="自由現金流收益率 (>10%)：股東真實拿到的現金回報率，越高越便宜"),
+            "EPS": st.column_config.TextColumn(help="每股盈餘 (Earnings Per Share)：公司獲利的絕對值指標"),
+            # 您要求的說明欄位更新
+            "ROE": st.column_config.TextColumn(help="股東權益報酬率 (Return on Equity)：巴菲特最愛指標，衡量公司利用自有資金創造獲利的能力"),
+            "ROI(ROA)": st.column_config.TextColumn(help="資產報酬率 (Return on Assets)：衡量公司利用所有資產(含負債槓桿)創造獲利的能力"),
+            "合約負債": st.column_config.TextColumn(help="合約負債 (Contract Liabilities)：客戶預付的訂金，通常被視為未來營收爆發的領先指標"),
+            # 其他欄位
+            "年營收成長": st.column_config.TextColumn(help="年營收成長率 (Year-over-Year)：今年總營收 vs 去年總營收"),
+            "季營收成長": st.column_config.TextColumn(help="季營收成長率 (Quarterly Revenue Growth)：最近一季 vs 去年同期"),
+            "WACC": st.column_config.TextColumn(help="加權平均資本成本：公司取得資金的成本"),
+            "CGO": st.column_config.TextColumn(help="籌碼獲利狀態"),
+            "每股淨值": st.column_config.TextColumn(help="Book Value"),
+            "總負債": st.column_config.TextColumn(help="Total Debt (億)"),
+            "本期淨利": st.column_config.TextColumn(help="Net Income (億)"),
+            "亮點": st.column_config.TextColumn(width="medium"),
+        }
+    )
+
+
+def screen_rows(screen_table, shown):
+    # 結果表的代號已去掉後綴 (同 score_ticker 的寫法)，對回篩選表的完整代號
+    codes = pd.Series(screen_table.index, index=[t.replace(".TW", "").replace(".TWO", "") for t in screen_table.index])
+    return screen_table.loc[codes.reindex(shown['代號']).dropna()]
+
+def show_valuation(screen_table, shown):
+    rows = screen_rows(screen_table, shown)
+    if rows.empty:
+        st.write("目前列表沒有可估值的標的。")
+        return
+    inputs = valuation_inputs(rows)
+    vcol1, vcol2 = st.columns(2)
+    n_draws = vcol1.number_input("蒙地卡羅抽樣次數", min_value=1000, max_value=50000, value=10000, step=1000)
+    with_beta = vcol2.checkbox("納入 Beta 估計誤差", value=True)
+    started = time.time()
+    mc = monte_carlo(inputs, n_draws=int(n_draws), beta_uncertainty=with_beta)
+    mc.insert(0, "名稱", rows['name'].to_numpy())
+    mc.insert(1, "現價", inputs['price'])
+    pct = [c for c in mc.columns if c.startswith(('wacc', 'p_'))]
+    mc[pct] = mc[pct] * 100
+    st.caption(f"{len(rows)} 檔 × {int(n_draws)} 次抽樣，耗時 {(time.time() - started) * 1000:.0f} ms")
+    st.dataframe(mc, use_container_width=True, column_config={
+        **{c: st.column_config.NumberColumn(format="$%.2f") for c in mc.columns if c.startswith('fair_value')},
+        **{c: st.column_config.NumberColumn(format="%.2f%%") for c in mc.columns if c.startswith('wacc')},
+        "p_undervalued": st.column_config.ProgressColumn("低估機率", format="%.0f%%", min_value=0, max_value=100),
+        "p_value_creation": st.column_config.ProgressColumn("ROIC>WACC 機率", format="%.0f%%", min_value=0, max_value=100),
+    })
+
+    # 單檔敏感度網格 (任選兩個參數)
+    gcol1, gcol2, gcol3 = st.columns(3)
+    pick = gcol1.selectbox("敏感度分析標的", range(len(rows)), format_func=lambda i: f"{rows.index[i]} {rows['name'].iloc[i]}")
+    row_param = gcol2.selectbox("列參數", PARAM_NAMES, index=0)
+    col_param = gcol3.selectbox("欄參數", [p for p in PARAM_NAMES if p != row_param], index=1)
+    axes = {name: np.round(np.linspace(-0.01, 0.01, 5) + base, 4) for name, base in
+            ((row_param, GLOBAL_PARAMS[row_param]), (col_param, GLOBAL_PARAMS[col_param]))}
+    grid = sensitivity_grid(inputs, **axes)
+    g1, g2 = st.columns(2)
+    g1.caption("合理價")
+    g1.dataframe(grid_frame(grid, pick).round(2))
+    g2.caption("WACC (%)")
+    g2.dataframe((grid_frame(grid, pick, value='wacc') * 100).round(2))
+
+def show_factor_history(screen_table, shown):
+    rows = screen_rows(screen_table, shown)
+    if rows.empty:
+        st.write("目前列表沒有可顯示的標的。")
+        return
+    picked = st.multiselect(f"比較標的 (最多 {HISTORY_MAX_TICKERS} 檔)", list(rows.index), default=list(rows.index[:3]),
+                            max_selections=HISTORY_MAX_TICKERS, format_func=lambda t: f"{t} {rows.loc[t, 'name']}")
+    if not picked:
+        return
+    # 同一檔第一次整段計算，之後只接續新K棒
+    histories = {t: load_history(t, get_price_store()) for t in picked}
+    for tab, col in zip(st.tabs(list(HISTORY_CHARTS)), HISTORY_CHARTS.values()):
+        tab.line_chart(pd.DataFrame({t: h[col] for t, h in histories.items()}).dropna(how='all'))
+
 
 # --- Streamlit 介面 ---
 
@@ -467,90 +185,136 @@ with st.expander("📚 點此查看：機構法人選股邏輯 (ROIC & WACC)"):
         """)
 
 # --- 主程式區 ---
-if 'results' not in st.session_state:
-    st.session_state['results'] = []
+scheduler = get_scheduler()
+snapshot = scheduler.latest()
+results = snapshot['results'] if snapshot else None  # build_table 的數值結果表
 
 col1, col2 = st.columns([1, 4])
 
 with col1:
     st.info("💡 系統執行：啟動安全防禦篩選 (含合約負債掃描)...")
+    force_refresh = st.checkbox("🔄 強制重新抓取 (忽略本地快取)", value=False)
+
+    # 子股票池：只掃上市 / 特定產業 / 自選清單，依流動性由高到低
+    with st.expander("🗂️ 掃描範圍 (預設全市場)"):
+        markets = st.multiselect("市場", MARKETS)
+        groups = st.multiselect("產業別", get_industry_groups())
+        watchlist = st.text_input("自選清單 (代號，以逗號或空白分隔)", placeholder="2330, 2317")
+        limit = st.number_input("只掃流動性前 N 檔 (0 = 不限)", min_value=0, value=0, step=100)
+    scope = {k: v for k, v in {
+        'markets': markets, 'groups': groups, 'watchlist': watchlist.replace(',', ' ').split(), 'limit': int(limit),
+    }.items() if v} or None
+
     if st.button("🚀 啟動 AI 智能運算", type="primary"):
-        with st.spinner("Step 1: 載入大盤數據..."):
-            market_returns = get_market_data()
-        
-        with st.spinner("Step 2: 全市場掃描 (條件嚴格，請稍候)..."):
-            tickers, name_map = get_all_tw_tickers()
-            
-        st.success(f"鎖定 {len(tickers)} 檔標的，開始深度挖掘...")
-        st.session_state['results'] = []
-        
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_ticker = {executor.submit(calculate_theoretical_factors, t, name_map, market_returns): t for t in tickers}
-            
-            completed = 0
-            for future in concurrent.futures.as_completed(future_to_ticker):
-                data = future.result()
-                completed += 1
-                if completed % 10 == 0:
-                    progress_bar.progress(completed / len(tickers))
-                    status_text.text(f"AI 解析中: {completed}/{len(tickers)}")
-                if data:
-                    st.session_state['results'].append(data)
-
-        status_text.text("✅ AI 分析完成！")
+        if not scheduler.request_scan(force_refresh=force_refresh, scope=scope):
+            st.toast("已有掃描進行中，直接顯示該次進度")
+
+    if snapshot:
+        taken_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['taken_at']))
+        st.caption(f"📸 快照 v{snapshot['version']}｜擷取於 {taken_at}｜耗時 {snapshot['elapsed_sec']:.0f} 秒")
+        st.caption(f"🗂️ 範圍：{describe_scope(snapshot.get('scope'))}")
+    if scheduler.last_error is not None:
+        st.error(f"上一次掃描失敗：{scheduler.last_error}")
+
+    # 即時篩選：只重算記憶體中的因子表，不重新抓取
+    with st.expander("🎛️ 即時篩選與評分權重 (不重新抓取)"):
+        fcf_min = st.number_input("FCF Yield 下限 (%)", value=10.0, step=1.0)
+        roic_min = st.number_input("ROIC 下限 (%)", value=8.0, step=1.0)
+        above_ma60 = st.checkbox("股價須站上季線", value=True, help="季線以下的標的未抓財報，放寬後仍會被財報條件排除")
+        st.caption("評分權重")
+        weights = {name: st.number_input(label, value=float(points), step=5.0, key=f"w_{name}")
+                   for name, (label, points) in SCORE_TERMS.items()}
+    filters = ["n_bars >= 60", f"fcf_yield >= {fcf_min}%", f"roic >= {roic_min}%"]
+    if above_ma60: filters.append("current_price >= ma60")
+    screen = Screen(filters=filters, weights=weights)
+    custom_screen = (fcf_min, roic_min, above_ma60) != (10.0, 8.0, True) or weights != DEFAULT_WEIGHTS
+
+    # 各 stage 進出檔數
+    for report in snapshot['stage_reports'] if snapshot else []:
+        st.caption(f"{report['stage']}：{report['in']} → {report['out']} 檔")
+        if report.get('resumed'):
+            st.caption(f"　續跑：沿用中斷前已完成的 {report['resumed']} 檔")
+        if report.get('reused'):
+            st.caption(f"　增量：輸入指紋未變、沿用上次評分 {report['reused']} 檔")
+        failed = {k: v for k, v in report.get('outcomes', {}).items() if k != 'ok'}
+        if failed:
+            st.caption("　失敗原因：" + "、".join(f"{k} {v}" for k, v in failed.items()))
 
 with col2:
-    if not st.session_state['results']:
-        st.write("👈 請點擊左側按鈕開始分析。(注意：已開啟安全過濾，只會顯示趨勢向上的價值股)")
+    table_slot = st.empty()
+    shown = None
+    with table_slot.container():
+        if results is None or results.empty:
+            st.write("👈 請點擊左側按鈕開始分析。(注意：已開啟安全過濾，只會顯示趨勢向上的價值股)")
+        elif custom_screen and snapshot.get('screen_table') is not None:
+            matched = screen.run(snapshot['screen_table'], top_n=len(snapshot['screen_table']))
+            shown = matched.head(100)
+            show_results(shown, f"🎛️ 自訂篩選 (Top 100，共 {len(matched)} 檔符合)")
+        else:
+            # 排序
+            shown = rank_results(results, top_n=100)
+            show_results(shown, "🏆 AI 嚴選現貨清單 (Top 100)")
+
+    # 估值：目前列表的合理價 / WACC 分布與參數敏感度 (只用記憶體中的因子表)
+    if shown is not None and snapshot.get('screen_table') is not None:
+        with st.expander("💹 估值敏感度與蒙地卡羅 (合理價 / WACC)"):
+            if st.checkbox("計算目前列表的估值分布", value=False):
+                show_valuation(snapshot['screen_table'], shown)
+        with st.expander("📈 因子歷史走勢 (Beta / 波動度 / CGO / 意圖因子)"):
+            if st.checkbox("顯示每日因子走勢", value=False):
+                show_factor_history(snapshot['screen_table'], shown)
+
+
+# --- 效能診斷 ---
+with st.expander("🩺 效能診斷 (各 stage 耗時 / 快取命中 / 失敗原因)"):
+    metrics_snapshot = REGISTRY.snapshot()
+    if not metrics_snapshot:
+        st.write("尚無量測資料，執行一次掃描後再查看。")
     else:
-        df = pd.DataFrame(st.session_state['results'])
-        
-        # 排序
-        df = df.sort_values(by=['AI綜合評分', '意圖因子'], ascending=[False, False]).head(100)
-        
-        st.subheader(f"🏆 AI 嚴選現貨清單 (Top 100)")
-        
-        st.dataframe(
-            df,
-            use_container_width=True,
-            hide_index=True,
-            column_order=[
-                "代號", "名稱", "現價", "合理價", 
-                "AI綜合評分", "AI綜合建議", 
-                "ROIC", "FCF Yield", 
-                "EPS", "ROE", "ROI(ROA)", 
-                "合約負債", # 新增
-                "年營收成長", "季營收成長", 
-                "WACC", "CGO",       
-                "每股淨值", "總負債", "本期淨利", 
-                "亮點"
-            ],
-            column_config={
-                "代號": st.column_config.TextColumn(width="small"),
-                "現價": st.column_config.NumberColumn(format="$%.2f"),
-                "合理價": st.column_config.NumberColumn(format="$%.2f"),
-                "AI綜合評分": st.column_config.ProgressColumn(format="%.1f", min_value=0, max_value=100),
-                "AI綜合建議": st.column_config.TextColumn(width="large"),
-                
-                # 詳細說明欄位 (Tooltips)
-                "ROIC": st.column_config.TextColumn(help="投入資本回報率 (>8% 品質保證)：衡量公司運用資本賺錢的效率"),
-                "FCF Yield": st.column_config.TextColumn(help="自由現金流收益率 (>10%)：股東真實拿到的現金回報率，越高越便宜"),
-                "EPS": st.column_config.TextColumn(help="每股盈餘 (Earnings Per Share)：公司獲利的絕對值指標"),
-                # 您要求的說明欄位更新
-                "ROE": st.column_config.TextColumn(help="股東權益報酬率 (Return on Equity)：巴菲特最愛指標，衡量公司利用自有資金創造獲利的能力"),
-                "ROI(ROA)": st.column_config.TextColumn(help="資產報酬率 (Return on Assets)：衡量公司利用所有資產(含負債槓桿)創造獲利的能力"),
-                "合約負債": st.column_config.TextColumn(help="合約負債 (Contract Liabilities)：客戶預付的訂金，通常被視為未來營收爆發的領先指標"),
-                # 其他欄位
-                "年營收成長": st.column_config.TextColumn(help="年營收成長率 (Year-over-Year)：今年總營收 vs 去年總營收"),
-                "季營收成長": st.column_config.TextColumn(help="季營收成長率 (Quarterly Revenue Growth)：最近一季 vs 去年同期"),
-                "WACC": st.column_config.TextColumn(help="加權平均資本成本：公司取得資金的成本"),
-                "CGO": st.column_config.TextColumn(help="籌碼獲利狀態"),
-                "每股淨值": st.column_config.TextColumn(help="Book Value"),
-                "總負債": st.column_config.TextColumn(help="Total Debt (億)"),
-                "本期淨利": st.column_config.TextColumn(help="Net Income (億)"),
-                "亮點": st.column_config.TextColumn(width="medium"),
+        diag = pd.DataFrame([
+            {
+                "stage": stage,
+                "呼叫次數": m['calls'],
+                "總耗時(s)": m['total_sec'],
+                "平均(ms)": m['mean_ms'],
+                "p50(ms)": m['p50_ms'],
+                "p95(ms)": m['p95_ms'],
+                "p99(ms)": m['p99_ms'],
+                "快取命中率": m['cache_hit_rate'] * 100 if m['cache_hit_rate'] is not None else None,
+                "失敗原因": ", ".join(f"{k} {v}" for k, v in m['failures'].items()),
             }
-        )
+            for stage, m in metrics_snapshot.items()
+        ]).sort_values("總耗時(s)", ascending=False)
+        st.dataframe(diag, use_container_width=True, hide_index=True,
+                     column_config={"快取命中率": st.column_config.NumberColumn(format="%.1f%%")})
+        dcol1, dcol2, dcol3 = st.columns(3)
+        dcol1.download_button("下載 JSON", REGISTRY.to_json(indent=2), file_name="factor_ai_metrics.json", mime="application/json")
+        dcol2.download_button("下載 Prometheus", REGISTRY.to_prometheus(), file_name="factor_ai_metrics.prom", mime="text/plain")
+        if dcol3.button("重設量測"):
+            REGISTRY.reset()
+            st.rerun()
+
+
+# --- 訂閱進行中的掃描 ---
+# 放在最後：進度輪詢期間，上方仍顯示上一版快照
+progress = scheduler.progress()
+if progress:
+    with col1:
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        last_render = 0
+        while progress:
+            # 掃描中的即時 Top 100，限制重繪頻率
+            if progress['found'] and time.time() - last_render >= LIVE_REFRESH_SEC:
+                live = scheduler.live_results()
+                if live:
+                    with table_slot.container():
+                        show_results(build_table(live), f"⏳ 掃描中 - 即時 Top {len(live)} (已入選 {progress['found']} 檔)")
+                last_render = time.time()
+            if progress['total']:
+                progress_bar.progress(min(progress['done'] / progress['total'], 1.0))
+            elapsed = time.time() - progress['started_at']
+            status_text.text(f"{progress['stage'] or '載入股票池與大盤數據'}: {progress['done']}/{progress['total']}（已執行 {elapsed:.0f} 秒）")
+            time.sleep(1)
+            progress = scheduler.progress()
+    st.rerun()
@@ -0,0 +1,299 @@
+"""
+向量化回測：以 V9.9 評分規則 (screener.Screen) 逐日回放選股，持有 Top-N 等權組合
+
+    prices = provider.get_price_history(tickers, period="5y")     # dates × tickers 面板
+    snapshots = load_snapshots(snapshot_dir(provider.name))      # 每次掃描存下的財報快照
+    result = run_backtest(prices, market_returns, snapshots, screen=Screen(), top_n=20)
+    result['summary'], result['daily']
+
+- 技術因子以累積和計算移動視窗 (factor_history.rolling_factors)，每個日期只用到當天以前的日K
+- 財報採 point-in-time：快照在 as_of (+ lag_days) 之後才可用，每檔沿用最近一份
+- 收盤依當日因子換股，賺取隔日報酬；換股日之間部位隨價格漂移 (不做再平衡)
+- 依日期分段計算 (BLOCK_DAYS)，記憶體不隨回測年數成長
+
+註：即時掃描的財報快取只保留最新一份，快照歷史要從開始存檔 (scan_market 每次掃描寫一份) 後才累積；
+用單一份快照回測較早的日期會有前視偏誤
+"""
+import glob
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from factor_engine import MIN_BARS, TRADING_DAYS
+from factor_history import LOOKBACK_BARS, rolling_factors
+from screener import FUNDAMENTAL_COLUMNS, Screen
+
+# --- 回測設定 ---
+BLOCK_DAYS = 250      # 每段計算的日期數
+SNAPSHOT_SUBDIR = 'fundamentals_history'  # 位於各資料來源的快取目錄之下
+
+
+# --- 財報快照 ---
+
+def snapshot_dir(provider_name):
+    from fundamentals_cache import provider_cache_dir
+    return os.path.join(provider_cache_dir(provider_name), SNAPSHOT_SUBDIR)
+
+
+def save_snapshot(directory, fundamentals, as_of=None):
+    """掃描抓到的財報指標 {代號: metrics} 存成 <YYYYMMDD>.parquet (同一天覆寫)"""
+    if not fundamentals:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    day = pd.Timestamp(as_of or time.strftime('%Y-%m-%d')).strftime('%Y%m%d')
+    table = pd.DataFrame.from_dict(fundamentals, orient='index', dtype=np.float64).reindex(columns=FUNDAMENTAL_COLUMNS)
+    path = os.path.join(directory, f"{day}.parquet")
+    tmp = path + '.tmp'
+    table.to_parquet(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def load_snapshots(directory):
+    """所有快照 -> 長表 (ticker / as_of / FUNDAMENTAL_COLUMNS)"""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.parquet'))):
+        table = pd.read_parquet(path)
+        table.insert(0, 'as_of', pd.Timestamp(os.path.basename(path).split('.')[0]))
+        frames.append(table.rename_axis('ticker').reset_index())
+    if not frames:
+        return pd.DataFrame(columns=['ticker', 'as_of'] + FUNDAMENTAL_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+class PointInTime:
+    """
+    財報快照 -> 任一日期可用的最新值
+    每個指標先整理成 (快照日 × 代號) 並往下補值，查詢時以 searchsorted 取當天以前最近一列
+    """
+
+    def __init__(self, snapshots, tickers, lag_days=0):
+        snap = snapshots.copy()
+        snap['as_of'] = pd.to_datetime(snap['as_of']) + pd.Timedelta(days=lag_days)
+        snap = snap.drop_duplicates(['as_of', 'ticker'], keep='last')
+        self.columns = [c for c in FUNDAMENTAL_COLUMNS if c in snap.columns] if len(snap) else []
+        self._as_of = np.sort(snap['as_of'].unique())
+        self._wide = {}
+        for col in self.columns:
+            wide = snap.pivot(index='as_of', columns='ticker', values=col).reindex(index=self._as_of, columns=tickers)
+            self._wide[col] = wide.astype(np.float64).ffill().to_numpy()
+
+    def at(self, dates):
+        """回傳 {指標: len(dates) × tickers}；第一份快照之前為 NaN"""
+        row = np.searchsorted(self._as_of, np.asarray(dates, dtype=self._as_of.dtype), side='right') - 1
+        out = {}
+        for col, wide in self._wide.items():
+            values = wide[np.maximum(row, 0)]
+            values[row < 0] = np.nan
+            out[col] = values
+        return out
+
+
+# --- 選股 ---
+
+def rank_order(passed, cols, sort):
+    """每列 (日期) 依 Screen.sort 排序的代號索引，未通過者排最後 (與 Screen.run 相同的穩定排序)"""
+    keys = []
+    for key in reversed(sort):
+        values = cols[key.lstrip('-')]
+        values = -values if key.startswith('-') else values
+        keys.append(np.where(np.isnan(values), np.inf, values))
+    keys.append(~passed)
+    return np.lexsort(keys, axis=-1)
+
+
+def select_top(passed, cols, sort, top_n):
+    """回傳 (入選 bool 矩陣, 等權權重矩陣)"""
+    order = rank_order(passed, cols, sort)[:, :top_n]
+    picked = np.take_along_axis(passed, order, axis=1)
+    selected = np.zeros(passed.shape, dtype=bool)
+    np.put_along_axis(selected, order, picked, axis=1)
+    count = selected.sum(axis=1, keepdims=True)
+    weights = np.divide(selected, count, out=np.zeros(selected.shape), where=count > 0)
+    return selected, weights
+
+
+# --- 回測 ---
+
+def run_backtest(prices, market_returns, snapshots, screen=None, top_n=20, rebalance_days=1, cost_bps=0.0,
+                 lag_days=0, start=None, end=None, block_days=BLOCK_DAYS):
+    """
+    prices: {'Close', 'Volume': DataFrame(dates × tickers)}；market_returns: Series(日期 -> 大盤日報酬)
+    snapshots: 財報快照長表 (見 load_snapshots)；screen: 篩選 / 評分 / 排序規則 (預設 V9.9)
+    rebalance_days: 每 N 個交易日換股；cost_bps: 單邊交易成本 (bp，依成交金額計)
+    lag_days: 快照日後 N 天才可用 (財報公告延遲)；start / end: 回測期間 (預設日K滿 60 根後開始)
+    回傳 {'daily': DataFrame, 'rebalances': DataFrame, 'summary': dict}
+    """
+    screen = screen or Screen()
+    close_df = prices['Close']
+    dates, tickers = close_df.index, close_df.columns
+    close = close_df.to_numpy(dtype=np.float64)
+    volume = prices['Volume'].reindex(index=dates, columns=tickers).to_numpy(dtype=np.float64)
+    market = market_returns.reindex(dates).to_numpy(dtype=np.float64) if len(market_returns) else np.full(len(dates), np.nan)
+    fundamentals = PointInTime(snapshots, tickers, lag_days=lag_days)
+
+    first = dates.searchsorted(pd.Timestamp(start)) if start is not None else MIN_BARS - 1
+    last = dates.searchsorted(pd.Timestamp(end), side='right') - 1 if end is not None else len(dates) - 1
+    if last - first < 1:
+        raise ValueError("回測期間不足兩個交易日")
+
+    # 隔日報酬 (第 t 列 = t -> t+1)；缺值 (停牌 / 下市) 視為 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        forward = np.full(close.shape, np.nan)
+        forward[:-1] = close[1:] / close[:-1] - 1
+
+    n = len(tickers)
+    holding = np.zeros(n)   # 上一段最後一天收盤後的部位 (已隨價格漂移)
+    port_ret, bench_ret, turnover, costs, n_held = [], [], [], [], []
+    reb_rows, hits, beats, picks = [], [], [], []
+    for a in range(first, last, block_days):
+        b = min(a + block_days, last)  # 第 b 列只作為最後一天的隔日收盤
+        a0 = max(0, a - LOOKBACK_BARS)
+        before = (~np.isnan(close[:a0])).sum(axis=0)
+        cols = rolling_factors(close[a0:b], volume[a0:b], market[a0:b], n_bars_before=before)
+        cols = {k: v[a - a0:] for k, v in cols.items()}
+        cols.update(fundamentals.at(dates[a:b]))
+        for col in FUNDAMENTAL_COLUMNS:
+            cols.setdefault(col, np.full((b - a, n), np.nan))
+        passed, cols, _ = screen.evaluate(cols)
+        selected, target = select_top(passed, cols, screen.sort, top_n)
+
+        f = np.nan_to_num(forward[a:b])
+        rebalance = (np.arange(a, b) - first) % rebalance_days == 0
+
+        # 段起點：換股日用新權重，其餘沿用 (漂移後) 的部位
+        start_row = np.maximum.accumulate(np.where(rebalance | (np.arange(b - a) == 0), np.arange(b - a), 0))
+        base = np.where(rebalance[:, None], target, 0.0)
+        if not rebalance[0]:
+            base[0] = holding
+        growth = np.cumsum(np.log1p(f), axis=0)
+        growth_before = np.vstack([np.zeros((1, n)), growth[:-1]])  # 到當天收盤 (不含當天隔日報酬) 的累積
+        raw = base[start_row] * np.exp(growth_before - growth_before[start_row])
+        total = raw.sum(axis=1, keepdims=True)
+        weights = np.divide(raw, total, out=np.zeros(raw.shape), where=total > 0)
+
+        # 換股前部位 = 前一天部位經過一天報酬後的權重
+        drifted = np.vstack([holding[None], weights[:-1] * (1 + f[:-1])])
+        drifted_total = drifted.sum(axis=1, keepdims=True)
+        drifted = np.divide(drifted, drifted_total, out=np.zeros(drifted.shape), where=drifted_total > 0)
+        traded = np.where(rebalance, np.abs(weights - drifted).sum(axis=1), 0.0)
+
+        daily = (weights * f).sum(axis=1) - traded * cost_bps / 1e4
+        port_ret.append(daily)
+        turnover.append(traded / 2)
+        costs.append(traded * cost_bps / 1e4)
+        n_held.append((weights > 0).sum(axis=1))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            bench_ret.append(np.nan_to_num(np.nanmean(forward[a:b], axis=1)))
+
+        after = weights[-1] * (1 + f[-1])
+        holding = after / after.sum() if after.sum() > 0 else np.zeros(n)
+
+        # 命中率：每次換股的入選標的持有到下次換股 (或回測結束) 的報酬
+        for i in np.flatnonzero(rebalance):
+            t = a + i
+            exit_row = min(t + rebalance_days, last)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                period = close[exit_row] / close[t] - 1
+            universe = np.nanmean(period) if np.any(~np.isnan(period)) else np.nan
+            chosen = period[selected[i] & ~np.isnan(period)]
+            reb_rows.append(t)
+            picks.append(int(selected[i].sum()))
+            hits.append(int((chosen > 0).sum()))
+            beats.append(int((chosen > universe).sum()))
+
+    realized = dates[first + 1:last + 1]  # 報酬實現於隔日收盤
+    daily = pd.DataFrame({
+        'portfolio': np.concatenate(port_ret),
+        'benchmark': np.concatenate(bench_ret),
+        'turnover': np.concatenate(turnover),
+        'cost': np.concatenate(costs),
+        'holdings': np.concatenate(n_held),
+    }, index=realized)
+    rebalances = pd.DataFrame({'picks': picks, 'hits': hits, 'beats': beats}, index=dates[reb_rows])
+    return {'daily': daily, 'rebalances': rebalances, 'summary': summarize(daily, rebalances, top_n, rebalance_days)}
+
+
+def _perf(returns):
+    equity = np.cumprod(1 + returns)
+    years = len(returns) / TRADING_DAYS
+    total = equity[-1] - 1
+    vol = returns.std(ddof=1) * np.sqrt(TRADING_DAYS) if len(returns) > 1 else np.nan
+    return {
+        'total_return': total,
+        'cagr': (1 + total) ** (1 / years) - 1 if total > -1 else -1.0,
+        'volatility': vol,
+        'max_drawdown': (equity / np.maximum.accumulate(np.maximum(equity, 1)) - 1).min(),
+        'mean': returns.mean(),
+    }
+
+
+def summarize(daily, rebalances, top_n, rebalance_days):
+    from scanner import RF
+    p, bm = _perf(daily['portfolio'].to_numpy()), _perf(daily['benchmark'].to_numpy())
+    picks = rebalances['picks'].sum()
+    return {
+        'start': str(daily.index[0].date()),
+        'end': str(daily.index[-1].date()),
+        'days': len(daily),
+        'top_n': top_n,
+        'rebalance_days': rebalance_days,
+        'total_return': round(float(p['total_return']), 4),
+        'cagr': round(float(p['cagr']), 4),
+        'volatility': round(float(p['volatility']), 4),
+        'sharpe': round(float((p['mean'] * TRADING_DAYS - RF) / p['volatility']), 2) if p['volatility'] else None,
+        'max_drawdown': round(float(p['max_drawdown']), 4),
+        'benchmark_total_return': round(float(bm['total_return']), 4),
+        'benchmark_cagr': round(float(bm['cagr']), 4),
+        'excess_cagr': round(float(p['cagr'] - bm['cagr']), 4),
+        'avg_turnover': round(float(daily['turnover'].sum() / len(rebalances)), 4) if len(rebalances) else 0.0,
+        'annual_turnover': round(float(daily['turnover'].sum() / (len(daily) / TRADING_DAYS)), 2),
+        'total_cost': round(float(daily['cost'].sum()), 4),
+        'avg_holdings': round(float(daily['holdings'].mean()), 1),
+        'hit_rate': round(float(rebalances['hits'].sum() / picks), 4) if picks else None,
+        'beat_rate': round(float(rebalances['beats'].sum() / picks), 4) if picks else None,
+    }
+
+
+# --- 離線合成資料 ---
+
+def synthetic_snapshots(tickers, dates, every_days=63, seed=0):
+    """
+    每季一份的合成財報快照 (長表，同 load_snapshots)：每檔的基準值加上逐季隨機漂移
+    分布與 SyntheticProvider 相近，約一到兩成標的通過 FCF / ROIC 濾網
+    """
+    rng = np.random.default_rng(seed)
+    as_of = dates[::every_days]
+    shape = (len(as_of), len(tickers))
+
+    def walk(low, high, step):
+        return rng.uniform(low, high, len(tickers)) + np.cumsum(rng.normal(0, step, shape), axis=0)
+
+    equity = rng.uniform(1e9, 1e11, len(tickers)) * np.ones(shape)
+    debt = rng.uniform(0, 5e10, len(tickers)) * np.ones(shape)
+    columns = {
+        'roic': walk(-0.05, 0.3, 0.02),
+        'fcf_yield': walk(-0.05, 0.3, 0.02),
+        'peg': walk(0.3, 3, 0.1),
+        'pb': walk(0.5, 5, 0.1),
+        'div_rate': np.maximum(walk(0, 10, 0.3), 0),
+        'total_debt': debt,
+        'total_equity': equity,
+        'roe': walk(-0.1, 0.4, 0.02),
+        'roa': walk(-0.05, 0.2, 0.01),
+        'eps': walk(-2, 30, 0.5),
+        'net_income': equity * walk(-0.05, 0.2, 0.01),
+        'total_assets': equity + debt,
+        'book_value': walk(10, 200, 2),
+        'contract_liabilities': rng.uniform(0, 1e9, shape),
+        'rev_growth_year': walk(-0.3, 0.5, 0.05),
+        'rev_growth_qr': rng.uniform(-0.3, 0.5, shape),
+    }
+    long = pd.DataFrame({col: values.ravel() for col, values in columns.items()})
+    long.insert(0, 'as_of', np.repeat(as_of, len(tickers)))
+    long.insert(0, 'ticker', np.tile(np.asarray(tickers), len(as_of)))
+    return long
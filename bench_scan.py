@@ -0,0 +1,131 @@
+"""
+全市場掃描吞吐量基準測試 (離線合成資料，不需網路)
+每個規模在獨立行程中執行，分別量測 tickers/sec、每檔財報抓取延遲 p50/p99 與峰值記憶體
+
+用法:
+    python bench_scan.py
+    python bench_scan.py --sizes 100 1000 2000 --latency 0.02 --jitter 0.02 --rate-limit 0.01
+    python bench_scan.py --json bench.json
+    python bench_scan.py --sizes 2000 --factor-workers 1 2 4 8 16   # 技術因子 stage 的多行程擴展性
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [100, 1000, 2000]
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # macOS 為 bytes，Linux 為 KB
+
+
+def run_once(n_tickers, latency=0.0, jitter=0.0, rate_limit_rate=0.0, rate=1000.0, concurrency=32, seed=0):
+    """冷啟動跑一次完整掃描 (股票池 -> 日K -> 技術面 -> 財報 -> 評分)，回傳量測結果"""
+    import numpy as np
+    from fetch_engine import FetchEngine
+    from fundamentals_cache import FundamentalsCache
+    from price_store import PriceStore
+    from providers import SyntheticProvider
+    from scanner import load_market_returns, run_scan
+
+    provider = SyntheticProvider(n_tickers=n_tickers, latency=latency, latency_jitter=jitter,
+                                 rate_limit_rate=rate_limit_rate, seed=seed)
+    engine = FetchEngine(rate=rate, burst=max(1, int(rate)), initial_concurrency=concurrency,
+                         max_concurrency=concurrency * 2, base_delay=0.05)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        tickers, name_map = provider.get_universe()
+        store = PriceStore(store_dir=os.path.join(tmp, 'prices'), provider=provider)
+        market_returns = load_market_returns(store)
+        price_panel = store.update(tickers)
+        prices_done = time.perf_counter()
+        cache = FundamentalsCache(cache_dir=os.path.join(tmp, 'cache'))
+        results, stage_reports = run_scan(tickers, name_map, market_returns, price_panel,
+                                          cache=cache, engine=engine, provider=provider)
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array([o['fetch_time'] for o in engine.outcomes.values()]) * 1000
+    return {
+        'tickers': n_tickers,
+        'elapsed_sec': round(elapsed, 3),
+        'price_sec': round(prices_done - start, 3),
+        'tickers_per_sec': round(n_tickers / elapsed, 1),
+        'fetch_p50_ms': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+        'fetch_p99_ms': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'results': len(results),
+        'stages': stage_reports,
+    }
+
+
+def bench_factor_workers(n_tickers, workers_list, n_days=250, repeat=3, seed=0):
+    """技術因子 stage 在不同行程數下的耗時 (共享記憶體面板，先暖機讓行程池啟動不計入)"""
+    from factor_engine import compute_factor_table
+    from providers import MARKET_INDEX, SyntheticProvider
+
+    provider = SyntheticProvider(n_tickers=n_tickers, n_days=n_days, seed=seed)
+    tickers, _ = provider.get_universe()
+    panel = provider.get_price_history(tickers)
+    market_returns = provider.get_price_history([MARKET_INDEX])['Close'][MARKET_INDEX].pct_change().dropna()
+    rows, base = [], None
+    for workers in workers_list:
+        compute_factor_table(panel, market_returns, workers=workers)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            compute_factor_table(panel, market_returns, workers=workers)
+        elapsed = (time.perf_counter() - start) / repeat
+        base = base or elapsed
+        rows.append({'tickers': n_tickers, 'days': n_days, 'workers': workers,
+                     'elapsed_sec': round(elapsed, 4), 'speedup': round(base / elapsed, 2)})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="掃描吞吐量基準測試 (合成資料)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="股票池規模")
+    parser.add_argument('--latency', type=float, default=0.0, help="每次請求的固定延遲 (秒)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="每次請求的額外隨機延遲上限 (秒)")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="財報請求回應 429 的機率")
+    parser.add_argument('--rate', type=float, default=1000.0, help="FetchEngine 每秒請求上限")
+    parser.add_argument('--concurrency', type=int, default=32, help="FetchEngine 起始並發數")
+    parser.add_argument('--factor-workers', type=int, nargs='+', help="改為量測技術因子 stage 在各行程數下的耗時")
+    parser.add_argument('--days', type=int, default=250, help="--factor-workers 的日K根數")
+    parser.add_argument('--json', help="另存結果為 JSON 檔")
+    args = parser.parse_args(argv)
+
+    if args.factor_workers:
+        rows = [row for size in args.sizes for row in bench_factor_workers(size, args.factor_workers, n_days=args.days)]
+        for row in rows:
+            print(f"{row['tickers']:>6} 檔 × {row['days']} 日 | {row['workers']:>3} 行程 | {row['elapsed_sec']:>8.4f}s | "
+                  f"x{row['speedup']}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+        return
+
+    rows = []
+    ctx = multiprocessing.get_context('spawn')
+    for size in args.sizes:
+        # 每個規模用新行程，峰值記憶體才不會互相累積
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            row = pool.submit(run_once, size, args.latency, args.jitter, args.rate_limit,
+                              args.rate, args.concurrency).result()
+        rows.append(row)
+        print(f"{row['tickers']:>6} 檔 | {row['elapsed_sec']:>8.2f}s | {row['tickers_per_sec']:>8.1f} tickers/s | "
+              f"p50 {row['fetch_p50_ms']} ms | p99 {row['fetch_p99_ms']} ms | "
+              f"peak RSS {row['peak_rss_mb']} MB | 入選 {row['results']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Miniko 因子選股 - 無介面 (headless) 批次掃描，可由 cron 排程執行
+
+    python -m factor_ai scan                       # 全市場掃描，結果存 .cache/results/
+    python -m factor_ai scan --output out.csv --top 20 --telegram
+    python -m factor_ai scan --market 上市 --group 半導體業 --limit 100   # 子股票池 (依流動性取前 N 檔)
+    python -m factor_ai universe                   # 股票池索引的市場 / 產業分布
+    python -m factor_ai show --top 20              # 查詢最近一次掃描結果 (不需網路)
+    python -m factor_ai backtest --provider synthetic --tickers 2000 --years 5   # 評分規則回測
+
+重量級套件 (pandas / yfinance / twstock) 只在真正需要時才載入，--help 與 show 幾乎瞬間完成
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# 與 fundamentals_cache.CACHE_ROOT 相同；這裡不 import 該模組，避免為了路徑載入 pandas
+CACHE_ROOT = os.environ.get('FACTOR_AI_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+RESULTS_DIR = os.path.join(CACHE_ROOT, 'results')
+LATEST_SUMMARY = os.path.join(RESULTS_DIR, 'latest.json')
+SUMMARY_COLUMNS = ["代號", "名稱", "現價", "合理價", "AI綜合評分", "意圖因子", "ROIC", "FCF Yield", "CGO", "亮點"]
+
+
+def _write_results(df, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.csv'):
+        df.to_csv(path, index=False, encoding='utf-8-sig')  # utf-8-sig: Excel 開啟中文不亂碼
+    else:
+        df.to_parquet(path, index=False)
+
+
+def _print_top(rows):
+    for i, row in enumerate(rows, 1):
+        print(f"{i:>3}. {row['代號']:<6} {row['名稱']:<8} 評分 {row['AI綜合評分']:>5} | 現價 {row['現價']:>8.2f} | "
+              f"合理價 {row['合理價']:>8} | ROIC {row['ROIC']} | FCF {row['FCF Yield']} | {row['亮點']}")
+
+
+def cmd_scan(args):
+    if args.provider:
+        os.environ['FACTOR_AI_PROVIDER'] = args.provider  # 須在載入資料模組前設定
+    from scanner import rank_results, scan_market
+    from providers import get_provider
+    from result_table import format_results
+    from universe import select_tickers
+
+    def on_progress(stage, done, total):
+        if not args.quiet and (done % 100 == 0 or done == total):
+            print(f"{stage}: {done}/{total}", file=sys.stderr)
+
+    provider = get_provider()
+    tickers, name_map = select_tickers(provider, refresh=args.refresh_universe, markets=args.market, groups=args.group,
+                                       watchlist=args.watchlist, limit=args.limit)
+    if not tickers:
+        print("沒有符合條件的標的", file=sys.stderr)
+        return 1
+
+    started = time.time()
+    results, stage_reports = scan_market(tickers, name_map, force_refresh=args.force_refresh,
+                                         progress_callback=on_progress, provider=provider, resume=not args.no_resume)
+    ranked = rank_results(results, top_n=len(results))
+
+    scanned_at = time.strftime('%Y%m%d_%H%M%S', time.localtime(started))
+    output = args.output or os.path.join(RESULTS_DIR, f"scan_{scanned_at}.parquet")
+    _write_results(ranked, output)
+
+    top_rows = format_results(ranked.head(args.top))[SUMMARY_COLUMNS].to_dict('records')
+    summary = {
+        'scanned_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)),
+        'elapsed_sec': round(time.time() - started, 1),
+        'provider': provider.name,
+        'output': os.path.abspath(output),
+        'count': len(ranked),
+        'stages': stage_reports,
+        'top': top_rows,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(LATEST_SUMMARY, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+
+    for report in stage_reports:
+        print(f"{report['stage']}：{report['in']} → {report['out']} 檔", file=sys.stderr)
+    print(f"✅ 入選 {len(ranked)} 檔，結果已存至 {output}", file=sys.stderr)
+    _print_top(top_rows)
+
+    if args.metrics_json or args.metrics_prom:
+        from metrics import REGISTRY
+        if args.metrics_json:
+            with open(args.metrics_json, 'w', encoding='utf-8') as f:
+                f.write(REGISTRY.to_json(indent=2))
+        if args.metrics_prom:
+            with open(args.metrics_prom, 'w', encoding='utf-8') as f:
+                f.write(REGISTRY.to_prometheus())
+
+    if (args.telegram or args.alerts) and len(ranked):
+        from notify import format_top_message, get_dispatcher
+        dispatcher = get_dispatcher()
+        top = format_results(ranked.head(args.top))
+        if args.telegram:
+            dispatcher.send(format_top_message(top, args.top))
+        if args.alerts:
+            dispatcher.send_alerts(top.to_dict('records'))
+        if not dispatcher.close():
+            print("⚠️ Telegram 推播逾時，部分訊息未送出", file=sys.stderr)
+    return 0
+
+
+def cmd_show(args):
+    try:
+        with open(LATEST_SUMMARY, encoding='utf-8') as f:
+            summary = json.load(f)
+    except FileNotFoundError:
+        print("尚無掃描結果，請先執行: python -m factor_ai scan", file=sys.stderr)
+        return 1
+
+    print(f"掃描時間 {summary['scanned_at']} | 資料來源 {summary['provider']} | 入選 {summary['count']} 檔", file=sys.stderr)
+    if args.top <= len(summary['top']):
+        _print_top(summary['top'][:args.top])
+        return 0
+    # 摘要只存 Top N，要更多筆時才載入 pandas 讀完整結果 (數值表，顯示前才格式化)
+    import pandas as pd
+    from result_table import format_results
+    path = summary['output']
+    df = pd.read_csv(path) if path.endswith('.csv') else pd.read_parquet(path)
+    _print_top(format_results(df.head(args.top))[SUMMARY_COLUMNS].to_dict('records'))
+    return 0
+
+
+def cmd_universe(args):
+    if args.provider:
+        os.environ['FACTOR_AI_PROVIDER'] = args.provider
+    from providers import get_provider
+    from universe import load_universe, universe_path
+
+    provider = get_provider()
+    universe = load_universe(provider, refresh=args.refresh)
+    print(f"{universe_path(provider.name)}：共 {len(universe)} 檔，{universe['liquidity'].notna().sum()} 檔有流動性紀錄",
+          file=sys.stderr)
+    counts = universe.groupby(['group', 'market']).size().unstack(fill_value=0)
+    counts['合計'] = counts.sum(axis=1)
+    print(counts.sort_values('合計', ascending=False).to_string())
+    return 0
+
+
+def cmd_backtest(args):
+    if args.provider:
+        os.environ['FACTOR_AI_PROVIDER'] = args.provider
+    from backtest import load_snapshots, run_backtest, snapshot_dir, synthetic_snapshots
+    from providers import MARKET_INDEX, get_provider
+
+    provider = get_provider(args.provider, n_tickers=args.tickers or 2000, n_days=args.years * 252) \
+        if args.provider == 'synthetic' else get_provider()
+    tickers, _ = provider.get_universe()
+    if args.tickers:
+        tickers = tickers[:args.tickers]
+
+    started = time.time()
+    prices = provider.get_price_history(tickers, period=f"{args.years}y")
+    market = provider.get_price_history([MARKET_INDEX], period=f"{args.years}y")['Close'][MARKET_INDEX].dropna()
+    if provider.name == 'synthetic':
+        snapshots = synthetic_snapshots(tickers, prices['Close'].index)
+    else:
+        snapshots = load_snapshots(snapshot_dir(provider.name))
+        if snapshots.empty:
+            print("尚無財報快照，請先執行: python -m factor_ai scan (每次掃描會存一份)", file=sys.stderr)
+            return 1
+    loaded = time.time()
+
+    result = run_backtest(prices, market.pct_change().dropna(), snapshots, top_n=args.top,
+                          rebalance_days=args.rebalance, cost_bps=args.cost_bps, lag_days=args.lag_days)
+    summary = dict(result['summary'], tickers=len(tickers), load_sec=round(loaded - started, 1),
+                   backtest_sec=round(time.time() - loaded, 2))
+    if args.output:
+        _write_results(result['daily'].rename_axis('date').reset_index(), args.output)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m factor_ai', description="Miniko 因子選股 - 無介面批次掃描")
+    sub = parser.add_subparsers(dest='command')
+
+    scan = sub.add_parser('scan', help="執行全市場掃描並存檔")
+    scan.add_argument('--output', help="結果檔路徑 (.parquet 或 .csv)，預設存於 .cache/results/")
+    scan.add_argument('--top', type=int, default=20, help="摘要 / 推播的前 N 名 (預設 20)")
+    scan.add_argument('--telegram', action='store_true', help="以 Telegram 推播前 N 名")
+    scan.add_argument('--alerts', action='store_true', help="以 Telegram 逐檔推播前 N 名 (同一檔 24 小時內不重複)")
+    scan.add_argument('--force-refresh', action='store_true', help="忽略本地快取，全部重抓")
+    scan.add_argument('--no-resume', action='store_true', help="不續跑當天中斷的掃描，從頭開始")
+    scan.add_argument('--provider', choices=['yahoo', 'synthetic'], help="資料來源 (預設 FACTOR_AI_PROVIDER 或 yahoo)")
+    scan.add_argument('--market', nargs='+', choices=['上市', '上櫃'], help="只掃描指定市場")
+    scan.add_argument('--group', nargs='+', help="只掃描指定產業別 (如 半導體業，見 universe 指令)")
+    scan.add_argument('--watchlist', nargs='+', help="只掃描自選清單 (代號，如 2330 2317)")
+    scan.add_argument('--limit', type=int, help="只掃描流動性最高的前 N 檔")
+    scan.add_argument('--refresh-universe', action='store_true', help="重建股票池索引")
+    scan.add_argument('--quiet', action='store_true', help="不顯示進度")
+    scan.add_argument('--metrics-json', help="另存各 stage 效能量測 (JSON)")
+    scan.add_argument('--metrics-prom', help="另存各 stage 效能量測 (Prometheus text，可給 node_exporter textfile collector)")
+    scan.set_defaults(func=cmd_scan)
+
+    show = sub.add_parser('show', help="顯示最近一次掃描結果")
+    show.add_argument('--top', type=int, default=20, help="顯示前 N 名 (預設 20)")
+    show.set_defaults(func=cmd_show)
+
+    uni = sub.add_parser('universe', help="顯示股票池索引 (市場 / 產業別檔數)")
+    uni.add_argument('--provider', choices=['yahoo', 'synthetic'], help="資料來源 (預設 FACTOR_AI_PROVIDER 或 yahoo)")
+    uni.add_argument('--refresh', action='store_true', help="重建索引")
+    uni.set_defaults(func=cmd_universe)
+
+    bt = sub.add_parser('backtest', help="以歷史日K與財報快照回測評分規則 (Top-N 等權)")
+    bt.add_argument('--provider', choices=['yahoo', 'synthetic'], help="資料來源 (synthetic 為離線合成資料)")
+    bt.add_argument('--tickers', type=int, help="只回測股票池前 N 檔 (synthetic 為合成檔數，預設 2000)")
+    bt.add_argument('--years', type=int, default=5, help="回測年數 (預設 5)")
+    bt.add_argument('--top', type=int, default=20, help="持有前 N 名 (預設 20)")
+    bt.add_argument('--rebalance', type=int, default=1, help="每 N 個交易日換股 (預設 1)")
+    bt.add_argument('--cost-bps', type=float, default=0.0, help="單邊交易成本 (bp)")
+    bt.add_argument('--lag-days', type=int, default=0, help="財報快照延後 N 天才可用")
+    bt.add_argument('--output', help="另存每日報酬 (.parquet 或 .csv)")
+    bt.set_defaults(func=cmd_backtest)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 0
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+from metrics import REGISTRY
+
+# --- 因子引擎設定 ---
+MIN_BARS = 60        # 少於 60 根日K 不計算 (同 len(data) < 60 規則)
+BETA_MIN_OBS = 30    # 與大盤對齊後需超過 30 筆才估 Beta，否則 Beta = 1.0
+TRADING_DAYS = 252
+FACTOR_WORKERS = int(os.environ.get('FACTOR_AI_WORKERS', 0))  # > 1 時技術因子改用多行程 (0 = 同一行程計算)
+MIN_PARALLEL_TICKERS = 500  # 檔數太少時行程間派工的成本高於計算本身
+
+FACTOR_COLUMNS = [
+    'current_price', 'n_bars', 'ma20', 'ma60', 'beta', 'volatility',
+    'vwap_60', 'cgo', 's_return', 'v_variability', 'avg_volume', 'intent_ratio',
+]
+
+
+def _compact(close, *others):
+    """
+    每檔各自的有效日K往下對齊 (NaN 移到上方)
+    等同逐檔 dropna 後再靠右對齊，讓最後一列就是每檔的最後一根K棒
+    """
+    order = np.argsort(~np.isnan(close), axis=0, kind='stable')
+    return [np.take_along_axis(m, order, axis=0) for m in (close,) + others]
+
+
+def _tail(mat, n):
+    return mat[-n:] if mat.shape[0] >= n else mat
+
+
+def compute_factor_table(price_panel, market_returns, current_prices=None, workers=FACTOR_WORKERS):
+    """
+    一次計算全市場技術因子 (dates × tickers 矩陣運算)
+    current_prices: Series(代號 -> 現價)，缺值以最後收盤價代替
+    workers > 1 且檔數達 MIN_PARALLEL_TICKERS 時，依代號切塊交給多個行程 (面板放在共享記憶體)
+    回傳 DataFrame(index=代號, columns=FACTOR_COLUMNS)；日K不足 60 根者因子為 NaN
+    """
+    close_df = price_panel['Close']
+    tickers = close_df.columns
+    if close_df.empty:
+        return pd.DataFrame(columns=FACTOR_COLUMNS, index=tickers, dtype=float)
+    volume_df = price_panel['Volume'].reindex(index=close_df.index, columns=tickers)
+
+    close = close_df.to_numpy(dtype=float)
+    volume = volume_df.to_numpy(dtype=float)
+    market = market_returns.reindex(close_df.index).to_numpy(dtype=float) if len(market_returns) else np.full(len(close_df), np.nan)
+    quoted = np.full(len(tickers), np.nan)
+    if current_prices is not None:
+        quoted = pd.Series(current_prices, dtype=float).reindex(tickers).to_numpy()
+
+    rows = None
+    if workers > 1 and len(tickers) >= MIN_PARALLEL_TICKERS:
+        from shared_panel import map_columns
+        try:
+            rows = map_columns(_factor_chunk, {'close': close, 'volume': volume, 'market': market, 'quoted': quoted},
+                               len(tickers), workers)
+        except Exception as e:
+            REGISTRY.record_failure('compute.factor_pool', e)  # 行程池異常時改在本行程計算
+    if rows is None:
+        rows = factor_rows(close, volume, market, quoted)
+    table = pd.DataFrame(rows, index=tickers, columns=FACTOR_COLUMNS)
+    table['n_bars'] = table['n_bars'].astype(np.int64)
+    return table
+
+
+def _factor_chunk(arrays, start, stop):
+    """子行程：共享記憶體中的面板取第 start:stop 檔計算"""
+    cols = slice(start, stop)
+    return factor_rows(arrays['close'][:, cols], arrays['volume'][:, cols], arrays['market'], arrays['quoted'][cols])
+
+
+def factor_rows(close, volume, market, quoted):
+    """
+    技術因子核心 (純 numpy，各檔獨立，可任意依欄切塊)
+    close / volume: dates × tickers；market: 大盤日報酬 (dates)；quoted: 現價 (NaN 用最後收盤)
+    回傳 tickers × FACTOR_COLUMNS 的 float64 矩陣；日K不足 60 根者除現價 / n_bars 外為 NaN
+    """
+    market = np.broadcast_to(market[:, None], close.shape)
+    close, volume, market = _compact(close, volume, market)
+    n_bars = (~np.isnan(close)).sum(axis=0)
+    valid = n_bars >= MIN_BARS
+
+    last_close = close[-1]
+    price = np.where(np.isnan(quoted), last_close, quoted)
+
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        # 均線
+        ma20 = _tail(close, 20).mean(axis=0)
+        ma60 = _tail(close, 60).mean(axis=0)
+
+        # 日報酬 (第 k 列 = 第 k+1 根K棒的 pct_change)
+        returns = close[1:] / close[:-1] - 1
+        n_ret = (~np.isnan(returns)).sum(axis=0)
+        volatility = np.nanstd(returns, axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+
+        # Beta：與大盤報酬依日期 inner join 後估 cov / var
+        mkt = market[1:]
+        pair = ~np.isnan(returns) & ~np.isnan(mkt)
+        n_pair = pair.sum(axis=0)
+        r = np.where(pair, returns, 0.0)
+        m = np.where(pair, mkt, 0.0)
+        r_dev = np.where(pair, r - r.sum(axis=0) / n_pair, 0.0)
+        m_dev = np.where(pair, m - m.sum(axis=0) / n_pair, 0.0)
+        cov = (r_dev * m_dev).sum(axis=0) / (n_pair - 1)
+        mkt_var = (m_dev ** 2).sum(axis=0) / (n_pair - 1)
+        beta = np.where((n_pair > BETA_MIN_OBS) & (mkt_var != 0), cov / mkt_var, 1.0)
+
+        # VWAP-60 與 CGO
+        c60, v60 = _tail(close, 60), _tail(volume, 60)
+        vwap_60 = np.nansum(c60 * v60, axis=0) / np.nansum(v60, axis=0)
+        cgo = np.where(vwap_60 > 0, (price - vwap_60) / vwap_60, np.nan)
+
+        # 60 日報酬、路徑長度與意圖因子
+        price_60_ago = close[-MIN_BARS] if close.shape[0] >= MIN_BARS else np.full(close.shape[1], np.nan)
+        s_return = price / price_60_ago - 1
+        v_variability = np.nansum(np.abs(_tail(returns, MIN_BARS)), axis=0)
+        avg_volume = np.nanmean(v60, axis=0)
+        intent_ratio = np.where((v_variability > 0) & (avg_volume > 500), s_return / v_variability, np.nan)
+
+    rows = np.column_stack([
+        price, n_bars, ma20, ma60, beta, np.where(n_ret > 1, volatility, np.nan),
+        vwap_60, cgo, s_return, v_variability, avg_volume, intent_ratio,
+    ]).astype(np.float64)
+    # 日K不足者整列遮罩 (保留現價與 n_bars 供判斷)
+    rows[~valid, 2:] = np.nan
+    return rows
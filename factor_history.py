@@ -0,0 +1,378 @@
+"""
+因子歷史：每個交易日的技術因子 (Beta / 波動度 / VWAP-60 與 CGO / 意圖因子 …)，而非只有最後一根K棒
+
+    cols = rolling_factors(close, volume, market)              # 整段 dates × tickers，累積和移動視窗 O(n)
+    history = load_history('2330.TW')                          # 單檔 DataFrame(index=日期, columns=FACTOR_COLUMNS)
+    state = RollingFactors.from_history(close, volume, market)
+    state.update(close_today, volume_today, market_today)      # 新K棒：每個因子 O(1)
+
+- 移動視窗以累積和相減計算，不逐窗重算 .cov() / .std()
+- 串流狀態以環狀緩衝保留視窗內的K棒，移動加總與線上 (Welford) 共變異數只加入新的一筆、移出離開視窗的一筆
+- 波動度 / Beta 的視窗為 LOOKBACK_BARS (約一年)；即時掃描用整段日K (約一年) 估計，最後一天的值相近但不必相同
+"""
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from factor_engine import BETA_MIN_OBS, FACTOR_COLUMNS, MIN_BARS, TRADING_DAYS
+from metrics import REGISTRY
+
+# --- 因子歷史設定 ---
+LOOKBACK_BARS = 250   # 波動度 / Beta 的視窗 (即時掃描的日K約一年)
+VERIFY_BARS = 10      # 接續前比對最近 N 根K棒 (涵蓋日K資料庫每次覆寫的最近 7 天)
+
+
+# --- 整段計算 (累積和) ---
+
+def _rolling_sum(x, window):
+    """沿日期軸的移動加總 (x 不含 NaN)；前 window-1 列為部分加總"""
+    c = np.cumsum(x, axis=0)
+    out = c.copy()
+    out[window:] = c[window:] - c[:-window]
+    return out
+
+
+def rolling_factors(close, volume, market, n_bars_before=0, lookback=LOOKBACK_BARS):
+    """
+    每個日期的技術因子 (同 compute_factor_table 的欄位與規則)，回傳 {欄位: dates × tickers}
+    close / volume: dates × tickers；market: 大盤日報酬 (dates)
+    n_bars_before: 每檔在 close 第一列之前已有的日K數 (分段計算時接續 n_bars)
+    停牌造成的中間缺值不往前補，視窗以日期計算
+    """
+    valid = ~np.isnan(close)
+    x = np.where(valid, close, 0.0)
+    v = np.where(valid & ~np.isnan(volume), volume, 0.0)
+    n_bars = np.cumsum(valid, axis=0) + n_bars_before
+
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        ma20 = _rolling_sum(x, 20) / _rolling_sum(valid, 20)
+        ma60 = _rolling_sum(x, MIN_BARS) / _rolling_sum(valid, MIN_BARS)
+
+        # 日報酬 (第 t 列 = t-1 -> t)
+        returns = np.full(close.shape, np.nan)
+        returns[1:] = close[1:] / close[:-1] - 1
+        r_ok = ~np.isnan(returns)
+        r = np.where(r_ok, returns, 0.0)
+        n_ret = _rolling_sum(r_ok, lookback)
+        s1, s2 = _rolling_sum(r, lookback), _rolling_sum(r * r, lookback)
+        volatility = np.sqrt(np.maximum(s2 - s1 * s1 / n_ret, 0) / (n_ret - 1) * TRADING_DAYS)
+        volatility[n_ret <= 1] = np.nan
+
+        # Beta：同日都有報酬的配對估 cov / var
+        mkt = np.broadcast_to(np.asarray(market, dtype=np.float64)[:, None], close.shape)
+        pair = r_ok & ~np.isnan(mkt)
+        rp, mp = np.where(pair, r, 0.0), np.where(pair, mkt, 0.0)
+        n_pair = _rolling_sum(pair, lookback)
+        sr, sm = _rolling_sum(rp, lookback), _rolling_sum(mp, lookback)
+        cov = (_rolling_sum(rp * mp, lookback) - sr * sm / n_pair) / (n_pair - 1)
+        mkt_var = (_rolling_sum(mp * mp, lookback) - sm * sm / n_pair) / (n_pair - 1)
+        beta = np.where((n_pair > BETA_MIN_OBS) & (mkt_var != 0), cov / mkt_var, 1.0)
+
+        # VWAP-60 與 CGO
+        vwap_60 = _rolling_sum(x * v, MIN_BARS) / _rolling_sum(v, MIN_BARS)
+        cgo = np.where(vwap_60 > 0, (close - vwap_60) / vwap_60, np.nan)
+
+        # 60 日報酬、路徑長度與意圖因子
+        price_60_ago = np.full(close.shape, np.nan)
+        price_60_ago[MIN_BARS - 1:] = close[:len(close) - MIN_BARS + 1]
+        s_return = close / price_60_ago - 1
+        v_variability = _rolling_sum(np.abs(r), MIN_BARS)
+        avg_volume = _rolling_sum(v, MIN_BARS) / _rolling_sum(valid, MIN_BARS)
+        intent_ratio = np.where((v_variability > 0) & (avg_volume > 500), s_return / v_variability, np.nan)
+
+    factors = {
+        'current_price': close,
+        'n_bars': n_bars.astype(np.float64),
+        'ma20': ma20,
+        'ma60': ma60,
+        'beta': beta,
+        'volatility': volatility,
+        'vwap_60': vwap_60,
+        'cgo': cgo,
+        's_return': s_return,
+        'v_variability': v_variability,
+        'avg_volume': avg_volume,
+        'intent_ratio': intent_ratio,
+    }
+    # 日K不足 60 根 (或當天無收盤) 者遮罩
+    masked = (n_bars < MIN_BARS) | ~valid
+    for col in FACTOR_COLUMNS:
+        if col not in ('current_price', 'n_bars'):
+            factors[col] = np.where(masked, np.nan, factors[col])
+    return factors
+
+
+def _inputs(data, market_returns):
+    """單檔日K (Close / Volume) + 大盤日報酬 -> DataFrame(close, volume, market)，依日期對齊"""
+    return pd.DataFrame({
+        'close': data['Close'].astype(np.float64),
+        'volume': data['Volume'].astype(np.float64) if 'Volume' in data else np.nan,
+        'market': market_returns.reindex(data.index).astype(np.float64) if len(market_returns) else np.nan,
+    }, index=data.index)
+
+
+def history_frame(data, market_returns, lookback=LOOKBACK_BARS):
+    """單檔日K (index=日期) -> 每日技術因子 DataFrame(index=日期, columns=FACTOR_COLUMNS)"""
+    inputs = _inputs(data, market_returns)
+    cols = rolling_factors(inputs[['close']].to_numpy(), inputs[['volume']].to_numpy(), inputs['market'].to_numpy(),
+                           lookback=lookback)
+    return pd.DataFrame({col: cols[col][:, 0] for col in FACTOR_COLUMNS}, index=inputs.index)
+
+
+# --- 串流更新 (每根K棒 O(1)) ---
+
+class _OnlineCov:
+    """視窗內 (x, y) 的線上平均與離差乘積和 (Welford)；可加入也可移出一筆"""
+
+    __slots__ = ('n', 'mx', 'my', 'cxy', 'cyy')
+
+    def __init__(self):
+        self.n, self.mx, self.my, self.cxy, self.cyy = 0, 0.0, 0.0, 0.0, 0.0
+
+    def add(self, x, y):
+        self.n += 1
+        dx, dy = x - self.mx, y - self.my
+        self.mx += dx / self.n
+        self.my += dy / self.n
+        self.cxy += dx * (y - self.my)
+        self.cyy += dy * (y - self.my)
+
+    def remove(self, x, y):
+        if self.n <= 1:
+            self.__init__()  # 清空時歸零，不累積捨入誤差
+            return
+        self.n -= 1
+        dx, dy = x - self.mx, y - self.my
+        self.mx -= dx / self.n
+        self.my -= dy / self.n
+        self.cxy -= dx * (y - self.my)
+        self.cyy -= dy * (y - self.my)
+
+
+class RollingFactors:
+    """
+    單檔技術因子的串流狀態，每根新K棒 update() 為 O(1)，結果與 rolling_factors 同一日期的值相同
+    - 環狀緩衝保留最近 max(lookback, 60) + 1 根 (收盤 / 成交量 / 日報酬 / 大盤報酬)
+    - 20 / 60 日視窗維護移動加總；lookback 視窗以 _OnlineCov 維護報酬變異與對大盤的共變異
+    - revise() 改寫最後一根 (盤中K棒更新)：先移出該根、補回被它擠出視窗的K棒，再重新加入
+    """
+
+    def __init__(self, lookback=LOOKBACK_BARS, prev_close=np.nan, n_bars_before=0):
+        self.lookback = lookback
+        self.n_bars = n_bars_before
+        self._prev_close = prev_close   # 緩衝區第一根之前的收盤 (計算第一筆日報酬)
+        self._size = max(lookback, MIN_BARS) + 1
+        self._buf = np.full((self._size, 4), np.nan)
+        self._rows = 0
+        self._sum20, self._n20 = 0.0, 0
+        self._sum60, self._n60, self._sum_pv60, self._sum_v60, self._sum_abs60 = 0.0, 0, 0.0, 0.0, 0.0
+        self._ret = _OnlineCov()    # (r, r)：波動度
+        self._pair = _OnlineCov()   # (r, 大盤)：Beta
+        self._windows = ((20, self._short), (MIN_BARS, self._mid), (lookback, self._long))
+
+    @classmethod
+    def from_history(cls, close, volume, market, lookback=LOOKBACK_BARS):
+        """以既有日K建立狀態：只需重播最後 max(lookback, 60) 根，更早的只計入 n_bars"""
+        close = np.asarray(close, dtype=np.float64)
+        start = max(0, len(close) - max(lookback, MIN_BARS))
+        state = cls(lookback, prev_close=close[start - 1] if start else np.nan,
+                    n_bars_before=int((~np.isnan(close[:start])).sum()))
+        for c, v, m in zip(close[start:], np.asarray(volume, dtype=np.float64)[start:], np.asarray(market, dtype=np.float64)[start:]):
+            state._push(c, v, m)
+        return state
+
+    # --- 視窗 ---
+
+    def _row(self, k):
+        """倒數第 k 根 (1 = 最新)：(收盤, 成交量, 日報酬, 大盤報酬)"""
+        return self._buf[(self._rows - k) % self._size]
+
+    def _short(self, row, sign):
+        if row[0] == row[0]:
+            self._sum20 += sign * row[0]
+            self._n20 += sign
+
+    def _mid(self, row, sign):
+        close, volume, ret = row[0], row[1], row[2]
+        if close == close:
+            self._sum60 += sign * close
+            self._n60 += sign
+            self._sum_pv60 += sign * close * volume
+            self._sum_v60 += sign * volume
+        if ret == ret:
+            self._sum_abs60 += sign * abs(ret)
+
+    def _long(self, row, sign):
+        ret, market = row[2], row[3]
+        if ret == ret:
+            step = self._ret.add if sign > 0 else self._ret.remove
+            step(ret, ret)
+            if market == market:
+                step = self._pair.add if sign > 0 else self._pair.remove
+                step(ret, market)
+
+    def _push(self, close, volume, market):
+        prev = self._row(1)[0] if self._rows else self._prev_close
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret = np.float64(close) / prev - 1
+        valid = close == close
+        row = (close, volume if valid and volume == volume else 0.0, ret, market)
+        self._buf[self._rows % self._size] = row
+        self._rows += 1
+        self.n_bars += valid
+        row = self._row(1)
+        for length, apply in self._windows:
+            apply(row, 1)
+            if self._rows > length:
+                apply(self._row(length + 1), -1)
+
+    def _pop(self):
+        row = self._row(1).copy()
+        for length, apply in self._windows:
+            apply(row, -1)
+            if self._rows > length:
+                apply(self._row(length + 1), 1)
+        self._rows -= 1
+        self.n_bars -= row[0] == row[0]
+
+    # --- 呼叫端介面 ---
+
+    def update(self, close, volume, market_return=np.nan):
+        """加入一根新K棒 (當天無收盤傳 NaN)，回傳當天的因子 {欄位: 值}"""
+        self._push(float(close), float(volume), float(market_return))
+        return self.factors()
+
+    def revise(self, close, volume, market_return=np.nan):
+        """改寫最後一根K棒 (同一天的盤中更新)，回傳改寫後的因子"""
+        if not self._rows:
+            raise ValueError("尚無K棒可改寫")
+        self._pop()
+        return self.update(close, volume, market_return)
+
+    def factors(self):
+        """最後一根K棒的因子 (同 rolling_factors 的規則；日K不足 60 根或當天無收盤者為 NaN)"""
+        close = self._row(1)[0] if self._rows else np.nan
+        out = dict.fromkeys(FACTOR_COLUMNS, np.nan)
+        out.update(current_price=close, n_bars=float(self.n_bars))
+        if self.n_bars < MIN_BARS or close != close:
+            return out
+
+        n_ret = self._ret.n
+        volatility = np.sqrt(max(self._ret.cxy, 0.0) / (n_ret - 1) * TRADING_DAYS) if n_ret > 1 else np.nan
+        pair = self._pair
+        beta = pair.cxy / pair.cyy if pair.n > BETA_MIN_OBS and pair.cyy != 0 else 1.0
+        vwap_60 = self._sum_pv60 / self._sum_v60 if self._sum_v60 else np.nan
+        price_60_ago = self._row(MIN_BARS)[0] if self._rows >= MIN_BARS else np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s_return = np.float64(close) / price_60_ago - 1
+        avg_volume = self._sum_v60 / self._n60
+        v_variability = self._sum_abs60
+        out.update(
+            ma20=self._sum20 / self._n20,
+            ma60=self._sum60 / self._n60,
+            beta=beta,
+            volatility=volatility,
+            vwap_60=vwap_60,
+            cgo=(close - vwap_60) / vwap_60 if vwap_60 > 0 else np.nan,
+            s_return=s_return,
+            v_variability=v_variability,
+            avg_volume=avg_volume,
+            intent_ratio=s_return / v_variability if v_variability > 0 and avg_volume > 500 else np.nan,
+        )
+        return out
+
+
+class FactorHistory:
+    """
+    單檔的每日因子歷史 + 串流狀態
+    第一次以 rolling_factors 整段計算；之後 extend 只把新K棒交給串流狀態 (每根 O(1))，
+    最後一根被改寫 (盤中K棒) 時以 revise 重算該根；更早的K棒有變動 (還原權值 / 資料修正) 才整段重算
+    """
+
+    def __init__(self, data, market_returns, lookback=LOOKBACK_BARS):
+        self.lookback = lookback
+        self._build(_inputs(data, market_returns))
+
+    def _build(self, inputs):
+        with REGISTRY.timer('compute.factor_history'):
+            cols = rolling_factors(inputs[['close']].to_numpy(), inputs[['volume']].to_numpy(),
+                                   inputs['market'].to_numpy(), lookback=self.lookback)
+            self.frame = pd.DataFrame({col: cols[col][:, 0] for col in FACTOR_COLUMNS}, index=inputs.index)
+            self.state = RollingFactors.from_history(inputs['close'], inputs['volume'], inputs['market'], self.lookback)
+        self.inputs = inputs
+
+    def extend(self, data, market_returns):
+        """接續日K資料庫的最新內容；回傳 True 表示以串流更新完成，False 表示整段重算"""
+        fresh = _inputs(data, market_returns)
+        known = self.inputs
+        if fresh.empty or known.empty or fresh.index[0] != known.index[0] \
+                or not _same(fresh.iloc[:1], known.iloc[:1]):
+            self._build(fresh)
+            return False
+        tail = known.iloc[-VERIFY_BARS:]
+        overlap = fresh.reindex(tail.index)
+        changed = ~_row_equal(overlap, tail)
+        if changed[:-1].any():
+            self._build(fresh)
+            return False
+
+        revised = bool(changed[-1])
+        added = fresh[fresh.index > known.index[-1]]
+        rows = []
+        with REGISTRY.timer('compute.factor_history_update'):
+            if revised:
+                last = overlap.iloc[-1]
+                rows.append(self.state.revise(last['close'], last['volume'], last['market']))
+            for c, v, m in added.itertuples(index=False):
+                rows.append(self.state.update(c, v, m))
+        if revised:
+            known = pd.concat([known.iloc[:-1], overlap.iloc[-1:]])
+            added = pd.concat([overlap.iloc[-1:], added])
+            self.frame = self.frame.iloc[:-1]
+        if rows:
+            self.frame = pd.concat([self.frame, pd.DataFrame(rows, index=added.index, columns=FACTOR_COLUMNS)])
+            self.inputs = pd.concat([known, added.iloc[int(revised):]])
+        return True
+
+
+def _row_equal(a, b):
+    """逐列比對 (NaN 視為相等)"""
+    x, y = a.to_numpy(), b.to_numpy()
+    return ((x == y) | (np.isnan(x) & np.isnan(y))).all(axis=1)
+
+
+def _same(a, b):
+    return bool(_row_equal(a, b).all())
+
+
+# --- 程序共用的因子歷史 ---
+
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def get_history(ticker, data, market_returns, lookback=LOOKBACK_BARS):
+    """單檔每日因子 DataFrame；同一檔第一次整段計算，之後只接續新K棒"""
+    with _histories_lock:
+        history = _histories.get((ticker, lookback))
+        if history is None:
+            history = _histories[(ticker, lookback)] = FactorHistory(data, market_returns, lookback)
+        else:
+            REGISTRY.cache_event('history.factors', history.extend(data, market_returns))
+        return history.frame
+
+
+def load_history(ticker, store=None, lookback=LOOKBACK_BARS):
+    """從本地日K資料庫 (不連網) 讀取單檔與大盤，回傳每日因子 DataFrame；沒有日K時為空表"""
+    from price_store import PriceStore
+    from providers import MARKET_INDEX
+
+    store = store or PriceStore()
+    data = store.load(ticker)
+    if data.empty:
+        return pd.DataFrame(columns=FACTOR_COLUMNS, dtype=float)
+    index = store.load(MARKET_INDEX)['Close'].dropna()
+    return get_history(ticker, data, index.pct_change().dropna(), lookback)
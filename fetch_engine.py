@@ -0,0 +1,185 @@
+import asyncio
+import concurrent.futures
+import random
+import time
+from collections import Counter
+
+# --- 抓取引擎設定 ---
+RATE_PER_SEC = 8.0         # token bucket 每秒補充的請求數
+BURST = 16                 # token bucket 容量
+INITIAL_CONCURRENCY = 10   # 起始並發數 (原 ThreadPoolExecutor(max_workers=10))
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+MAX_RETRIES = 3
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+REQUEST_TIMEOUT = 30.0
+
+# 錯誤分類
+RATE_LIMIT = 'rate_limit'
+TIMEOUT = 'timeout'
+NETWORK = 'network'
+NO_DATA = 'no_data'
+ERROR = 'error'
+RETRYABLE = {RATE_LIMIT, TIMEOUT, NETWORK}
+
+
+class RateLimited(Exception):
+    """資料源回應 429 / Too Many Requests"""
+
+
+class NoData(Exception):
+    """資料源回應成功但沒有資料 (下市、代號錯誤等)"""
+
+
+def classify_error(exc):
+    """把例外分成 rate_limit / timeout / network / no_data / error"""
+    text = f"{type(exc).__name__} {exc}".lower()
+    if isinstance(exc, RateLimited) or '429' in text or 'too many requests' in text or 'ratelimit' in text:
+        return RATE_LIMIT
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or 'timed out' in text:
+        return TIMEOUT
+    if isinstance(exc, NoData):
+        return NO_DATA
+    if isinstance(exc, (ConnectionError, OSError)) or 'connection' in text:
+        return NETWORK
+    return ERROR
+
+
+class TokenBucket:
+    """每秒補充 rate 個 token，最多累積 capacity 個"""
+
+    def __init__(self, rate=RATE_PER_SEC, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AIMDLimiter:
+    """
+    AIMD 自適應並發上限
+    成功: 上限每輪 +1 (每次成功 +1/limit)；被限流: 上限乘以 decrease
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY, decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while self.in_flight >= int(self.limit):
+                await self._cond.wait()
+            self.in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class FetchEngine:
+    """
+    asyncio 抓取排程：token bucket 限速 + AIMD 並發 + 抖動指數退避重試
+    每個 key 都會留下一筆 outcome (成功 / 失敗原因 / 嘗試次數 / 耗時)
+    fetch_fn 可為一般函式 (丟到執行緒池) 或 async 函式
+    """
+
+    def __init__(self, rate=RATE_PER_SEC, burst=BURST, initial_concurrency=INITIAL_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY, timeout=REQUEST_TIMEOUT):
+        self.rate = rate
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.outcomes = {}
+        self.limiter = None
+
+    def _backoff(self, attempt):
+        # full jitter: 0 ~ min(max_delay, base * 2^attempt)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _call(self, fetch_fn, key, executor):
+        if asyncio.iscoroutinefunction(fetch_fn):
+            return await asyncio.wait_for(fetch_fn(key), self.timeout)
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(executor, fetch_fn, key), self.timeout)
+
+    async def _fetch_one(self, key, fetch_fn, bucket, executor):
+        start = time.monotonic()
+        fetch_time = 0.0
+        attempt = 0
+        while True:
+            attempt += 1
+            await bucket.acquire()
+            await self.limiter.acquire()
+            throttled = False
+            call_start = time.monotonic()
+            try:
+                result = await self._call(fetch_fn, key, executor)
+                outcome = {'status': 'ok', 'error_class': None, 'error': None}
+            except Exception as exc:
+                result = None
+                error_class = classify_error(exc)
+                throttled = error_class == RATE_LIMIT
+                outcome = {'status': 'failed', 'error_class': error_class, 'error': str(exc)[:200]}
+            finally:
+                fetch_time += time.monotonic() - call_start
+                await self.limiter.release(throttled)
+
+            if outcome['status'] == 'ok' or outcome['error_class'] not in RETRYABLE or attempt > self.max_retries:
+                # latency 含排隊與退避等待；fetch_time 只計實際請求時間
+                outcome.update(attempts=attempt, latency=time.monotonic() - start, fetch_time=fetch_time)
+                self.outcomes[key] = outcome
+                return key, result
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def run_async(self, keys, fetch_fn, progress_callback=None, result_callback=None):
+        """
+        回傳 {key: 結果}，只包含成功的 key；失敗原因見 self.outcomes
+        result_callback(key, 結果): 每完成一筆就交出去，不再留在回傳的 dict (串流處理、記憶體不隨 key 數成長)
+        """
+        keys = list(keys)
+        bucket = TokenBucket(self.rate, self.burst)
+        self.limiter = AIMDLimiter(self.initial_concurrency, maximum=self.max_concurrency)
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            tasks = [asyncio.ensure_future(self._fetch_one(key, fetch_fn, bucket, executor)) for key in keys]
+            for completed, task in enumerate(asyncio.as_completed(tasks), 1):
+                key, result = await task
+                if self.outcomes[key]['status'] == 'ok':
+                    if result_callback: result_callback(key, result)
+                    else: results[key] = result
+                if progress_callback: progress_callback(completed, len(keys))
+        return results
+
+    def run(self, keys, fetch_fn, progress_callback=None, result_callback=None):
+        return asyncio.run(self.run_async(keys, fetch_fn, progress_callback, result_callback))
+
+    def summary(self):
+        """各結果類別的筆數，例如 {'ok': 120, 'rate_limit': 3, 'no_data': 7}"""
+        return dict(Counter(o['error_class'] or 'ok' for o in self.outcomes.values()))
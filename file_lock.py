@@ -0,0 +1,72 @@
+"""
+跨行程獨占鎖：CLI 排程掃描 (python -m factor_ai scan) 與 Streamlit 背景掃描可能同時寫同一個快取目錄
+鎖在另一個 .lock 檔上 (資料檔會被 os.replace 換掉，不能鎖資料檔本身)；關檔即釋放，行程被砍掉也會釋放
+POSIX 用 fcntl.flock，Windows 用 msvcrt.locking
+"""
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+POLL_SECONDS = 0.05  # Windows 阻塞等待時的重試間隔
+
+
+def _try_lock(f, blocking):
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    while True:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(POLL_SECONDS)
+
+
+class FileLock:
+    """
+    with FileLock(path): ...           阻塞等到取得鎖
+    lock.acquire(blocking=False)       被別人持有時回傳 False
+    不可重入；同一行程內不同執行緒各自建立 FileLock 也會互斥
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        f = open(self.path, 'a+')
+        if not _try_lock(f, blocking):
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is None:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()  # flock 隨關檔釋放
+        self._file = None
+
+    @property
+    def locked(self):
+        return self._file is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
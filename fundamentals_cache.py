@@ -0,0 +1,178 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from providers import DEFAULT_PROVIDER
+from metrics import REGISTRY
+
+# --- 快取設定 ---
+CACHE_ROOT = os.environ.get('FACTOR_AI_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+
+def provider_cache_dir(provider_name=DEFAULT_PROVIDER):
+    """不同資料來源分開存放，合成資料不會污染真實快取"""
+    return os.path.join(CACHE_ROOT, provider_name)
+
+
+CACHE_DIR = provider_cache_dir()
+CACHE_DB = 'fundamentals.sqlite'
+
+DAY = 86400
+HOUR = 3600
+MINUTE = 60
+
+# 各資料種類的有效期限 (秒)：財報最多一季更新一次，.info 數小時，報價數分鐘
+TTL = {
+    'financials': 7 * DAY,
+    'balance_sheet': 7 * DAY,
+    'cashflow': 7 * DAY,
+    'info': 6 * HOUR,
+    'quote': 5 * MINUTE,
+    'score': 7 * DAY,  # 評分結果，是否沿用由輸入指紋決定
+}
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+EVICT_EVERY = 200  # 每寫入 N 筆做一次淘汰
+
+
+def _is_empty(value):
+    if value is None:
+        return True
+    if hasattr(value, 'empty'):
+        return bool(value.empty)
+    if isinstance(value, dict):
+        return len(value) == 0
+    return False
+
+
+def payload_digest(payloads):
+    """{資料種類: 序列化 payload} 的雜湊 (依種類排序)；任一種為 None 回傳 None"""
+    if any(payload is None for payload in payloads.values()):
+        return None
+    h = hashlib.sha1()
+    for kind in sorted(payloads):
+        h.update(payloads[kind])
+    return h.hexdigest()
+
+
+class FundamentalsCache:
+    """
+    本地持久化快取 (SQLite)，以 (代號, 資料種類) 為 key
+    - 過期資料視為未命中；超過容量時淘汰最久未讀取的項目
+    - force_refresh=True: 一律重新抓取 (仍會寫回快取)
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=None, max_bytes=MAX_CACHE_BYTES, force_refresh=False):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_DB)
+        self.ttl = dict(TTL, **(ttl or {}))
+        self.max_bytes = max_bytes
+        self.force_refresh = force_refresh
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                ticker TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (ticker, kind)
+            )
+        """)
+        self.evict()
+
+    def get(self, ticker, kind):
+        """命中且未過期回傳資料，否則回傳 None"""
+        return self._get(ticker, kind)[0]
+
+    def _get(self, ticker, kind):
+        """回傳 (資料, payload)；未命中為 (None, None)"""
+        if self.force_refresh:
+            return None, None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM entries WHERE ticker = ? AND kind = ?", (ticker, kind)
+            ).fetchone()
+            if row is None or row[1] < now:
+                REGISTRY.cache_event(f'cache.{kind}', False)
+                return None, None
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE ticker = ? AND kind = ?", (now, ticker, kind)
+            )
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            REGISTRY.cache_event(f'cache.{kind}', False)
+            return None, None
+        REGISTRY.cache_event(f'cache.{kind}', True)
+        return value, row[0]
+
+    def put(self, ticker, kind, value):
+        """寫入並回傳序列化後的 payload"""
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ticker, kind, payload, len(payload), now, now + self.ttl.get(kind, HOUR), now),
+            )
+            self._puts += 1
+            need_evict = self._puts % EVICT_EVERY == 0
+        if need_evict:
+            self.evict()
+        return payload
+
+    def digest(self, ticker, kinds):
+        """多種資料 payload 的雜湊 (不反序列化)；任一種缺漏或過期回傳 None"""
+        if self.force_refresh:
+            return None
+        kinds = sorted(kinds)
+        with self._lock:
+            rows = dict(self._conn.execute(
+                f"SELECT kind, payload FROM entries WHERE ticker = ? AND expires_at >= ? AND kind IN ({','.join('?' * len(kinds))})",
+                (ticker, time.time(), *kinds),
+            ).fetchall())
+        if len(rows) < len(kinds):
+            return None
+        return payload_digest(rows)
+
+    def get_or_fetch(self, ticker, kind, fetch_fn, with_payload=False):
+        """
+        快取未命中時呼叫 fetch_fn() 並寫回 (None / 空資料不寫入，避免把抓取失敗快取起來)
+        with_payload=True 時回傳 (資料, payload)：payload 為快取中的序列化內容 (未寫入時為 None)，
+        呼叫端可用 payload_digest 算出與 digest() 相同的指紋，不必再讀一次資料庫
+        """
+        value, payload = self._get(ticker, kind)
+        if value is None:
+            value = fetch_fn()
+            payload = None if _is_empty(value) else self.put(ticker, kind, value)
+        return (value, payload) if with_payload else value
+
+    def evict(self):
+        """刪除過期項目，並在超過容量時依最久未讀取順序淘汰"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._conn.execute("SELECT ticker, kind, size FROM entries ORDER BY accessed_at").fetchall()
+            victims = []
+            for ticker, kind, size in rows:
+                if total <= self.max_bytes:
+                    break
+                victims.append((ticker, kind))
+                total -= size
+            self._conn.executemany("DELETE FROM entries WHERE ticker = ? AND kind = ?", victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
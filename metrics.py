@@ -0,0 +1,161 @@
+import functools
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from fetch_engine import classify_error
+
+# --- 效能量測設定 ---
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+PROM_PREFIX = 'factor_ai'
+
+
+class StageMetrics:
+    """單一 stage 的累計資料：延遲直方圖、呼叫次數、失敗原因、快取命中"""
+
+    def __init__(self):
+        self.calls = 0
+        self.total_sec = 0.0
+        self.max_sec = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.failures = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def observe(self, seconds):
+        self.calls += 1
+        self.total_sec += seconds
+        self.max_sec = max(self.max_sec, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q):
+        """由直方圖估分位數 (回傳所在 bucket 的上界)"""
+        if not self.calls:
+            return None
+        target = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound if bound != float('inf') else self.max_sec
+        return self.max_sec
+
+    def snapshot(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'calls': self.calls,
+            'total_sec': round(self.total_sec, 4),
+            'mean_ms': round(self.total_sec / self.calls * 1000, 2) if self.calls else None,
+            'p50_ms': round(self.quantile(0.5) * 1000, 1) if self.calls else None,
+            'p95_ms': round(self.quantile(0.95) * 1000, 1) if self.calls else None,
+            'p99_ms': round(self.quantile(0.99) * 1000, 1) if self.calls else None,
+            'max_ms': round(self.max_sec * 1000, 1),
+            'failures': dict(self.failures),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_hit_rate': round(self.cache_hits / lookups, 4) if lookups else None,
+            'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS], self.buckets)),
+        }
+
+
+class MetricsRegistry:
+    """
+    全程序共用的量測中心 (執行緒安全)
+    stage 命名慣例: fetch.* 為網路抓取，compute.* 為運算，cache.* 為快取查詢
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = StageMetrics()
+        return self._stages[stage]
+
+    def observe(self, stage, seconds, error=None):
+        with self._lock:
+            metrics = self._stage(stage)
+            metrics.observe(seconds)
+            if error is not None:
+                metrics.failures[classify_error(error)] += 1
+
+    def record_failure(self, stage, error):
+        """記錄被吞掉的例外 (不影響呼叫次數)"""
+        with self._lock:
+            self._stage(stage).failures[classify_error(error)] += 1
+
+    def cache_event(self, stage, hit):
+        with self._lock:
+            metrics = self._stage(stage)
+            if hit:
+                metrics.cache_hits += 1
+            else:
+                metrics.cache_misses += 1
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.observe(stage, time.perf_counter() - start, e)
+            raise
+        self.observe(stage, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self.started_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: m.snapshot() for stage, m in sorted(self._stages.items())}
+
+    def to_json(self, **kwargs):
+        return json.dumps({'started_at': self.started_at, 'stages': self.snapshot()}, ensure_ascii=False, **kwargs)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        name = f'{PROM_PREFIX}_stage_latency_seconds'
+        lines = [f'# HELP {name} 各 stage 耗時', f'# TYPE {name} histogram']
+        failures = [f'# HELP {PROM_PREFIX}_stage_failures_total 各 stage 失敗次數 (依原因)',
+                    f'# TYPE {PROM_PREFIX}_stage_failures_total counter']
+        cache = [f'# HELP {PROM_PREFIX}_cache_requests_total 快取查詢次數 (依結果)',
+                 f'# TYPE {PROM_PREFIX}_cache_requests_total counter']
+        with self._lock:
+            for stage, m in sorted(self._stages.items()):
+                if m.calls:
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS, m.buckets):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {m.total_sec:.6f}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {m.calls}')
+                for reason, count in sorted(m.failures.items()):
+                    failures.append(f'{PROM_PREFIX}_stage_failures_total{{stage="{stage}",reason="{reason}"}} {count}')
+                if m.cache_hits or m.cache_misses:
+                    cache.append(f'{PROM_PREFIX}_cache_requests_total{{stage="{stage}",result="hit"}} {m.cache_hits}')
+                    cache.append(f'{PROM_PREFIX}_cache_requests_total{{stage="{stage}",result="miss"}} {m.cache_misses}')
+        return "\n".join(lines + failures + cache) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def timed(stage):
+    """裝飾器：以 REGISTRY 量測函式耗時與失敗原因"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with REGISTRY.timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,295 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import REGISTRY
+
+# --- 設定區 ---
+# 可用環境變數覆寫，方便排程 (cron) 執行
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '您的_BOT_TOKEN')
+TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID', '您的_CHAT_ID')
+TELEGRAM_API_BASE = os.environ.get('TELEGRAM_API_BASE', 'https://api.telegram.org')  # 測試時可指向本機 stub
+
+# --- 推播設定 ---
+MAX_MESSAGE_LEN = 4096       # Telegram 單則訊息長度上限
+CHAT_MIN_INTERVAL_SEC = 1.0  # 同一聊天室每則間隔 (Telegram 建議每秒不超過 1 則)
+BATCH_WAIT_SEC = 0.5         # 取到第一則後再等多久，把陸續進來的訊息合併成一批
+REQUEST_TIMEOUT = (3.05, 10)  # (連線, 讀取) 秒
+MAX_ATTEMPTS = 3             # 429 (retry_after) 的重送次數；連線錯誤 / 5xx 由 urllib3 Retry 處理
+DEDUP_TTL_SEC = 86400        # 同一聊天室同一代號 N 秒內只推播一次
+SENT_FILE = 'telegram_sent.json'
+
+
+def _is_configured(token):
+    return bool(token) and token != '您的_BOT_TOKEN'
+
+
+def split_message(text, max_len=MAX_MESSAGE_LEN):
+    """超過長度上限時依換行切開；單行過長才硬切"""
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > max_len:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:max_len])
+            line = line[max_len:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > max_len:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def batch_messages(texts, max_len=MAX_MESSAGE_LEN, separator="\n\n"):
+    """多則訊息合併成盡量少的批次，每批不超過 max_len"""
+    batches, current = [], ""
+    for text in texts:
+        for part in split_message(text, max_len):
+            candidate = f"{current}{separator}{part}" if current else part
+            if len(candidate) > max_len:
+                batches.append(current)
+                candidate = part
+            current = candidate
+    if current:
+        batches.append(current)
+    return batches
+
+
+class AlertDispatcher:
+    """
+    Telegram 推播派送器：呼叫端只把訊息放進佇列 (不阻塞)，背景執行緒負責送出
+    - 共用 requests.Session (連線池 + keep-alive)，連線錯誤 / 5xx 自動重試，每次請求都有 timeout
+    - 同一聊天室短時間內的多則訊息合併，每批不超過 MAX_MESSAGE_LEN
+    - 每個聊天室各自限速 (min_interval)，429 依回應的 retry_after 等待後重送
+    - 帶 key (如代號) 的訊息在 dedup_ttl 內不重複推播；sent_path 有值時記錄存檔，排程重跑也不重複
+      (只有送成功的 key 才記錄存檔；還在佇列中的 key 只放在記憶體，逾時沒送出的下次仍會推播)
+    """
+
+    def __init__(self, token=TELEGRAM_BOT_TOKEN, chat_id=TELEGRAM_CHAT_ID, api_base=TELEGRAM_API_BASE,
+                 min_interval=CHAT_MIN_INTERVAL_SEC, batch_wait=BATCH_WAIT_SEC, max_len=MAX_MESSAGE_LEN,
+                 dedup_ttl=DEDUP_TTL_SEC, sent_path=None, parse_mode="Markdown"):
+        self.token = token
+        self.chat_id = chat_id
+        self.url = f"{api_base.rstrip('/')}/bot{token}/sendMessage"
+        self.min_interval = min_interval
+        self.batch_wait = batch_wait
+        self.max_len = max_len
+        self.dedup_ttl = dedup_ttl
+        self.sent_path = sent_path
+        self.parse_mode = parse_mode
+        self.stats = {'queued': 0, 'duplicates': 0, 'requests': 0, 'sent': 0, 'failed': 0, 'throttled': 0}
+
+        self.session = requests.Session()
+        # 讀取逾時不重試：伺服器可能已收到，重送會重複推播
+        retry = Retry(total=3, read=0, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504], allowed_methods=None,
+                      respect_retry_after_header=False)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry))
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._last_sent = {}   # chat_id -> 上次送出的時間 (monotonic)
+        self._sent = self._load_sent()   # 已送成功的 key -> 送出時間 (存檔)
+        self._queued = set()             # 佇列中尚未送出的 key
+        self._thread = None
+        self._closed = False
+
+    # --- 去重紀錄 ---
+
+    def _load_sent(self):
+        if not self.sent_path:
+            return {}
+        try:
+            with open(self.sent_path, encoding='utf-8') as f:
+                sent = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        cutoff = time.time() - self.dedup_ttl
+        return {k: t for k, t in sent.items() if t >= cutoff}
+
+    def _save_sent(self):
+        if not self.sent_path:
+            return
+        with self._lock:
+            sent = dict(self._sent)
+        # 由背景執行緒呼叫：寫檔失敗只記錄，不中斷派送；暫存檔名各執行緒不同 (多個派送器可共用同一檔)
+        tmp = f"{self.sent_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.sent_path)), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(sent, f)
+            os.replace(tmp, self.sent_path)
+        except OSError as e:
+            REGISTRY.record_failure('notify.sent_file', e)
+
+    # --- 呼叫端介面 ---
+
+    @property
+    def enabled(self):
+        return _is_configured(self.token)
+
+    def send(self, text, chat_id=None, key=None):
+        """放進佇列，立即回傳；未設定 token、已關閉或 key 在去重期間內已推播過時回傳 False"""
+        if not self.enabled or self._closed:
+            return False
+        chat_id = str(chat_id or self.chat_id)
+        now = time.time()
+        with self._lock:
+            if key is not None:
+                dedup_key = f"{chat_id}:{key}"
+                if dedup_key in self._queued or now - self._sent.get(dedup_key, 0) < self.dedup_ttl:
+                    self.stats['duplicates'] += 1
+                    return False
+                self._queued.add(dedup_key)  # 佇列中的重複訊息也擋下
+            self._pending += 1
+            self.stats['queued'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name='telegram-dispatcher', daemon=True)
+                self._thread.start()
+        self._queue.put((chat_id, text, key))
+        return True
+
+    def send_alerts(self, rows, chat_id=None, formatter=None):
+        """逐檔警示 (result_table 顯示格式的列)，以代號去重；回傳實際放進佇列的檔數"""
+        formatter = formatter or format_alert
+        return sum(self.send(formatter(row), chat_id=chat_id, key=row['代號']) for row in rows)
+
+    def flush(self, timeout=None):
+        """等待佇列送完；逾時回傳 False (去重紀錄由背景執行緒在送成功後存檔)"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=30):
+        """送完佇列後關閉連線"""
+        self._closed = True
+        done = self.flush(timeout)
+        self._queue.put(None)
+        self.session.close()
+        return done
+
+    # --- 背景派送 ---
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            items = [item]
+            deadline = time.monotonic() + self.batch_wait
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)  # 處理完這批再結束
+                    break
+                items.append(nxt)
+
+            by_chat = {}
+            for chat_id, text, key in items:
+                by_chat.setdefault(chat_id, []).append((text, key))
+            delivered = False
+            for chat_id, entries in by_chat.items():
+                ok = all([self._post(chat_id, batch) for batch in batch_messages([text for text, _ in entries], self.max_len)])
+                # 送成功才登記為已推播；沒送成功的下次仍可再送
+                with self._lock:
+                    now = time.time()
+                    for _, key in entries:
+                        if key is not None:
+                            dedup_key = f"{chat_id}:{key}"
+                            self._queued.discard(dedup_key)
+                            if ok:
+                                self._sent[dedup_key] = now
+                                delivered = True
+            if delivered:
+                self._save_sent()
+            with self._lock:
+                self._pending -= len(items)
+                if self._pending == 0:
+                    self._idle.notify_all()
+
+    def _wait_turn(self, chat_id):
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _post(self, chat_id, text):
+        payload = {"chat_id": chat_id, "text": text}
+        if self.parse_mode:
+            payload["parse_mode"] = self.parse_mode
+        for _ in range(MAX_ATTEMPTS):
+            self._wait_turn(chat_id)
+            self.stats['requests'] += 1
+            try:
+                with REGISTRY.timer('notify.telegram'):
+                    response = self.session.post(self.url, json=payload, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                REGISTRY.record_failure('notify.telegram', e)
+                break
+            finally:
+                self._last_sent[chat_id] = time.monotonic()
+            if response.status_code == 429:
+                # Telegram 限流：依 parameters.retry_after 等待後重送
+                self.stats['throttled'] += 1
+                try:
+                    retry_after = float(response.json().get('parameters', {}).get('retry_after', 1))
+                except ValueError:
+                    retry_after = 1.0
+                time.sleep(retry_after)
+                continue
+            if response.ok:
+                self.stats['sent'] += 1
+                return True
+            REGISTRY.record_failure('notify.telegram', requests.HTTPError(f"{response.status_code} {response.text[:200]}"))
+            break
+        self.stats['failed'] += 1
+        return False
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """程序共用的派送器 (環境變數設定的 bot / 聊天室)，去重紀錄存於快取目錄"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            from fundamentals_cache import CACHE_ROOT
+            _dispatcher = AlertDispatcher(sent_path=os.path.join(CACHE_ROOT, SENT_FILE))
+        return _dispatcher
+
+
+def send_telegram_message(message):
+    """放進共用派送器的佇列 (不阻塞)；程序結束前呼叫 get_dispatcher().flush() 確保送出"""
+    return get_dispatcher().send(message)
+
+def format_top_message(df, top_n=10):
+    """把排序後的結果表整理成 Telegram 推播文字"""
+    lines = [f"🏆 *AI 嚴選現貨清單 Top {min(top_n, len(df))}*"]
+    for i, row in enumerate(df.head(top_n).to_dict('records'), 1):
+        lines.append(f"{i}. {row['代號']} {row['名稱']} | 評分 {row['AI綜合評分']} | 現價 {row['現價']:.2f} | 合理價 {row['合理價']}")
+    return "\n".join(lines)
+
+def format_alert(row):
+    """單檔警示文字 (format_results 的一列)"""
+    return (f"🔔 *{row['代號']} {row['名稱']}* 評分 {row['AI綜合評分']} | 現價 {row['現價']:.2f} | 合理價 {row['合理價']}\n"
+            f"ROIC {row['ROIC']} | FCF {row['FCF Yield']} | {row['亮點']}")
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from metrics import REGISTRY
+
+# --- 批次下載設定 ---
+PANEL_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+LONG_KEYS = ['ticker', 'date']  # 長表 (一列 = 一檔一天) 的鍵
+CHUNK_SIZE = 200  # 每次 yf.download 的檔數
+
+
+def _chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _split_fields(raw, chunk):
+    """把 yf.download 的結果拆成 {欄位: dates × tickers}"""
+    out = {}
+    if raw is None or raw.empty:
+        return out
+    if isinstance(raw.columns, pd.MultiIndex):
+        # group_by='column' -> 第一層為欄位, 第二層為代號
+        for field in PANEL_FIELDS:
+            if field in raw.columns.get_level_values(0):
+                out[field] = raw[field]
+    elif len(chunk) == 1:
+        # 舊版 yfinance 單檔下載為單層欄位
+        for field in PANEL_FIELDS:
+            if field in raw.columns:
+                out[field] = raw[[field]].set_axis(chunk, axis=1)
+    return out
+
+
+def download_price_panel(tickers, period="1y", interval="1d", chunk_size=CHUNK_SIZE, progress_callback=None, start=None):
+    """
+    批次下載日K，組成 dates × tickers 面板
+    start 有值時改抓 start 之後的資料 (增量更新用)，否則抓 period
+    回傳 dict: {'Open'/'High'/'Low'/'Close'/'Volume': DataFrame(index=日期, columns=代號)}
+    """
+    import yfinance as yf  # 延遲載入：離線資料來源用不到 yfinance
+
+    tickers = list(tickers)
+    window = {'start': start} if start is not None else {'period': period}
+    parts = {field: [] for field in PANEL_FIELDS}
+    done = 0
+    for chunk in _chunks(tickers, chunk_size):
+        try:
+            raw = yf.download(chunk, interval=interval, group_by='column', progress=False, threads=True, **window)
+            for field, frame in _split_fields(raw, chunk).items():
+                parts[field].append(frame)
+        except Exception as e:
+            REGISTRY.record_failure('fetch.price_history', e)
+        done += len(chunk)
+        if progress_callback: progress_callback(done, len(tickers))
+
+    panel = {}
+    for field in PANEL_FIELDS:
+        if parts[field]:
+            frame = pd.concat(parts[field], axis=1).sort_index()
+            panel[field] = frame.loc[:, ~frame.columns.duplicated()]
+        else:
+            panel[field] = pd.DataFrame()
+    return panel
+
+
+def slice_ticker(panel, ticker_symbol):
+    """從面板取出單檔 OHLCV (等同單檔 yf.download 的結果)"""
+    close = panel.get('Close')
+    if close is None or ticker_symbol not in close.columns:
+        return pd.DataFrame(columns=PANEL_FIELDS)
+    data = pd.DataFrame({
+        field: panel[field][ticker_symbol]
+        for field in PANEL_FIELDS if ticker_symbol in panel[field].columns
+    })
+    return data.dropna(subset=['Close'])
+
+
+def panel_to_long(panel):
+    """dates × tickers 面板 -> 長表 (ticker / date / OHLCV)，依代號、日期排列，去掉沒有收盤價的列 (整塊 numpy 轉換)"""
+    close = panel.get('Close')
+    if close is None or close.empty:
+        return pd.DataFrame({'ticker': pd.Series(dtype=object), 'date': pd.Series(dtype='datetime64[ns]'),
+                             **{field: pd.Series(dtype=np.float64) for field in PANEL_FIELDS}})
+    dates, tickers = close.index, close.columns
+    long = pd.DataFrame({
+        'ticker': np.repeat(np.asarray(tickers, dtype=object), len(dates)),
+        'date': np.tile(np.asarray(pd.DatetimeIndex(dates).tz_localize(None), dtype='datetime64[ns]'), len(tickers)),
+    })
+    for field in PANEL_FIELDS:
+        frame = panel.get(field)
+        if frame is None or frame.empty:
+            long[field] = np.nan
+        else:
+            # 欄優先 (order='F') 攤平：同一檔的日期連續
+            long[field] = frame.reindex(index=dates, columns=tickers).to_numpy(dtype=np.float64).ravel(order='F')
+    return long[~np.isnan(long['Close'].to_numpy())].reset_index(drop=True)
+
+
+def long_to_panel(long, tickers=None):
+    """長表 -> dates × tickers 面板；tickers 指定欄位順序 (沒有資料的代號不列出)"""
+    if long.empty:
+        return {field: pd.DataFrame() for field in PANEL_FIELDS}
+    wide = long.pivot(index='date', columns='ticker', values=PANEL_FIELDS)
+    present = set(wide['Close'].columns)
+    order = [t for t in tickers if t in present] if tickers is not None else wide['Close'].columns
+    return {field: wide[field].reindex(columns=order) for field in PANEL_FIELDS}
@@ -0,0 +1,257 @@
+import json
+import os
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from file_lock import FileLock
+from fundamentals_cache import provider_cache_dir
+from price_panel import LONG_KEYS, PANEL_FIELDS, long_to_panel, panel_to_long
+from providers import get_provider
+from metrics import REGISTRY
+
+# --- 日K資料庫設定 ---
+STORE_SUBDIR = 'prices'      # 位於各資料來源的快取目錄之下
+HISTORY_DAYS = 365          # 回傳面板的長度 (等同 period="1y")
+REWRITE_WINDOW_DAYS = 7     # 每次重抓最近 N 天比對 (盤中K棒、資料修正)
+MIN_REFRESH_SECONDS = 5 * 60
+ADJUST_TOLERANCE = 0.005    # 重疊日收盤價差超過 0.5% 視為除權息/分割調整，整檔重抓
+MAX_PARTS = 30              # 增量分段超過 N 個時合併成一個 (讀取時只開少數檔案)
+
+
+class PriceStore:
+    """
+    本地日K資料庫：全市場長表 (ticker / date / OHLCV) 分段存成 Parquet，_meta.json 記錄各檔最後日期與分段清單
+    - 再次掃描只抓最後日期之後的缺口 (含 rewrite window)；只有新K棒與內容有變動的K棒寫成一個新分段，既有檔案不改寫
+    - 重疊區間價格被調整 (分割/除權息還原) 時整檔重抓，新分段記為取代 (讀取時丟掉該檔較早分段的資料)
+    - 讀取時各分段依序疊加 (同一檔同一天以較新的分段為準)；分段超過 MAX_PARTS 時合併成一個
+    - 寫入 (update) 全程持有 store_dir/.lock 跨行程鎖：CLI 排程與 Streamlit 背景掃描不會配到同一個分段序號、
+      互相覆蓋 _meta.json 或合併掉對方正在用的分段
+    """
+
+    def __init__(self, store_dir=None, history_days=HISTORY_DAYS, rewrite_window_days=REWRITE_WINDOW_DAYS, provider=None):
+        self.provider = provider or get_provider()
+        store_dir = store_dir or os.path.join(provider_cache_dir(self.provider.name), STORE_SUBDIR)
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.history_days = history_days
+        self.rewrite_window_days = rewrite_window_days
+        self._meta_path = os.path.join(store_dir, '_meta.json')
+        self._lock_path = os.path.join(store_dir, '.lock')
+        self._meta_mtime = None
+        self._table = None      # (分段清單, 合併後的長表)
+        self.meta = self._load_meta()
+
+    # --- 中繼資料 ---
+
+    def _load_meta(self):
+        try:
+            self._meta_mtime = os.path.getmtime(self._meta_path)
+            with open(self._meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception:
+            return {'tickers': {}, 'parts': [], 'seq': 0}
+        return meta
+
+    def _save_meta(self):
+        tmp = self._meta_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path)
+        self._meta_mtime = os.path.getmtime(self._meta_path)
+
+    def _sync_meta(self):
+        """其他行程 (背景掃描) 寫入後重新讀取分段清單"""
+        try:
+            mtime = os.path.getmtime(self._meta_path)
+        except OSError:
+            return
+        if mtime != self._meta_mtime:
+            self.meta = self._load_meta()
+
+    def last_date(self, ticker):
+        info = self.meta['tickers'].get(ticker)
+        return pd.Timestamp(info['last_date']) if info else None
+
+    # --- 分段 ---
+
+    @staticmethod
+    def _normalize(long):
+        long = long.reindex(columns=LONG_KEYS + PANEL_FIELDS)
+        long['ticker'] = long['ticker'].astype(object)
+        long['date'] = pd.to_datetime(long['date']).astype('datetime64[ns]')
+        for field in PANEL_FIELDS:
+            long[field] = long[field].astype(np.float64)
+        return long
+
+    def _append_part(self, rows, replaced):
+        """新增一個分段 (只寫新資料，不動既有檔案)"""
+        self.meta['seq'] += 1
+        name = f"part-{self.meta['seq']:06d}.parquet"
+        path = os.path.join(self.store_dir, name)
+        with REGISTRY.timer('store.write'):
+            rows.to_parquet(path + '.tmp', index=False)
+            os.replace(path + '.tmp', path)
+        self.meta['parts'].append({'file': name, 'replaced': sorted(replaced)})
+
+    @staticmethod
+    def _overlay(table, rows, replaced):
+        """在長表上疊加一個分段：取代的代號先整檔移除，同一檔同一天以新分段為準"""
+        if replaced:
+            table = table[~table['ticker'].isin(replaced)]
+        if rows.empty:
+            return table
+        if table.empty:
+            return rows
+        merged = pd.concat([table, rows], ignore_index=True)
+        return merged.drop_duplicates(LONG_KEYS, keep='last').reset_index(drop=True)
+
+    def _read_table(self):
+        parts = tuple(part['file'] for part in self.meta['parts'])
+        if self._table is not None and self._table[0] == parts:
+            return self._table[1]
+        table = self._normalize(pd.DataFrame(columns=LONG_KEYS + PANEL_FIELDS))
+        with REGISTRY.timer('store.read'):
+            for part in self.meta['parts']:
+                rows = self._normalize(pd.read_parquet(os.path.join(self.store_dir, part['file'])))
+                table = self._overlay(table, rows, part['replaced'])
+        self._table = (parts, table)
+        return table
+
+    def table(self):
+        """合併後的長表 (ticker / date / OHLCV)；讀過的分段留在記憶體，分段清單變動才重讀"""
+        self._sync_meta()
+        try:
+            return self._read_table()
+        except FileNotFoundError:
+            # 讀到一半被另一個行程合併掉：重讀分段清單再試一次
+            self.meta = self._load_meta()
+            return self._read_table()
+
+    def _compact(self, table):
+        """分段太多時把目前的長表寫成單一分段，再刪掉舊分段"""
+        old = [part['file'] for part in self.meta['parts']]
+        self.meta['parts'] = []
+        self._append_part(table, replaced=[])
+        self._save_meta()
+        for name in old:
+            try:
+                os.remove(os.path.join(self.store_dir, name))
+            except OSError:
+                pass
+        self._table = ((self.meta['parts'][0]['file'],), table)
+
+    # --- 讀寫 ---
+
+    def load(self, ticker):
+        """單檔日K DataFrame(index=日期, columns=OHLCV)；沒有資料時為空表"""
+        table = self.table()
+        rows = table[table['ticker'].to_numpy() == ticker]
+        if rows.empty:
+            return pd.DataFrame(columns=PANEL_FIELDS)
+        return rows.set_index('date')[PANEL_FIELDS].sort_index().rename_axis(None)
+
+    @staticmethod
+    def _adjusted(old, fresh):
+        """每檔重疊區間第一天的收盤價不同 -> 歷史價格已被還原調整；回傳代號集合"""
+        overlap = fresh.merge(old, on=LONG_KEYS, suffixes=('', '_old'))
+        if overlap.empty:
+            return set()
+        first = overlap.sort_values(LONG_KEYS, kind='stable').drop_duplicates('ticker')
+        before, after = first['Close_old'].to_numpy(), first['Close'].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            moved = (before > 0) & (np.abs(after / before - 1) > ADJUST_TOLERANCE)
+        return set(first['ticker'][moved])
+
+    @staticmethod
+    def _changed(old, fresh):
+        """fresh 中的新K棒與內容有變動的K棒 (NaN 視為相等)"""
+        merged = fresh.merge(old, on=LONG_KEYS, how='left', suffixes=('', '_old'))
+        same = np.ones(len(merged), dtype=bool)
+        for field in PANEL_FIELDS:
+            a, b = merged[field].to_numpy(), merged[f'{field}_old'].to_numpy()
+            same &= (a == b) | (np.isnan(a) & np.isnan(b))
+        return fresh[~same]
+
+    def update(self, tickers, full_refresh=False, progress_callback=None):
+        """
+        增量更新並回傳最近 history_days 的 dates × tickers 面板
+        full_refresh=True: 忽略本地資料，全部重抓
+        """
+        # 鎖住後重讀中繼資料：另一個行程剛寫完的分段與最後日期都要看到 (剛更新過的標的也就不必再抓)
+        with FileLock(self._lock_path):
+            self.meta = self._load_meta()
+            return self._update(tickers, full_refresh, progress_callback)
+
+    def _update(self, tickers, full_refresh, progress_callback):
+        now = time.time()
+        known = self.meta['tickers']
+        need_full = []
+        by_start = {}
+        for ticker in tickers:
+            info = None if full_refresh else known.get(ticker)
+            if info is None:
+                REGISTRY.cache_event('store.prices', False)
+                need_full.append(ticker)
+                continue
+            fresh_enough = now - info['updated_at'] < MIN_REFRESH_SECONDS
+            REGISTRY.cache_event('store.prices', fresh_enough)
+            if fresh_enough:
+                continue
+            start = self.last_date(ticker) - timedelta(days=self.rewrite_window_days)
+            by_start.setdefault(start.strftime('%Y-%m-%d'), []).append(ticker)
+
+        table = self.table()
+        total = len(need_full) + sum(len(group) for group in by_start.values())
+        fetched = 0
+
+        def on_progress(done, _):
+            if progress_callback: progress_callback(fetched + done, total)
+
+        # 缺口更新：最後日期相同的標的一起批次下載
+        gaps = []
+        for start, group in by_start.items():
+            with REGISTRY.timer('fetch.price_history'):
+                panel = self.provider.get_price_history(group, start=start, progress_callback=on_progress)
+            fetched += len(group)
+            gaps.append(panel_to_long(panel))
+        gap = self._normalize(pd.concat(gaps, ignore_index=True)) if gaps else self._normalize(panel_to_long({}))
+        if not gap.empty:
+            recent = table[table['date'] >= gap['date'].min()]
+            adjusted = self._adjusted(recent, gap)
+            if adjusted:
+                need_full.extend(sorted(adjusted))
+                gap = gap[~gap['ticker'].isin(adjusted)]
+            rows = self._changed(recent, gap)
+        else:
+            rows = gap
+
+        # 新標的或價格被調整的標的：整段重抓
+        full = self._normalize(panel_to_long({}))
+        if need_full:
+            total = fetched + len(need_full)
+            with REGISTRY.timer('fetch.price_history'):
+                panel = self.provider.get_price_history(need_full, period='1y', progress_callback=on_progress)
+            full = self._normalize(panel_to_long(panel))
+
+        replaced = sorted(set(full['ticker']) & set(table['ticker']))
+        rows = pd.concat([rows, full], ignore_index=True) if not full.empty else rows
+        if not rows.empty or replaced:
+            self._append_part(rows, replaced)
+            table = self._overlay(table, rows, replaced)
+            self._table = (tuple(part['file'] for part in self.meta['parts']), table)
+
+        # 有抓到資料的標的才更新最後日期 (沒資料的下次再試)
+        last = pd.concat([gap, full], ignore_index=True).groupby('ticker')['date'].max()
+        for ticker, day in last.items():
+            known[ticker] = {'last_date': str(day.date()), 'updated_at': now}
+        if len(self.meta['parts']) > MAX_PARTS:
+            self._compact(table)
+        else:
+            self._save_meta()
+
+        cutoff = pd.Timestamp.today().normalize() - timedelta(days=self.history_days)
+        wanted = table[table['ticker'].isin(tickers) & (table['date'] >= cutoff)]
+        return long_to_panel(wanted, tickers)
@@ -0,0 +1,230 @@
+import os
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from fetch_engine import RateLimited
+from metrics import REGISTRY
+from price_panel import PANEL_FIELDS
+
+# --- 資料來源設定 ---
+DEFAULT_PROVIDER = os.environ.get('FACTOR_AI_PROVIDER', 'yahoo')
+STATEMENT_KINDS = ['info', 'financials', 'balance_sheet', 'cashflow']
+MARKET_INDEX = "^TWII"
+UNIVERSE_FIELDS = ['code', 'suffix', 'market', 'group', 'name']
+
+
+class DataProvider:
+    """
+    資料來源介面：股票池、日K、財報、即時報價
+    掃描流程只透過這個介面取資料，方便離線測試與效能量測
+    """
+    name = 'base'
+
+    def get_universe(self):
+        """回傳 (tickers, name_map)"""
+        index = self.get_universe_index()
+        return list(index.index), dict(index['name'])
+
+    def get_universe_index(self):
+        """股票池索引 DataFrame(index=代號, columns=UNIVERSE_FIELDS)；建置較慢，由 universe.load_universe 存檔沿用"""
+        raise NotImplementedError
+
+    def get_price_history(self, tickers, period="1y", start=None, progress_callback=None):
+        """回傳 dates × tickers 面板 {'Open'/'High'/'Low'/'Close'/'Volume': DataFrame}"""
+        raise NotImplementedError
+
+    def get_statement(self, ticker_symbol, kind):
+        """kind: info / financials / balance_sheet / cashflow；失敗時拋出例外"""
+        raise NotImplementedError
+
+    def get_quotes(self, tickers):
+        """即時報價 (面板沒有收盤價時的備援)，回傳 {代號: 現價}"""
+        return {}
+
+    def reset_session(self):
+        """每次掃描開始時呼叫：丟掉上次掃描留下的物件 (資料來源為程序共用，不能讓它們活到重啟)"""
+
+
+def parse_twstock_realtime(entry):
+    """twstock 即時報價：取最新成交價，無成交時取最佳買價"""
+    if not entry or not entry.get('success', True):
+        return None
+    try:
+        rt_price = entry['realtime']['latest_trade_price']
+        if rt_price and rt_price != '-' and float(rt_price) > 0:
+            return float(rt_price)
+        best_bid = entry['realtime']['best_bid_price'][0]
+        if best_bid and best_bid != '-' and float(best_bid) > 0:
+            return float(best_bid)
+    except: pass
+    return None
+
+
+class YahooProvider(DataProvider):
+    """yfinance (日K/財報) + twstock (股票池/即時報價)"""
+    name = 'yahoo'
+    TWSTOCK_BATCH_SIZE = 50  # twstock.realtime.get 每次查詢的檔數
+
+    def __init__(self):
+        self._tickers = {}
+        self._lock = threading.Lock()
+
+    def ticker(self, symbol):
+        """同一次掃描內每個代號共用一個 yf.Ticker 物件 (掃描開始時由 reset_session 清空)"""
+        import yfinance as yf
+        with self._lock:
+            if symbol not in self._tickers:
+                self._tickers[symbol] = yf.Ticker(symbol)
+            return self._tickers[symbol]
+
+    def reset_session(self):
+        # yf.Ticker 會把 .info / 財報存在物件上；留著的話快取過期或強制重抓仍拿到第一次的資料
+        with self._lock:
+            self._tickers = {}
+
+    def get_universe_index(self):
+        import twstock
+        rows = {}
+        for code, info in twstock.codes.items():
+            if info.type == '股票':
+                suffix = ".TW" if info.market == '上市' else ".TWO"
+                rows[code + suffix] = (code, suffix, info.market, info.group, info.name)
+        return pd.DataFrame.from_dict(rows, orient='index', columns=UNIVERSE_FIELDS)
+
+    def get_price_history(self, tickers, period="1y", start=None, progress_callback=None):
+        from price_panel import download_price_panel
+        return download_price_panel(tickers, period=period, start=start, progress_callback=progress_callback)
+
+    def get_statement(self, ticker_symbol, kind):
+        return getattr(self.ticker(ticker_symbol), kind)
+
+    def get_quotes(self, tickers):
+        import twstock
+        quotes = {}
+        code_to_symbol = {s.split('.')[0]: s for s in tickers}
+        codes = list(code_to_symbol)
+        for i in range(0, len(codes), self.TWSTOCK_BATCH_SIZE):
+            batch = codes[i:i + self.TWSTOCK_BATCH_SIZE]
+            try:
+                realtime = twstock.realtime.get(batch)
+            except Exception as e:
+                REGISTRY.record_failure('fetch.realtime_quotes', e)
+                continue
+            if not realtime or not realtime.get('success'):
+                continue
+            for code in batch:
+                price = parse_twstock_realtime(realtime.get(code))
+                if price is not None:
+                    quotes[code_to_symbol[code]] = price
+        return quotes
+
+
+class SyntheticProvider(DataProvider):
+    """
+    離線合成資料 (同一 seed 結果完全相同)
+    latency: 每次請求的延遲秒數；latency_jitter: 額外隨機延遲上限
+    rate_limit_rate: 財報請求回應 429 的機率
+    """
+    name = 'synthetic'
+
+    def __init__(self, n_tickers=2000, n_days=250, latency=0.0, latency_jitter=0.0, rate_limit_rate=0.0, seed=0):
+        self.n_tickers = n_tickers
+        self.n_days = n_days
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_days)
+
+    def _sleep(self):
+        with self._rng_lock:
+            delay = self.latency + self._rng.uniform(0, self.latency_jitter)
+            throttled = self._rng.random() < self.rate_limit_rate
+        if delay > 0:
+            time.sleep(delay)
+        return throttled
+
+    def _ticker_rng(self, ticker_symbol, salt=0):
+        return np.random.default_rng([self.seed, zlib.crc32(ticker_symbol.encode()), salt])
+
+    GROUPS = ['半導體業', '電子零組件業', '電腦及週邊設備業', '金融保險業', '航運業', '塑膠工業', '生技醫療業', '建材營造業']
+
+    def get_universe_index(self):
+        rows = {}
+        for i in range(self.n_tickers):
+            code, suffix = str(1101 + i), '.TW' if i % 3 else '.TWO'
+            rows[code + suffix] = (code, suffix, '上市' if i % 3 else '上櫃', self.GROUPS[i % len(self.GROUPS)], f"合成{code}")
+        return pd.DataFrame.from_dict(rows, orient='index', columns=UNIVERSE_FIELDS)
+
+    def _bars(self, ticker_symbol):
+        rng = self._ticker_rng(ticker_symbol)
+        close = rng.uniform(20, 500) * np.exp(np.cumsum(rng.normal(0.0005, 0.02, self.n_days)))
+        spread = np.abs(rng.normal(0, 0.01, self.n_days))
+        return pd.DataFrame({
+            'Open': close * (1 + rng.normal(0, 0.005, self.n_days)),
+            'High': close * (1 + spread),
+            'Low': close * (1 - spread),
+            'Close': close,
+            'Volume': rng.integers(0, 20000, self.n_days).astype(float) * 1000,
+        }, index=self.dates)
+
+    def get_price_history(self, tickers, period="1y", start=None, progress_callback=None):
+        self._sleep()
+        tickers = list(tickers)
+        frames = {t: self._bars(t) for t in tickers}
+        if start is not None:
+            frames = {t: df[df.index >= pd.Timestamp(start)] for t, df in frames.items()}
+        if progress_callback: progress_callback(len(tickers), len(tickers))
+        return {field: pd.DataFrame({t: df[field] for t, df in frames.items()}) for field in PANEL_FIELDS}
+
+    def get_statement(self, ticker_symbol, kind):
+        if self._sleep():
+            raise RateLimited("429 Too Many Requests (synthetic)")
+        rng = self._ticker_rng(ticker_symbol, 1)
+        equity, debt, cash = rng.uniform(1e9, 1e11), rng.uniform(0, 5e10), rng.uniform(1e8, 1e10)
+        revenue = rng.uniform(1e9, 2e11, 2)
+        ebit = revenue[0] * rng.uniform(-0.05, 0.35)
+        market_cap = equity * rng.uniform(0.5, 4)
+        fcf = market_cap * rng.uniform(-0.05, 0.3)
+        columns = pd.to_datetime(['2025-12-31', '2024-12-31'])
+        if kind == 'info':
+            return {
+                'marketCap': market_cap, 'priceToBook': rng.uniform(0.5, 5), 'pegRatio': rng.uniform(0.3, 3),
+                'dividendRate': rng.uniform(0, 10), 'returnOnEquity': rng.uniform(-0.1, 0.4),
+                'returnOnAssets': rng.uniform(-0.05, 0.2), 'trailingEps': rng.uniform(-2, 30),
+                'bookValue': rng.uniform(10, 200), 'revenueGrowth': rng.uniform(-0.3, 0.5),
+            }
+        if kind == 'financials':
+            return pd.DataFrame({columns[0]: [ebit, ebit * 0.8, revenue[0]], columns[1]: [ebit, ebit * 0.8, revenue[1]]},
+                                index=['EBIT', 'Net Income', 'Total Revenue'])
+        if kind == 'balance_sheet':
+            return pd.DataFrame({columns[0]: [debt, equity, cash, equity + debt, rng.uniform(0, 1e9)]},
+                                index=['Total Debt', 'Stockholders Equity', 'Cash And Cash Equivalents', 'Total Assets', 'Contract Liabilities'])
+        if kind == 'cashflow':
+            return pd.DataFrame({columns[0]: [fcf]}, index=['Free Cash Flow'])
+        raise KeyError(kind)
+
+
+PROVIDERS = {
+    YahooProvider.name: YahooProvider,
+    SyntheticProvider.name: SyntheticProvider,
+}
+
+_default = None
+
+
+def get_provider(name=None, **kwargs):
+    """依名稱建立資料來源；不帶參數時回傳共用的預設來源 (環境變數 FACTOR_AI_PROVIDER)"""
+    global _default
+    if name is None and not kwargs:
+        if _default is None:
+            _default = PROVIDERS[DEFAULT_PROVIDER]()
+        return _default
+    return PROVIDERS[name or DEFAULT_PROVIDER](**kwargs)
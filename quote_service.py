@@ -0,0 +1,50 @@
+from metrics import REGISTRY
+
+# --- 報價服務 ---
+
+
+class QuoteService:
+    """
+    報價服務
+    - 優先使用日K面板的最後收盤價 (不再逐檔 history(period="5d"))
+    - 面板沒有的標的，交由資料來源批次查即時報價 (twstock) 補上
+    """
+
+    def __init__(self, price_panel=None, cache=None, provider=None):
+        from providers import get_provider
+        self.price_panel = price_panel or {}
+        self.cache = cache
+        self.provider = provider or get_provider()
+
+    def last_close(self, symbol):
+        close = self.price_panel.get('Close')
+        if close is None or symbol not in close.columns:
+            return None
+        series = close[symbol].dropna()
+        return float(series.iloc[-1]) if len(series) else None
+
+    def get_quotes(self, symbols):
+        """回傳 {代號: 現價}；取不到報價的代號不會出現在結果中"""
+        quotes = {}
+        missing = []
+        for symbol in symbols:
+            price = self.last_close(symbol)
+            REGISTRY.cache_event('quotes.panel', price is not None and price > 0)
+            if (price is None or price <= 0) and self.cache is not None:
+                price = self.cache.get(symbol, 'quote')
+            if price is not None and price > 0:
+                quotes[symbol] = price
+            else:
+                missing.append(symbol)
+
+        fallback = {}
+        if missing:
+            with REGISTRY.timer('fetch.realtime_quotes'):
+                fallback = self.provider.get_quotes(missing)
+        for symbol, price in fallback.items():
+            if self.cache is not None: self.cache.put(symbol, 'quote', price)
+        quotes.update(fallback)
+        return quotes
+
+    def get_price(self, symbol):
+        return self.get_quotes([symbol]).get(symbol)
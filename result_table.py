@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# --- 結果表格式 ---
+RESULT_SCHEMA = 3  # 評分結果格式版本 (快取 / 日誌中的舊格式不沿用)
+
+# 亮點 bit flags
+FLAG_INTENT = 1           # 💎主力軌跡
+FLAG_LOW_VOL = 2          # 🛡️低波動
+FLAG_VALUE_CREATION = 4   # 價值創造(ROIC>WACC)
+FLAG_HIGH_ROIC = 8        # 高資本效率
+FLAG_SUPER_FCF = 16       # 超高現金流 (沒有此旗標為高現金流)
+
+CGO_STATUSES = ["", "籌碼獲利🔥", "成本之上✅", "套牢壓力🥶"]
+
+TEXT_COLUMNS = ["代號", "名稱"]
+METRIC_COLUMNS = [
+    "現價", "合理價", "AI綜合評分", "意圖因子",
+    "ROIC", "FCF Yield", "WACC", "EPS", "ROE", "ROI(ROA)", "合約負債",
+    "年營收成長", "季營收成長", "每股淨值", "總負債", "本期淨利",
+    "Beta", "區間報酬",
+]
+FLAGS_COLUMN = "亮點旗標"
+RESULT_COLUMNS = TEXT_COLUMNS + METRIC_COLUMNS + ["CGO", FLAGS_COLUMN]
+
+# 顯示用欄位 (與舊版字串結果相同)
+DISPLAY_COLUMNS = [
+    "代號", "名稱", "現價", "合理價", "AI綜合評分", "AI綜合建議", "意圖因子",
+    "ROIC", "FCF Yield", "WACC", "CGO", "EPS", "ROE", "ROI(ROA)", "合約負債",
+    "年營收成長", "季營收成長", "每股淨值", "總負債", "本期淨利", "亮點",
+]
+
+
+def build_table(records):
+    """
+    評分結果 (score_ticker 回傳的 dict list) -> 型別化欄式表
+    指標 float32 (None 為 NaN)、CGO categorical、亮點為 uint8 bit flags；可直接 to_parquet / pyarrow.Table.from_pandas
+    """
+    return typed_table(pd.DataFrame.from_records(records, columns=RESULT_COLUMNS))
+
+
+def typed_table(df):
+    """套用結果表的欄位型別 (欄位須為 RESULT_COLUMNS)"""
+    df = df[RESULT_COLUMNS].copy()
+    df[METRIC_COLUMNS] = df[METRIC_COLUMNS].astype(np.float32)
+    df['CGO'] = pd.Categorical(df['CGO'].fillna(''), categories=CGO_STATUSES)
+    df[FLAGS_COLUMN] = df[FLAGS_COLUMN].fillna(0).astype(np.uint8)
+    return df
+
+
+def _missing(x):
+    # 沿用原本的真假值判斷：None / NaN / 0 都顯示 N/A
+    return x is None or x != x or x == 0
+
+
+def _pct(x):
+    return "N/A" if _missing(x) else f"{x:.1%}"
+
+
+def _num(x):
+    return "N/A" if _missing(x) else f"{x:.2f}"
+
+
+def _large(x):
+    # 簡化財報數據為易讀格式 (單位: 億)
+    return "N/A" if _missing(x) else f"{x/1e8:.1f}億"
+
+
+def format_row(r):
+    """單列數值結果 -> 顯示用文字 (含亮點與 AI綜合建議)"""
+    flags = int(r[FLAGS_COLUMN])
+    roic, fcf_yield, wacc = float(r['ROIC']), float(r['FCF Yield']), float(r['WACC'])
+    s_return = float(r['區間報酬'])
+    cgo_status = r['CGO'] if isinstance(r['CGO'], str) else ""
+
+    factors = []
+    if flags & FLAG_INTENT: factors.append("💎主力軌跡")
+    if flags & FLAG_LOW_VOL: factors.append("🛡️低波動")
+    if flags & FLAG_VALUE_CREATION:
+        factors.append("價值創造(ROIC>WACC)")
+        inst_view = f"✅價值創造 (ROIC {roic:.1%} > WACC {wacc:.1%})"
+    elif flags & FLAG_HIGH_ROIC:
+        factors.append(f"高資本效率(ROIC {roic:.1%})")
+        inst_view = "✅高資本效率"
+    else:
+        inst_view = "資本效率尚可"
+    factors.append(f"超高現金流({fcf_yield:.1%})" if flags & FLAG_SUPER_FCF else f"高現金流({fcf_yield:.1%})")
+
+    path_diagnosis = f"趨勢向上 (+{s_return:.1%})" if s_return > 0 else f"趨勢修正 ({s_return:.1%})"
+    final_advice = (
+        f"📊 **AI 深度解析**：\n"
+        f"1. **品質**：{inst_view} | ROE {_pct(r['ROE'])} | EPS {_num(r['EPS'])}\n"
+        f"2. **估值**：FCF Yield {fcf_yield:.1%} (已過濾 FCF < 10%)\n"
+        f"3. **技術**：{path_diagnosis} | Beta {float(r['Beta']):.2f} | 站穩季線\n"
+        f"4. **風險**：CGO {cgo_status} | 合約負債 {_large(r['合約負債'])}"
+    )
+    return {
+        "代號": r['代號'],
+        "名稱": r['名稱'],
+        "現價": float(r['現價']),
+        "合理價": round(float(r['合理價']), 2),
+        "AI綜合評分": round(float(r['AI綜合評分']), 1),
+        "AI綜合建議": final_advice,
+        "意圖因子": round(float(r['意圖因子']), 2),
+        "ROIC": f"{roic:.1%}",
+        "FCF Yield": f"{fcf_yield:.1%}",
+        "WACC": _pct(wacc),
+        "CGO": cgo_status,
+        "EPS": _num(r['EPS']),
+        "ROE": _pct(r['ROE']),
+        "ROI(ROA)": _pct(r['ROI(ROA)']),
+        "合約負債": _large(r['合約負債']),
+        "年營收成長": _pct(r['年營收成長']),
+        "季營收成長": _pct(r['季營收成長']),
+        "每股淨值": _num(r['每股淨值']),
+        "總負債": _large(r['總負債']),
+        "本期淨利": _large(r['本期淨利']),
+        "亮點": " | ".join(factors),
+    }
+
+
+def format_results(df):
+    """只替要顯示的列產生文字欄位 (先排序、取前 N 名再呼叫)"""
+    return pd.DataFrame([format_row(r) for r in df.to_dict('records')], columns=DISPLAY_COLUMNS)
@@ -0,0 +1,160 @@
+import glob
+import hashlib
+import itertools
+import json
+import os
+import time
+
+from file_lock import FileLock
+
+# --- 掃描日誌設定 ---
+JOURNAL_SUBDIR = 'journals'   # 位於各資料來源的快取目錄之下
+JOURNAL_TTL_DAYS = 7          # 超過 N 天的日誌直接刪除
+
+# 每檔的結果
+SCORED = 'scored'       # 通過所有濾網並評分
+FILTERED = 'filtered'   # 被某條規則淘汰 (rule 記錄是哪一條)
+FAILED = 'failed'       # 抓取失敗 (rule 記錄錯誤分類)
+
+
+def scan_key(provider_name, tickers, day=None):
+    """同一資料來源、同一天、同一股票池視為同一輪掃描，中斷後可續跑"""
+    day = day or time.strftime('%Y%m%d')
+    digest = hashlib.sha1("\n".join(sorted(tickers)).encode()).hexdigest()[:10]
+    return f"{provider_name}_{day}_{digest}"
+
+
+def _read_lines(path):
+    """逐行讀 JSONL；行程中斷時最後一行可能只寫一半，略過"""
+    lines = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                lines.append(json.loads(line))
+            except ValueError:
+                continue
+    return lines
+
+
+class ScanJournal:
+    """
+    掃描結果日誌：每檔的結果 (scored / filtered / failed) 逐行附加寫入 <scan_id>.jsonl
+    - 第一行為表頭 (scan_id / key / 建立時間 / 檔數)，結束時附加 {"done": ...}
+    - 同 key 尚未結束的日誌在下次掃描時續跑，只處理還沒有結果的標的
+    - 已結束或被放棄的日誌壓縮為只剩每檔狀態 (去掉評分列與財報指標)，超過 JOURNAL_TTL_DAYS 刪除
+    - 開啟期間持有 <scan_id>.lock 跨行程鎖：CLI 排程與 UI 背景掃描同時執行時，另一方不會續寫或壓縮正在寫的日誌
+    """
+
+    def __init__(self, path, header, outcomes=None, lock=None):
+        self.path = path
+        self.header = header
+        self.scan_id = header['scan_id']
+        self.outcomes = outcomes or {}
+        self.resumed = len(self.outcomes)
+        self._lock = lock
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @classmethod
+    def open(cls, journal_dir, key, n_tickers, resume=True, schema=None):
+        """
+        找同 key、同結果格式 (schema) 未結束的日誌續跑，沒有就新開一份；順便壓縮 / 清除過期日誌
+        鎖被其他行程持有的日誌 (正在掃描) 一律跳過，不續跑也不壓縮
+        """
+        os.makedirs(journal_dir, exist_ok=True)
+        expire_journals(journal_dir)
+        pending = None
+        for path in sorted(glob.glob(os.path.join(journal_dir, '*.jsonl'))):
+            lines = _read_lines(path)
+            if not lines or lines[-1].get('done'):
+                continue
+            lock = FileLock(_lock_path(path))
+            if not lock.acquire(blocking=False):
+                continue
+            lines = _read_lines(path)  # 取得鎖後重讀：持有者可能剛結束
+            if lines[-1].get('done'):
+                lock.release()
+            elif resume and pending is None and lines[0].get('key') == key and lines[0].get('schema') == schema:
+                pending = (path, lines, lock)
+            else:
+                _compact(path, lines, reason='abandoned')
+                lock.release()
+
+        if pending:
+            path, lines, lock = pending
+            outcomes = {line['ticker']: line for line in lines[1:] if 'ticker' in line}
+            return cls(path, lines[0], outcomes, lock)
+
+        # 先鎖再以獨占模式建檔：其他掃描看到內容時一定已經上鎖；同一秒開始的掃描依序加上 _1、_2 …
+        stamp = f"{key}_{time.strftime('%H%M%S')}"
+        for n in itertools.count():
+            scan_id = f"{stamp}_{n}" if n else stamp
+            path = os.path.join(journal_dir, f"{scan_id}.jsonl")
+            lock = FileLock(_lock_path(path))
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                f = open(path, 'x', encoding='utf-8')
+            except FileExistsError:
+                lock.release()
+                continue
+            break
+        header = {'scan_id': scan_id, 'key': key, 'schema': schema, 'created_at': time.time(), 'tickers': n_tickers}
+        with f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        return cls(path, header, lock=lock)
+
+    def record(self, ticker, status, stage, rule=None, row=None, metrics=None):
+        entry = {'ticker': ticker, 'status': status, 'stage': stage, 'rule': rule}
+        if row is not None:
+            entry['row'] = row
+        if metrics is not None:
+            entry['metrics'] = metrics
+        self.outcomes[ticker] = entry
+        # 每筆立即 flush：行程被砍掉時最多遺失最後一筆
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=float) + "\n")
+        self._file.flush()
+        return entry
+
+    def finish(self):
+        """標記完成並壓縮 (已完成的掃描不會再續跑，評分列內容不必保留)；壓縮完才釋放鎖"""
+        self._file.close()
+        _compact(self.path, [self.header, *self.outcomes.values()], reason='done')
+        self._release()
+
+    def close(self):
+        self._file.close()
+        self._release()
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+
+
+def _lock_path(path):
+    return os.path.splitext(path)[0] + '.lock'
+
+
+def _compact(path, lines, reason):
+    header, entries = lines[0], {}
+    for line in lines[1:]:
+        if 'ticker' in line:
+            entries[line['ticker']] = {k: line[k] for k in ('ticker', 'status', 'stage', 'rule')}
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for entry in entries.values():
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.write(json.dumps({'done': reason, 'finished_at': time.time()}) + "\n")
+    os.replace(tmp, path)
+
+
+def expire_journals(journal_dir, ttl_days=JOURNAL_TTL_DAYS):
+    cutoff = time.time() - ttl_days * 86400
+    paths = glob.glob(os.path.join(journal_dir, '*.jsonl')) + glob.glob(os.path.join(journal_dir, '*.lock'))
+    for path in paths:
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            continue
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+# --- 背景掃描排程設定 ---
+SCAN_INTERVAL_SEC = float(os.environ.get('FACTOR_AI_SCAN_INTERVAL', 0))  # 0 = 不定時掃描，只在有人要求時掃描
+LIVE_TOP_N = 100  # 掃描途中即時可看的前 N 名
+
+
+class ScanScheduler:
+    """
+    全程序共用的掃描排程：同一時間只跑一次全市場掃描，結果存成有版本號的快照
+    - 所有 session 讀同一份最新快照；掃描進行中再按按鈕只會加入觀看進度，不會另起一輪
+    - 快照為 dict: version / taken_at / started_at / elapsed_sec / force_refresh / scope (子股票池條件) / results (數值結果表)
+      / stage_reports / screen_table (全市場原始因子，供 screener 即時重新篩選)
+    - 掃描在背景執行緒執行，session 關閉或重新整理都不會中斷
+    - 掃描途中以 Top-K heap 維護目前的前 top_n 名 (live_results)，不必等整輪結束
+    """
+
+    def __init__(self, scan_fn=None, top_n=LIVE_TOP_N):
+        self._scan_fn = scan_fn
+        self.top_n = top_n
+        self._live = None
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._thread = None
+        self._schedule_thread = None
+        self._snapshot = None
+        self._version = 0
+        self._progress = None
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def request_scan(self, force_refresh=False, scope=None):
+        """
+        要求掃描；已有掃描在跑時回傳 False (呼叫端改為訂閱進行中的掃描)
+        scope: 只掃描子股票池 (見 universe.select_universe)，None 為全市場
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._progress = {'stage': None, 'done': 0, 'total': 0, 'started_at': time.time(), 'found': 0}
+            self._live = self._new_top_k()
+            self._thread = threading.Thread(target=self._run, args=(force_refresh, scope), name='factor-ai-scan', daemon=True)
+            self._thread.start()
+            return True
+
+    def _new_top_k(self):
+        from scanner import TopK
+        return TopK(self.top_n)
+
+    @staticmethod
+    def _to_table(results):
+        from result_table import build_table
+        return build_table(results)
+
+    @staticmethod
+    def _to_screen_table(factors):
+        from screener import build_screen_table
+        return build_screen_table(factors) if factors else None
+
+    def _run(self, force_refresh, scope=None):
+        scan_fn = self._scan_fn
+        if scan_fn is None:
+            from scanner import scan_market
+            scan_fn = scan_market
+
+        def on_progress(stage, done, total):
+            with self._lock:
+                self._progress.update(stage=stage, done=done, total=total)
+
+        def on_result(row):
+            with self._lock:
+                self._live.push(row)
+                self._progress['found'] += 1
+
+        started = self._progress['started_at']
+        factors = {}
+        try:
+            results, stage_reports = scan_fn(force_refresh=force_refresh, progress_callback=on_progress,
+                                             result_callback=on_result, factors=factors, scope=scope)
+            error = None
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            if error is None:
+                # 掃描失敗時保留上一版快照
+                self._version += 1
+                self._snapshot = {
+                    'version': self._version,
+                    'taken_at': time.time(),
+                    'started_at': started,
+                    'elapsed_sec': round(time.time() - started, 1),
+                    'force_refresh': force_refresh,
+                    'scope': scope,
+                    'results': self._to_table(results),
+                    'stage_reports': stage_reports,
+                    'screen_table': self._to_screen_table(factors),
+                }
+            self.last_error = error
+            self._progress = None
+            self._live = None
+            self._finished.notify_all()
+
+    def latest(self):
+        """最新一版快照；尚未掃描過時為 None"""
+        with self._lock:
+            return self._snapshot
+
+    def progress(self):
+        """進行中掃描的進度 {'stage', 'done', 'total', 'started_at', 'found'}；沒有在掃描時為 None"""
+        with self._lock:
+            return dict(self._progress) if self._progress else None
+
+    def live_results(self):
+        """進行中掃描目前的前 top_n 名 (由高到低)；沒有在掃描時為 None"""
+        with self._lock:
+            return self._live.rows() if self._live is not None else None
+
+    def wait(self, timeout=None):
+        """等待進行中的掃描結束，回傳最新快照"""
+        with self._lock:
+            self._finished.wait_for(lambda: self._progress is None, timeout)
+            return self._snapshot
+
+    def start_schedule(self, interval_sec=SCAN_INTERVAL_SEC):
+        """每 interval_sec 秒自動掃描一次 (已有掃描在跑則跳過該輪)"""
+        if interval_sec <= 0 or self._schedule_thread is not None:
+            return
+
+        def loop():
+            while True:
+                self.request_scan()
+                time.sleep(interval_sec)
+
+        self._schedule_thread = threading.Thread(target=loop, name='factor-ai-scan-schedule', daemon=True)
+        self._schedule_thread.start()
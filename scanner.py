@@ -0,0 +1,648 @@
+import hashlib
+import heapq
+import itertools
+import math
+import os
+from collections import Counter
+from types import SimpleNamespace
+import pandas as pd
+import numpy as np
+from providers import MARKET_INDEX, STATEMENT_KINDS, get_provider
+from quote_service import QuoteService
+from fetch_engine import FetchEngine, NoData
+from fundamentals_cache import payload_digest
+from metrics import REGISTRY, timed
+from factor_engine import FACTOR_COLUMNS, TRADING_DAYS, compute_factor_table
+from scan_journal import FAILED, FILTERED, SCORED
+from result_table import (FLAG_HIGH_ROIC, FLAG_INTENT, FLAG_LOW_VOL, FLAG_SUPER_FCF, FLAG_VALUE_CREATION, FLAGS_COLUMN,
+                          RESULT_SCHEMA, build_table)
+
+# --- 全局參數 ---
+RF = 0.015  # 無風險利率
+MRP = 0.055 # 市場風險溢酬
+G_GROWTH = 0.02 
+COST_OF_DEBT_NET = 0.022 # 稅後債務成本
+
+# --- 核心功能函數 ---
+
+def load_market_returns(price_store):
+    """大盤 (^TWII) 日報酬；日K同樣走本地資料庫，只補抓缺口"""
+    panel = price_store.update([MARKET_INDEX])
+    close = panel['Close'][MARKET_INDEX].dropna()
+    return close.pct_change().dropna()
+
+@timed('compute.fundamentals')
+def get_financial_metrics_deep(ticker_obj):
+    """
+    【V9.9 大戶法人旗艦版】
+    新增提取: ROI(ROA), ROE, EPS, 淨利, 總資產, 總負債, 合約負債
+    新增提取: 年營收成長率, 季營收成長率
+    """
+    metrics = {
+        'roic': None,
+        'fcf_yield': None,
+        'peg': None,
+        'pb': None,
+        'div_rate': None,
+        'total_debt': 0,      
+        'total_equity': 0,
+        # 獲利指標
+        'roe': None,
+        'roa': None, 
+        'eps': None,
+        'net_income': None, 
+        'total_assets': None, 
+        'book_value': None,
+        # 新增：合約負債 (營收先行指標)
+        'contract_liabilities': 0,
+        # 新增：營收動能
+        'rev_growth_year': None, 
+        'rev_growth_qr': None    
+    }
+    
+    try:
+        info = ticker_obj.info
+        metrics['pb'] = info.get('priceToBook')
+        metrics['peg'] = info.get('pegRatio')
+        metrics['div_rate'] = info.get('dividendRate')
+        
+        # 獲利指標
+        metrics['roe'] = info.get('returnOnEquity')
+        metrics['roa'] = info.get('returnOnAssets')
+        metrics['eps'] = info.get('trailingEps')
+        metrics['book_value'] = info.get('bookValue')
+        metrics['rev_growth_qr'] = info.get('revenueGrowth')
+
+        fin = ticker_obj.financials
+        bs = ticker_obj.balance_sheet
+        cf = ticker_obj.cashflow
+        mkt_cap = info.get('marketCap')
+
+        # WACC 數據 & 資產負債表數據
+        total_debt = 0
+        if 'Total Debt' in bs.index: total_debt = bs.loc['Total Debt'].iloc[0]
+        elif 'TotalDebt' in bs.index: total_debt = bs.loc['TotalDebt'].iloc[0]
+        metrics['total_debt'] = total_debt
+
+        stockholders_equity = 0
+        if 'Stockholders Equity' in bs.index: stockholders_equity = bs.loc['Stockholders Equity'].iloc[0]
+        elif 'StockholdersEquity' in bs.index: stockholders_equity = bs.loc['StockholdersEquity'].iloc[0]
+        metrics['total_equity'] = stockholders_equity
+
+        # 總資產
+        if 'Total Assets' in bs.index: metrics['total_assets'] = bs.loc['Total Assets'].iloc[0]
+        elif 'TotalAssets' in bs.index: metrics['total_assets'] = bs.loc['TotalAssets'].iloc[0]
+
+        # 合約負債 (Contract Liabilities) - 營收先行指標
+        # 註：有些公司財報會分 Current 與 Non Current，這裡嘗試抓取總和或流動部分
+        if 'Contract Liabilities' in bs.index: 
+            metrics['contract_liabilities'] = bs.loc['Contract Liabilities'].iloc[0]
+        elif 'Current Contract Liabilities' in bs.index:
+            metrics['contract_liabilities'] = bs.loc['Current Contract Liabilities'].iloc[0]
+
+        # 淨利
+        if 'Net Income' in fin.index: metrics['net_income'] = fin.loc['Net Income'].iloc[0]
+        elif 'NetIncome' in fin.index: metrics['net_income'] = fin.loc['NetIncome'].iloc[0]
+
+        # 計算年營收成長率
+        try:
+            rev_series = None
+            if 'Total Revenue' in fin.index: rev_series = fin.loc['Total Revenue']
+            elif 'TotalRevenue' in fin.index: rev_series = fin.loc['TotalRevenue']
+            
+            if rev_series is not None and len(rev_series) >= 2:
+                this_year = rev_series.iloc[0]
+                last_year = rev_series.iloc[1]
+                if last_year > 0:
+                    metrics['rev_growth_year'] = (this_year - last_year) / last_year
+        except: pass
+
+        # ROIC 計算
+        try:
+            ebit = None
+            if 'EBIT' in fin.index: ebit = fin.loc['EBIT'].iloc[0]
+            elif 'Operating Income' in fin.index: ebit = fin.loc['Operating Income'].iloc[0]
+            elif 'OperatingIncome' in fin.index: ebit = fin.loc['OperatingIncome'].iloc[0]
+            
+            cash = 0
+            if 'Cash And Cash Equivalents' in bs.index: cash = bs.loc['Cash And Cash Equivalents'].iloc[0]
+            
+            if ebit and stockholders_equity:
+                invested_capital = total_debt + stockholders_equity - cash
+                if invested_capital > 0:
+                    metrics['roic'] = (ebit * 0.8) / invested_capital
+        except: pass
+
+        # FCF 計算
+        try:
+            ocf = None
+            if 'Operating Cash Flow' in cf.index: ocf = cf.loc['Operating Cash Flow'].iloc[0]
+            elif 'Total Cash From Operating Activities' in cf.index: ocf = cf.loc['Total Cash From Operating Activities'].iloc[0]
+            
+            capex = 0
+            if 'Capital Expenditure' in cf.index: capex = cf.loc['Capital Expenditure'].iloc[0]
+            
+            fcf_val = None
+            if 'Free Cash Flow' in cf.index: 
+                fcf_val = cf.loc['Free Cash Flow'].iloc[0]
+            elif ocf is not None:
+                fcf_val = ocf + capex
+            
+            if fcf_val and mkt_cap:
+                metrics['fcf_yield'] = fcf_val / mkt_cap
+        except: pass
+            
+    except: pass
+    return metrics
+
+def compute_technical_factors(current_price, data, market_returns):
+    """
+    單檔技術因子 (pandas 逐檔版)
+    與 factor_engine.compute_factor_table 同欄位，作為向量化引擎的對照基準 (tests/test_factor_engine.py)
+    """
+    close_series = data['Close']
+    volume_series = data['Volume']
+    tech = {col: np.nan for col in FACTOR_COLUMNS}
+    tech['current_price'] = current_price
+    tech['n_bars'] = len(data)
+    if len(data) < 60: return tech
+
+    tech['ma20'] = close_series.rolling(20).mean().iloc[-1]
+    tech['ma60'] = close_series.rolling(60).mean().iloc[-1]
+
+    # --- CAPM 與 Beta ---
+    stock_returns = close_series.pct_change().dropna()
+    aligned = pd.concat([stock_returns, market_returns], axis=1, join='inner').dropna()
+    aligned.columns = ['Stock', 'Market']
+
+    beta = 1.0
+    if len(aligned) > 30:
+        cov = aligned.cov().iloc[0, 1]
+        mkt_var = aligned['Market'].var()
+        beta = cov / mkt_var if mkt_var != 0 else 1.0
+    tech['beta'] = beta
+    tech['volatility'] = stock_returns.std() * (252**0.5)
+
+    # --- VWAP 與 CGO ---
+    df_60 = data.tail(60)
+    vwap_60 = (df_60['Close'] * df_60['Volume']).sum() / df_60['Volume'].sum()
+    tech['vwap_60'] = vwap_60
+    if vwap_60 > 0:
+        tech['cgo'] = (current_price - vwap_60) / vwap_60
+
+    # --- 60 日報酬與意圖因子 ---
+    days = 60
+    price_60_ago = close_series.iloc[-days]
+    s_return = (current_price / price_60_ago) - 1
+    v_variability = close_series.pct_change().abs().tail(days).sum()
+    avg_volume = volume_series.tail(days).mean()
+    tech['s_return'] = s_return
+    tech['v_variability'] = v_variability
+    tech['avg_volume'] = avg_volume
+    if v_variability > 0 and avg_volume > 500:
+        tech['intent_ratio'] = s_return / v_variability
+    return tech
+
+def technical_filter(tech):
+    """技術面濾網：日K >= 60 根，且股價在季線之上 (避開價值陷阱)；回傳淘汰規則，通過為 None"""
+    if not tech['n_bars'] >= 60: return 'bars<60'
+    if tech['current_price'] < tech['ma60']: return 'price<ma60'
+    return None
+
+def safety_filter(deep_metrics):
+    """安全防禦濾網 (同 score_ticker)；回傳淘汰規則，通過為 None"""
+    if deep_metrics['fcf_yield'] is None or deep_metrics['fcf_yield'] < 0.10: return 'fcf_yield<10%'
+    if deep_metrics['roic'] is None or deep_metrics['roic'] < 0.08: return 'roic<8%'
+    return None
+
+def fetch_fundamentals(ticker_symbol, cache=None, provider=None):
+    """
+    Stage 2 深層挖掘：只對通過技術面的標的抓 .info / 財報 (有 cache 時先查本地快取)
+    抓取失敗直接拋出例外，交由 FetchEngine 分類 (限流 / 無資料 / 網路) 與重試
+    回傳 (財報指標, 財報 payload 指紋)；指紋在抓取的執行緒上由剛讀到 / 寫入的 payload 算出 (無 cache 時為 None)
+    """
+    provider = provider or get_provider()
+    payloads = {}
+
+    def load(kind):
+        def fetch():
+            with REGISTRY.timer(f'fetch.{kind}'):
+                return provider.get_statement(ticker_symbol, kind)
+        if cache is None:
+            return fetch()
+        value, payloads[kind] = cache.get_or_fetch(ticker_symbol, kind, fetch, with_payload=True)
+        return value
+
+    info = load('info')
+    if not info:
+        raise NoData(f"{ticker_symbol} 無 .info 資料")
+    statements = SimpleNamespace(info=info, **{kind: load(kind) for kind in STATEMENT_KINDS if kind != 'info'})
+    return get_financial_metrics_deep(statements), payload_digest(payloads) if cache is not None else None
+
+def score_ticker(ticker_symbol, name_map, tech, deep_metrics):
+    """
+    Stage 3 安全濾網 + 評分 (純運算，不連網)；通過回傳數值 dict (見 result_table)
+    tech: 技術因子 (compute_factor_table 的一列或 compute_technical_factors 的結果)
+    """
+    try:
+        stock_name = name_map.get(ticker_symbol, ticker_symbol)
+        current_price = tech['current_price']
+        
+        roic = deep_metrics['roic']
+        fcf_yield = deep_metrics['fcf_yield']
+        pb = deep_metrics['pb']
+        peg_ratio = deep_metrics['peg']
+        div_rate = deep_metrics['div_rate']
+
+        # 獲利與財報指標
+        roe = deep_metrics['roe']
+        roa = deep_metrics['roa'] # ROI
+        eps = deep_metrics['eps']
+        book_value = deep_metrics['book_value']
+        net_income = deep_metrics['net_income']
+        total_debt = deep_metrics['total_debt']
+        total_assets = deep_metrics['total_assets']
+        contract_liabilities = deep_metrics['contract_liabilities'] # 合約負債
+        
+        # 營收指標
+        rev_growth_year = deep_metrics['rev_growth_year']
+        rev_growth_qr = deep_metrics['rev_growth_qr']
+
+        # 技術指標 (由因子表提供)
+        ma20 = tech['ma20']
+        ma60 = tech['ma60']
+        beta = tech['beta']
+        volatility = tech['volatility']
+        s_return = tech['s_return']
+
+        # ==========================================
+        # 🛡️ 【安全防禦過濾系統】 
+        # ==========================================
+        
+        # 1. 現金流濾網：FCF Yield < 10% (0.10) 淘汰
+        if fcf_yield is None or fcf_yield < 0.10:
+            return None
+            
+        # 2. 趨勢濾網 (避開價值陷阱)：已於 Stage 1 technical_filter 檢查
+
+        # 3. 品質濾網 (避開爛公司)：ROIC 必須大於 8%
+        if roic is None or roic < 0.08:
+            return None
+        # ==========================================
+
+        # --- 1. CAPM ---
+        ke = RF + beta * MRP 
+
+        # --- 2. WACC 計算 ---
+        wacc = None
+        total_equity = deep_metrics['total_equity']
+        if total_equity > 0:
+            total_capital = total_equity + total_debt
+            weight_equity = total_equity / total_capital
+            weight_debt = total_debt / total_capital
+            wacc = (ke * weight_equity) + (COST_OF_DEBT_NET * weight_debt)
+
+        # --- 3. CGO 與 VWAP ---
+        cgo_val = tech['cgo']
+        cgo_status = ""
+        cgo_score = 0
+        if pd.notna(cgo_val):
+            if cgo_val > 0.05:
+                cgo_status = "籌碼獲利🔥"
+                cgo_score = 10
+            elif cgo_val > 0:
+                cgo_status = "成本之上✅"
+                cgo_score = 5
+            else:
+                cgo_status = "套牢壓力🥶"
+
+        # --- 4. Smart Beta 低波動 ---
+        is_low_vol = False
+        if volatility < 0.25 or (beta < 0.8 and volatility < 0.35):
+            is_low_vol = True
+
+        # --- 原有指標計算 ---
+        intent_factor = 0
+        score_intent = 0
+        is_intent_candidate = False 
+        
+        if pd.notna(tech['intent_ratio']): 
+            raw_intent = tech['intent_ratio']
+            if 0 < s_return < 0.3: 
+                intent_factor = raw_intent
+                is_intent_candidate = True
+                score_intent = 15
+            elif s_return < -0.05:
+                score_intent = 5 
+
+        # --- 評分系統 ---
+        score = 0
+        flags = 0  # 亮點 (bit flags，文字於顯示時才產生)
+        
+        if current_price > ma20: score += 20 
+        if current_price > ma60: score += 10 
+        if is_intent_candidate: 
+            score += score_intent
+            flags |= FLAG_INTENT
+        
+        # CGO 加分
+        score += cgo_score
+
+        # 低波動加分
+        if is_low_vol: 
+            score += 10
+            flags |= FLAG_LOW_VOL
+
+        # ROIC / WACC 判斷
+        if roic is not None:
+            if wacc and roic > wacc: 
+                score += 25
+                flags |= FLAG_VALUE_CREATION
+            elif roic > 0.15:
+                score += 25
+                flags |= FLAG_HIGH_ROIC
+        
+        # FCF 加分
+        if fcf_yield > 0.15:
+            score += 30
+            flags |= FLAG_SUPER_FCF
+        else:
+            score += 20
+
+        if volatility < 0.35: score += 10
+        
+        # 合理價
+        fair_value = np.nan
+        if div_rate:
+            k_minus_g = max(ke - G_GROWTH, 0.015)
+            fair_value = div_rate / k_minus_g
+
+        # --- 數值結果 (格式化文字與 AI綜合建議見 result_table.format_row) ---
+        if score >= 15: 
+            return {
+                "代號": ticker_symbol.replace(".TW", "").replace(".TWO", ""),
+                "名稱": stock_name,
+                "現價": float(current_price),
+                "合理價": round(fair_value, 2) if not np.isnan(fair_value) else 0,
+                "AI綜合評分": round(score, 1),
+                "意圖因子": round(intent_factor, 2), 
+                "ROIC": roic,     
+                "FCF Yield": fcf_yield, 
+                "WACC": wacc,     
+                "CGO": cgo_status,
+                "EPS": eps,
+                "ROE": roe,
+                "ROI(ROA)": roa,
+                "合約負債": contract_liabilities,
+                "年營收成長": rev_growth_year,
+                "季營收成長": rev_growth_qr,
+                "每股淨值": book_value,
+                "總負債": total_debt,
+                "本期淨利": net_income,
+                "Beta": beta,
+                "區間報酬": s_return,
+                FLAGS_COLUMN: flags,
+            }
+    except Exception as e:
+        return None
+    return None
+
+
+# --- 分段掃描流程 ---
+
+STAGE_TECHNICAL = "技術面篩選"
+STAGE_FUNDAMENTALS = "財報深層挖掘"
+STAGE_SCORING = "安全濾網與評分"
+
+# --- 增量重算：評分輸入指紋 ---
+# 每檔記錄評分時的輸入指紋與實際依賴的輸入；下次掃描依賴的指紋都沒變就直接沿用，不抓財報也不重算
+
+SCORE_KIND = 'score'  # 存於 FundamentalsCache
+
+def global_params():
+    return {'RF': RF, 'MRP': MRP, 'G_GROWTH': G_GROWTH, 'COST_OF_DEBT_NET': COST_OF_DEBT_NET}
+
+def score_inputs(tech, fund_digest):
+    """本次的輸入指紋：技術因子 (由日K、大盤報酬、現價算出)、財報 payload、各全局參數"""
+    tech_bytes = np.asarray([tech[c] for c in FACTOR_COLUMNS], dtype=np.float64).tobytes()
+    inputs = {name: repr(value) for name, value in global_params().items()}
+    inputs.update(tech=hashlib.sha1(tech_bytes).hexdigest(), fund=fund_digest)
+    return inputs
+
+def score_dependencies(deep_metrics, row):
+    """評分結果實際用到的輸入；全局參數只在公式用到時列入，改參數只讓相關結果失效"""
+    if row is None and safety_filter(deep_metrics): return ['fund']
+    deps = {'tech', 'fund'}
+    if (deep_metrics['total_equity'] or 0) > 0: deps |= {'RF', 'MRP', 'COST_OF_DEBT_NET'}  # WACC
+    if deep_metrics['div_rate']: deps |= {'RF', 'MRP', 'G_GROWTH'}                          # 合理價
+    return sorted(deps)
+
+def is_clean(stored, inputs):
+    if stored.get('schema') != RESULT_SCHEMA: return False
+    return inputs['fund'] is not None and all(stored['inputs'].get(dep) == inputs[dep] for dep in stored['deps'])
+
+def numeric_metrics(deep_metrics):
+    """財報指標轉成純 float (None 保留)，供快取 / 日誌 / 篩選表使用"""
+    return {k: None if v is None else float(v) for k, v in deep_metrics.items()}
+
+def run_scan(tickers, name_map, market_returns, price_panel, progress_callback=None, cache=None, engine=None, provider=None,
+             result_callback=None, journal=None, factors=None):
+    """
+    分段掃描: 技術面 (全市場) -> 財報 (僅倖存者) -> 評分
+    回傳 (results, stage_reports)；stage_reports 記錄每個 stage 的進出檔數 (財報 stage 另附失敗原因統計)
+    progress_callback(stage, completed, total)
+    result_callback(row): 每評分出一檔就呼叫 (財報邊抓邊評分，不必等全部抓完)
+    journal: ScanJournal；每檔結果逐筆寫入，已有結果的標的 (續跑) 直接沿用不再處理
+    cache: FundamentalsCache；有 cache 時輸入指紋沒變的標的沿用上次評分 (見 is_clean)
+    factors: dict；傳入時填入 'technical' (全市場技術因子表)、'fundamentals' ({代號: 財報指標})、'names'、
+              'market_volatility' (大盤年化波動)，供 screener 重新篩選與 valuation 估值
+    engine: FetchEngine；provider: DataProvider (皆可選)
+    """
+    provider = provider or get_provider()
+    provider.reset_session()
+    stage_reports = []
+    outcomes = dict(journal.outcomes) if journal else {}
+    results = [entry['row'] for entry in outcomes.values() if entry['status'] == SCORED]
+    fundamentals = {t: entry['metrics'] for t, entry in outcomes.items() if entry.get('metrics')}
+    if result_callback:
+        for row in results: result_callback(row)
+    pending = [t for t in tickers if t not in outcomes]
+
+    def record(ticker_symbol, status, stage, rule=None, row=None, metrics=None):
+        if journal: outcomes[ticker_symbol] = journal.record(ticker_symbol, status, stage, rule, row, metrics)
+        else: outcomes[ticker_symbol] = {'ticker': ticker_symbol, 'status': status, 'stage': stage, 'rule': rule}
+
+    # Stage 1: 全市場報價 (取自日K面板) + 向量化技術因子，一次算完再套趨勢濾網
+    quote_service = QuoteService(price_panel, cache, provider)
+    quotes = quote_service.get_quotes(pending)
+    if progress_callback: progress_callback(STAGE_TECHNICAL, len(tickers), len(tickers))
+    with REGISTRY.timer('compute.factor_table'):
+        factor_table = compute_factor_table(price_panel, market_returns, quotes)
+    screened = {}
+    for ticker_symbol in pending:
+        if ticker_symbol not in quotes or ticker_symbol not in factor_table.index:
+            record(ticker_symbol, FILTERED, STAGE_TECHNICAL, 'no_quote' if ticker_symbol not in quotes else 'no_history')
+            continue
+        tech = factor_table.loc[ticker_symbol]
+        rule = technical_filter(tech)
+        if rule: record(ticker_symbol, FILTERED, STAGE_TECHNICAL, rule)
+        else: screened[ticker_symbol] = tech
+
+    def emit(ticker_symbol, row, rule, metrics):
+        fundamentals[ticker_symbol] = metrics
+        if row:
+            results.append(row)
+            record(ticker_symbol, SCORED, STAGE_SCORING, row=row, metrics=metrics)
+            if result_callback: result_callback(row)
+        else:
+            record(ticker_symbol, FILTERED, STAGE_SCORING, rule, metrics=metrics)
+
+    # 輸入指紋沒變的標的直接沿用上次結果；財報都在快取裡的標的 (warm) 直接重算，不經 FetchEngine 限速
+    dirty = list(screened)
+    warm = []
+    reused = 0
+    if cache is not None:
+        dirty = []
+        for ticker_symbol, tech in screened.items():
+            stored = cache.get(ticker_symbol, SCORE_KIND)
+            fund_digest = cache.digest(ticker_symbol, STATEMENT_KINDS)
+            clean = stored is not None and is_clean(stored, score_inputs(tech, fund_digest))
+            REGISTRY.cache_event('score.fingerprint', clean)
+            if clean:
+                emit(ticker_symbol, stored['row'], stored['rule'], stored['metrics'])
+                reused += 1
+            elif fund_digest is not None:
+                warm.append(ticker_symbol)
+            else:
+                dirty.append(ticker_symbol)
+
+    # Stage 2+3: 財報每抓完一檔立刻評分，財報資料用完即丟
+    def on_fetch_progress(done, total):
+        if progress_callback: progress_callback(STAGE_FUNDAMENTALS, len(warm) + done, len(warm) + total)
+
+    def on_fundamentals(ticker_symbol, fetched):
+        deep_metrics, fund_digest = fetched
+        with REGISTRY.timer('compute.score'):
+            row = score_ticker(ticker_symbol, name_map, screened[ticker_symbol], deep_metrics)
+        rule = None if row else safety_filter(deep_metrics) or 'error'
+        metrics = numeric_metrics(deep_metrics)
+        emit(ticker_symbol, row, rule, metrics)
+        if cache is not None:
+            inputs = score_inputs(screened[ticker_symbol], fund_digest)
+            if inputs['fund'] is not None:
+                cache.put(ticker_symbol, SCORE_KIND, {'schema': RESULT_SCHEMA, 'inputs': inputs, 'rule': rule,
+                                                      'deps': score_dependencies(deep_metrics, row), 'row': row,
+                                                      'metrics': metrics})
+
+    for ticker_symbol in list(warm):
+        try:
+            fetched = fetch_fundamentals(ticker_symbol, cache, provider)
+        except Exception:
+            # 讀快取時剛好過期 -> 交給 FetchEngine 抓
+            warm.remove(ticker_symbol)
+            dirty.append(ticker_symbol)
+            continue
+        on_fundamentals(ticker_symbol, fetched)
+
+    engine = engine or FetchEngine()
+    engine.run(dirty, lambda t: fetch_fundamentals(t, cache, provider), on_fetch_progress, on_fundamentals)
+    for ticker_symbol, outcome in engine.outcomes.items():
+        if outcome['status'] != 'ok': record(ticker_symbol, FAILED, STAGE_FUNDAMENTALS, outcome['error_class'])
+
+    # 進出檔數含續跑前已完成的部分
+    entries = [outcomes[t] for t in tickers if t in outcomes]
+    fetched = [e for e in entries if e['stage'] != STAGE_TECHNICAL]
+    scored = [e for e in fetched if e['stage'] == STAGE_SCORING]
+    fetch_summary = dict(Counter(e['rule'] if e['status'] == FAILED else 'ok' for e in fetched))
+    stage_reports.append({"stage": STAGE_TECHNICAL, "in": len(tickers), "out": len(fetched)})
+    if journal and journal.resumed: stage_reports[0]['resumed'] = journal.resumed
+    stage_reports.append({"stage": STAGE_FUNDAMENTALS, "in": len(fetched), "out": len(scored), "outcomes": fetch_summary})
+    if progress_callback: progress_callback(STAGE_SCORING, len(scored), len(scored))
+    stage_reports.append({"stage": STAGE_SCORING, "in": len(scored), "out": len(results)})
+    if reused: stage_reports[-1]['reused'] = reused
+
+    if factors is not None:
+        market_volatility = float(market_returns.std() * np.sqrt(TRADING_DAYS)) if len(market_returns) > 1 else None
+        factors.update(technical=factor_table, fundamentals=fundamentals, names=name_map, market_volatility=market_volatility)
+    return results, stage_reports
+
+STAGE_PRICES = "更新日K資料庫"
+
+def rank_key(row):
+    """排序鍵 (AI綜合評分, 意圖因子)，越大越前面；NaN 視為最小 (同 sort_values 把 NaN 排最後)"""
+    return tuple(-math.inf if v is None or v != v else v for v in (row['AI綜合評分'], row['意圖因子']))
+
+def rank_results(results, top_n=100):
+    """依 AI綜合評分、意圖因子排序取前 top_n 名 (與畫面上的 Top 100 相同)；results 可為 dict list 或 build_table 的結果表"""
+    df = results if isinstance(results, pd.DataFrame) else build_table(results)
+    if df.empty: return df
+    return df.sort_values(by=['AI綜合評分', '意圖因子'], ascending=[False, False]).head(top_n)
+
+class TopK:
+    """
+    串流 Top-K：大小固定為 k 的 min-heap，排序與 rank_results 相同
+    每筆 push 為 O(log k)，掃描途中隨時可取目前的前 k 名
+    """
+
+    def __init__(self, k=100):
+        self.k = k
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, row):
+        # 同分時先進來的排前面 (與 rank_results 的穩定排序一致)
+        item = (rank_key(row), -next(self._seq), row)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def rows(self):
+        """目前前 k 名，由高到低"""
+        return [row for _, _, row in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+def scan_market(tickers=None, name_map=None, force_refresh=False, progress_callback=None, provider=None, result_callback=None,
+                resume=True, factors=None, scope=None):
+    """
+    完整掃描 (給 CLI / 背景排程使用)：股票池 -> 更新日K -> 分段掃描
+    tickers 未指定時依 scope (universe.select_universe 的條件，如 {'markets': ['上市']}) 取股票池，
+    未指定 scope 則掃描整個股票池；皆依流動性由高到低掃描。回傳 (results, stage_reports)
+    resume: 當天同一股票池有中斷的掃描時，只處理剩下的標的 (force_refresh 時一律重來)
+    每次掃描的財報指標另存一份快照 (backtest 的 point-in-time 財報歷史)
+    """
+    from backtest import save_snapshot, snapshot_dir
+    from price_store import PriceStore
+    from fundamentals_cache import FundamentalsCache, provider_cache_dir
+    from scan_journal import JOURNAL_SUBDIR, ScanJournal, scan_key
+    from universe import select_tickers, update_liquidity
+
+    provider = provider or get_provider()
+    if tickers is None:
+        tickers, name_map = select_tickers(provider, **(scope or {}))
+    name_map = name_map or {}
+    factors = {} if factors is None else factors
+
+    def on_price_progress(done, total):
+        if progress_callback: progress_callback(STAGE_PRICES, done, total)
+
+    store = PriceStore(provider=provider)
+    market_returns = load_market_returns(store)
+    price_panel = store.update(tickers, full_refresh=force_refresh, progress_callback=on_price_progress)
+    cache = FundamentalsCache(cache_dir=provider_cache_dir(provider.name), force_refresh=force_refresh)
+    journal = ScanJournal.open(os.path.join(provider_cache_dir(provider.name), JOURNAL_SUBDIR),
+                               scan_key(provider.name, tickers), len(tickers), resume=resume and not force_refresh,
+                               schema=RESULT_SCHEMA)
+    try:
+        results, stage_reports = run_scan(tickers, name_map, market_returns, price_panel, progress_callback, cache=cache,
+                                          provider=provider, result_callback=result_callback, journal=journal,
+                                          factors=factors)
+    except BaseException:
+        journal.close()  # 保留未完成的日誌，下次續跑
+        raise
+    journal.finish()
+    save_snapshot(snapshot_dir(provider.name), factors.get('fundamentals'))
+    update_liquidity(provider.name, factors.get('technical'))
+    return results, stage_reports
@@ -0,0 +1,194 @@
+"""
+記憶體內篩選引擎：掃描後保留全市場原始因子 (技術面 + 已抓到的財報)，
+調整門檻 / 評分權重 / 排序只需重算向量化遮罩與加權和，不必重新抓取
+
+    table = build_screen_table(factors)               # factors 由 run_scan(..., factors={}) 填入
+    screen = Screen(filters=["fcf_yield >= 12%", "roic >= 0.1"], weights={'super_fcf': 40})
+    ranked = screen.run(table, top_n=100)             # 與 rank_results 相同格式的結果表
+
+註：財報只對通過技術面的標的抓取，放寬技術面門檻後，未抓財報的標的仍會被財報條件排除
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from result_table import (CGO_STATUSES, FLAG_HIGH_ROIC, FLAG_INTENT, FLAG_LOW_VOL, FLAG_SUPER_FCF, FLAG_VALUE_CREATION,
+                          FLAGS_COLUMN, typed_table)
+from scanner import global_params
+import valuation
+
+# V9.9 預設規則 (與 technical_filter / safety_filter / score_ticker 相同)
+DEFAULT_FILTERS = ["n_bars >= 60", "current_price >= ma60", "fcf_yield >= 0.10", "roic >= 0.08"]
+DEFAULT_SORT = ["-score", "-intent_factor"]
+
+# 財報指標欄位 (同 get_financial_metrics_deep)
+FUNDAMENTAL_COLUMNS = [
+    'roic', 'fcf_yield', 'peg', 'pb', 'div_rate', 'total_debt', 'total_equity', 'roe', 'roa', 'eps',
+    'net_income', 'total_assets', 'book_value', 'contract_liabilities', 'rev_growth_year', 'rev_growth_qr',
+]
+
+# 評分項目: 名稱 -> (說明, 預設分數)
+SCORE_TERMS = {
+    'above_ma20': ("站上月線", 20),
+    'above_ma60': ("站上季線", 10),
+    'intent': ("主力軌跡 (區間報酬 0~30%)", 15),
+    'cgo_hot': ("籌碼獲利 (CGO > 5%)", 10),
+    'cgo_positive': ("成本之上 (0 < CGO ≤ 5%)", 5),
+    'low_vol': ("低波動", 10),
+    'quality': ("ROIC > WACC 或 ROIC > 15%", 25),
+    'super_fcf': ("超高現金流 (FCF > 15%)", 30),
+    'high_fcf': ("高現金流 (FCF ≤ 15%)", 20),
+    'calm': ("年化波動 < 35%", 10),
+}
+DEFAULT_WEIGHTS = {name: points for name, (_, points) in SCORE_TERMS.items()}
+
+_OPS = {'>=': np.greater_equal, '<=': np.less_equal, '>': np.greater, '<': np.less, '==': np.equal, '!=': np.not_equal}
+_FILTER_RE = re.compile(r'^\s*([A-Za-z_]\w*)\s*(>=|<=|==|!=|>|<)\s*([A-Za-z_]\w*|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?%?)\s*$')
+
+
+def build_screen_table(factors):
+    """run_scan 填入的 factors -> 每檔一列的原始因子表 (float64)"""
+    table = factors['technical'].astype(np.float64)
+    fundamentals = pd.DataFrame.from_dict(factors['fundamentals'], orient='index', dtype=np.float64)
+    table = table.join(fundamentals.reindex(columns=FUNDAMENTAL_COLUMNS), how='left')
+    names = factors.get('names') or {}
+    table['name'] = [names.get(t, t) for t in table.index]
+    if factors.get('market_volatility'):
+        table.attrs['market_volatility'] = factors['market_volatility']  # valuation 估 Beta 標準誤用
+    return table
+
+
+def table_columns(table):
+    return {c: table[c].to_numpy(np.float64) for c in table.columns if c != 'name'}
+
+
+def derive(t, params=None):
+    """
+    由原始因子與全局參數算出 WACC / 合理價 / 評分條件 (向量化，同 score_ticker)
+    t: {欄位: ndarray}；一維 (每檔一列) 或二維 (日期 × 代號，回測用) 皆可
+    """
+    p = dict(global_params(), **(params or {}))
+    equity, debt = np.nan_to_num(t['total_equity']), np.nan_to_num(t['total_debt'])
+    wacc = valuation.wacc(t['beta'], equity, debt, p['RF'], p['MRP'], p['COST_OF_DEBT_NET'])
+    fair_value = valuation.fair_value(np.nan_to_num(t['div_rate']), t['beta'], p['RF'], p['MRP'], p['G_GROWTH'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s_return, vol, cgo, roic, fcf = t['s_return'], t['volatility'], t['cgo'], t['roic'], t['fcf_yield']
+        intent = ~np.isnan(t['intent_ratio']) & (s_return > 0) & (s_return < 0.3)
+        value_creation = ~np.isnan(wacc) & (wacc != 0) & (roic > wacc)
+        conditions = {
+            'above_ma20': t['current_price'] > t['ma20'],
+            'above_ma60': t['current_price'] > t['ma60'],
+            'intent': intent,
+            'cgo_hot': cgo > 0.05,
+            'cgo_positive': (cgo > 0) & (cgo <= 0.05),
+            'low_vol': (vol < 0.25) | ((t['beta'] < 0.8) & (vol < 0.35)),
+            'quality': value_creation | (roic > 0.15),
+            'super_fcf': fcf > 0.15,
+            'high_fcf': fcf <= 0.15,
+            'calm': vol < 0.35,
+        }
+    derived = {
+        'wacc': wacc,
+        'fair_value': fair_value,
+        'intent_factor': np.where(intent, t['intent_ratio'], 0.0),
+        'value_creation': value_creation,
+    }
+    return derived, conditions
+
+
+def compile_filter(expr):
+    """'欄位 運算子 數值|欄位' -> mask 函式；數值可寫成百分比 (10%)；NaN 一律不通過 (!= 除外)"""
+    m = _FILTER_RE.match(expr)
+    if not m:
+        raise ValueError(f"無法解析的篩選條件: {expr}")
+    lhs, op, rhs = m.groups()
+    rhs_is_column = rhs[0].isalpha() or rhs[0] == '_'
+    value = None if rhs_is_column else float(rhs[:-1]) / 100 if rhs.endswith('%') else float(rhs)
+
+    def mask(cols):
+        if lhs not in cols or (rhs_is_column and rhs not in cols):
+            raise ValueError(f"篩選條件使用了不存在的欄位: {expr}")
+        with np.errstate(invalid='ignore'):
+            return _OPS[op](cols[lhs], cols[rhs] if rhs_is_column else value)
+    return mask
+
+
+class Screen:
+    """
+    篩選 / 評分 / 排序規則，建立時即編譯：
+    filters: 條件字串 (AND)；weights: 評分項目分數 (見 SCORE_TERMS，未指定用預設)；
+    sort: 欄位名，前綴 '-' 為由大到小；params: 覆寫 RF / MRP / G_GROWTH / COST_OF_DEBT_NET
+    """
+
+    def __init__(self, filters=None, weights=None, sort=None, params=None):
+        self.filters = list(DEFAULT_FILTERS if filters is None else filters)
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        unknown = set(self.weights) - set(SCORE_TERMS)
+        if unknown:
+            raise ValueError(f"未知的評分項目: {', '.join(sorted(unknown))}")
+        self.sort = list(DEFAULT_SORT if sort is None else sort)
+        self.params = params or {}
+        self._masks = [compile_filter(expr) for expr in self.filters]
+
+    def evaluate(self, cols):
+        """
+        cols: {欄位: ndarray} (見 table_columns；回測時為日期 × 代號矩陣)
+        回傳 (通過的 bool 陣列, 欄位 dict, 評分條件 dict)；欄位含原始因子、衍生值與 score
+        """
+        derived, conditions = derive(cols, self.params)
+        cols = dict(cols, **derived)
+        cols['score'] = sum(self.weights[name] * conditions[name] for name in SCORE_TERMS).astype(np.float64)
+        passed = np.ones(cols['current_price'].shape, dtype=bool)
+        for mask in self._masks:
+            passed &= mask(cols)
+        return passed, cols, conditions
+
+    def run(self, table, top_n=100):
+        """篩選 + 評分 + 排序，回傳前 top_n 名 (result_table 格式，可直接 format_results)"""
+        passed, cols, conditions = self.evaluate(table_columns(table))
+        idx = np.flatnonzero(passed)
+        # 穩定排序：由最後一個排序鍵開始；NaN 排最後
+        for key in reversed(self.sort):
+            desc = key.startswith('-')
+            values = cols[key.lstrip('-')][idx]
+            order = np.argsort(np.where(np.isnan(values), np.inf, -values if desc else values), kind='stable')
+            idx = idx[order]
+        idx = idx[:top_n]
+        return self._to_result_table(table, cols, conditions, idx)
+
+    @staticmethod
+    def _to_result_table(table, cols, conditions, idx):
+        cond = {name: c[idx] for name, c in conditions.items()}
+        cgo = cols['cgo'][idx]
+        cgo_status = np.select([np.isnan(cgo), cgo > 0.05, cgo > 0], ["", CGO_STATUSES[1], CGO_STATUSES[2]], CGO_STATUSES[3])
+        flags = (cond['intent'] * FLAG_INTENT + cond['low_vol'] * FLAG_LOW_VOL
+                 + cols['value_creation'][idx] * FLAG_VALUE_CREATION
+                 + (~cols['value_creation'][idx] & (cols['roic'][idx] > 0.15)) * FLAG_HIGH_ROIC
+                 + cond['super_fcf'] * FLAG_SUPER_FCF)
+        tickers = table.index[idx]
+        df = pd.DataFrame({
+            "代號": [t.replace(".TW", "").replace(".TWO", "") for t in tickers],
+            "名稱": table['name'].to_numpy()[idx],
+            "現價": cols['current_price'][idx],
+            "合理價": np.round(cols['fair_value'][idx], 2),
+            "AI綜合評分": np.round(cols['score'][idx], 1),
+            "意圖因子": np.round(cols['intent_factor'][idx], 2),
+            "ROIC": cols['roic'][idx],
+            "FCF Yield": cols['fcf_yield'][idx],
+            "WACC": cols['wacc'][idx],
+            "EPS": cols['eps'][idx],
+            "ROE": cols['roe'][idx],
+            "ROI(ROA)": cols['roa'][idx],
+            "合約負債": cols['contract_liabilities'][idx],
+            "年營收成長": cols['rev_growth_year'][idx],
+            "季營收成長": cols['rev_growth_qr'][idx],
+            "每股淨值": cols['book_value'][idx],
+            "總負債": cols['total_debt'][idx],
+            "本期淨利": cols['net_income'][idx],
+            "Beta": cols['beta'][idx],
+            "區間報酬": cols['s_return'][idx],
+            "CGO": cgo_status,
+            FLAGS_COLUMN: flags,
+        }, index=tickers)
+        return typed_table(df)
@@ -0,0 +1,115 @@
+"""
+共享記憶體面板：dates × tickers 矩陣放進 multiprocessing.shared_memory，
+子行程以名稱掛載成 numpy view (不 pickle DataFrame)，依代號 (欄) 切塊平行計算，只傳回精簡的數值列
+
+    rows = map_columns(_factor_chunk, {'close': close, 'volume': volume, 'market': market}, n_tickers, workers=8)
+"""
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# --- 多行程設定 ---
+CHUNKS_PER_WORKER = 4  # 每個行程分到的切塊數 (切細一點，較慢的行程不會拖住整批)
+
+_pool = None
+_pool_workers = 0
+
+
+class SharedArrays:
+    """把多個 numpy 陣列複製進共享記憶體；spec 可傳給子行程以 attach 掛載。離開 with 時釋放"""
+
+    def __init__(self, arrays):
+        self._blocks = []
+        self.spec = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                self.spec[name] = (block.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach(spec):
+    """子行程：依 spec 掛載共享記憶體，回傳 (區塊, {名稱: 唯讀 numpy view})"""
+    blocks, views = [], {}
+    for name, (block_name, shape, dtype) in spec.items():
+        # 子行程與建立者共用同一個 resource_tracker (登記為集合，重複登記無妨)，區塊由建立者 unlink
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        view = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        view.flags.writeable = False
+        views[name] = view
+    return blocks, views
+
+
+def _run_chunk(fn, spec, start, stop):
+    blocks, views = _attach(spec)
+    try:
+        return np.array(fn(views, start, stop))  # 複製一份，不留指向共享記憶體的 view
+    finally:
+        del views
+        for block in blocks:
+            block.close()
+
+
+def _context():
+    # 掃描在背景執行緒執行，fork 帶著其他執行緒的鎖不安全；forkserver 只 fork 乾淨的伺服行程
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def get_pool(workers):
+    """共用的行程池 (行程啟動與 import numpy 只付一次)；workers 改變時重建"""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_context())
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool, _pool_workers = None, 0
+
+
+atexit.register(shutdown_pool)
+
+
+def map_columns(fn, arrays, n_columns, workers):
+    """
+    fn(views, start, stop) 在子行程計算第 start:stop 欄 (views: 共享記憶體中的 arrays)，須為模組層級函式
+    回傳各切塊結果依欄序沿 axis 0 串接
+    """
+    step = max(1, -(-n_columns // (workers * CHUNKS_PER_WORKER)))
+    bounds = [(start, min(start + step, n_columns)) for start in range(0, n_columns, step)]
+    with SharedArrays(arrays) as shared:
+        pool = get_pool(workers)
+        try:
+            futures = [pool.submit(_run_chunk, fn, shared.spec, start, stop) for start, stop in bounds]
+            return np.concatenate([future.result() for future in futures])
+        except BrokenProcessPool:
+            shutdown_pool()  # 子行程被砍掉後池子不能再用，下次重建
+            raise
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模組平放在專案根目錄 (同 app.py)，測試直接 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
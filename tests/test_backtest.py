@@ -0,0 +1,78 @@
+"""回測對合成資料 (SyntheticProvider 日K + synthetic_snapshots 財報快照) 的性質：無前視、交易成本、換股週期"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import run_backtest, synthetic_snapshots
+from providers import MARKET_INDEX, SyntheticProvider
+
+
+@pytest.fixture(scope='module')
+def market():
+    provider = SyntheticProvider(n_tickers=150, n_days=400, seed=3)
+    tickers, _ = provider.get_universe()
+    prices = provider.get_price_history(tickers)
+    market_returns = provider.get_price_history([MARKET_INDEX])['Close'][MARKET_INDEX].pct_change().dropna()
+    snapshots = synthetic_snapshots(tickers, prices['Close'].index, seed=3)
+    return prices, market_returns, snapshots
+
+
+def test_lag_days_hides_snapshots_until_available(market):
+    prices, market_returns, snapshots = market
+    lag = 10
+    base = run_backtest(prices, market_returns, snapshots, top_n=10, lag_days=lag)['daily']
+
+    # 改寫中間某一份快照：快照日 + lag 之前的報酬不能受影響
+    as_of = np.sort(snapshots['as_of'].unique())[3]
+    changed = snapshots.copy()
+    rows = changed['as_of'] == as_of
+    changed.loc[rows, ['fcf_yield', 'roic']] = changed.loc[rows, ['fcf_yield', 'roic']].to_numpy()[::-1]
+    altered = run_backtest(prices, market_returns, changed, top_n=10, lag_days=lag)['daily']
+
+    available = pd.Timestamp(as_of) + pd.Timedelta(days=lag)
+    pd.testing.assert_frame_equal(base.loc[:available], altered.loc[:available])
+    assert not base.loc[available:].equals(altered.loc[available:])
+
+
+def test_future_prices_do_not_leak(market):
+    prices, market_returns, snapshots = market
+    base = run_backtest(prices, market_returns, snapshots, top_n=10)['daily']
+    cut = prices['Close'].index[250]
+    shocked = {field: frame.copy() for field, frame in prices.items()}
+    rng = np.random.default_rng(0)
+    later = shocked['Close'].index > cut
+    shocked['Close'].loc[later] *= rng.uniform(0.5, 1.5, shocked['Close'].loc[later].shape)
+    altered = run_backtest(shocked, market_returns, snapshots, top_n=10)['daily']
+    pd.testing.assert_frame_equal(base.loc[:cut], altered.loc[:cut])
+
+
+def test_cost_bps_charges_turnover(market):
+    prices, market_returns, snapshots = market
+    free = run_backtest(prices, market_returns, snapshots, top_n=10)
+    paid = run_backtest(prices, market_returns, snapshots, top_n=10, cost_bps=25)
+    traded = paid['daily']['turnover'] * 2  # turnover 為單邊
+    assert traded.sum() > 0
+    np.testing.assert_allclose(paid['daily']['cost'], traded * 25 / 1e4)
+    np.testing.assert_allclose(free['daily']['portfolio'] - paid['daily']['portfolio'], paid['daily']['cost'], atol=1e-15)
+    np.testing.assert_allclose(free['daily']['turnover'], paid['daily']['turnover'])
+    assert paid['summary']['total_return'] < free['summary']['total_return']
+
+
+def test_rebalance_days_holds_positions(market):
+    prices, market_returns, snapshots = market
+    daily_run = run_backtest(prices, market_returns, snapshots, top_n=10)
+    result = run_backtest(prices, market_returns, snapshots, top_n=10, rebalance_days=5)
+    daily, rebalances = result['daily'], result['rebalances']
+    dates = prices['Close'].index
+
+    rows = dates.get_indexer(rebalances.index)
+    assert (np.diff(rows) == 5).all()
+    assert len(rebalances) < len(daily_run['rebalances'])
+    # 換股的成交反映在換股日收盤後的隔日報酬列；其餘日子不交易、持股數不變
+    trade_day = daily.index.isin(dates[rows + 1])
+    assert (daily['turnover'][~trade_day] == 0).all()
+    assert (daily['turnover'][trade_day] > 0).any()
+    period = np.cumsum(trade_day) - 1
+    assert (daily.groupby(period)['holdings'].nunique() == 1).all()
+    # 第一個換股日選出的組合相同
+    assert daily['portfolio'].iloc[0] == pytest.approx(daily_run['daily']['portfolio'].iloc[0])
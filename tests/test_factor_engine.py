@@ -0,0 +1,82 @@
+"""向量化技術因子 (compute_factor_table) 與逐檔版 (scanner.compute_technical_factors) 的對照"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import factor_engine
+from metrics import REGISTRY
+from factor_engine import FACTOR_COLUMNS, compute_factor_table
+from price_panel import slice_ticker
+from scanner import compute_technical_factors
+
+
+def synthetic_panel(n_tickers=40, n_days=300, seed=0):
+    """
+    合成面板：上市日不同 (含不足 60 根)、中間停牌缺值、成交量缺值；大盤有缺日
+    回傳 (panel, market_returns, quotes)
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2024-01-01', periods=n_days)
+    tickers = [f"{1000 + i}.TW" for i in range(n_tickers)]
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_days, n_tickers)), axis=0))
+    volume = rng.integers(0, 3_000_000, (n_days, n_tickers)).astype(float)
+    starts = rng.integers(0, n_days - 20, n_tickers)
+    starts[:5] = n_days - rng.integers(10, 59, 5)  # 日K不足 60 根
+    for j, start in enumerate(starts):
+        close[:start, j] = np.nan
+        volume[:start, j] = np.nan
+    gaps = rng.random((n_days, n_tickers)) < 0.02
+    close[gaps] = np.nan
+    volume[rng.random((n_days, n_tickers)) < 0.01] = np.nan
+    volume[:, 7] = 100.0  # 均量 <= 500：意圖因子為 NaN
+
+    panel = {'Close': pd.DataFrame(close, index=dates, columns=tickers),
+             'Volume': pd.DataFrame(volume, index=dates, columns=tickers)}
+    panel['Open'] = panel['High'] = panel['Low'] = panel['Close']
+    market = pd.Series(rng.normal(0, 0.01, n_days), index=dates)
+    market_returns = market.drop(dates[rng.choice(n_days, 15, replace=False)])
+    quotes = {t: float(q) for t, q in zip(tickers[::3], rng.uniform(20, 80, len(tickers[::3])))}
+    return panel, market_returns, quotes
+
+
+def reference_table(panel, market_returns, quotes):
+    rows = {}
+    for ticker in panel['Close'].columns:
+        data = slice_ticker(panel, ticker)
+        price = quotes.get(ticker, data['Close'].iloc[-1])
+        rows[ticker] = compute_technical_factors(price, data, market_returns)
+    return pd.DataFrame.from_dict(rows, orient='index')[FACTOR_COLUMNS]
+
+
+def assert_same(table, expected):
+    assert list(table.index) == list(expected.index)
+    a, b = table[FACTOR_COLUMNS].to_numpy(float), expected.to_numpy(float)
+    np.testing.assert_array_equal(np.isnan(a), np.isnan(b))
+    np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_matches_per_ticker_function(seed):
+    panel, market_returns, quotes = synthetic_panel(seed=seed)
+    table = compute_factor_table(panel, market_returns, quotes, workers=0)
+    assert_same(table, reference_table(panel, market_returns, quotes))
+    assert (table['n_bars'] < 60).sum() >= 5
+    assert table['intent_ratio'].isna().sum() > (table['n_bars'] < 60).sum()
+
+
+def test_empty_market_returns_gives_default_beta():
+    panel, _, quotes = synthetic_panel(n_tickers=10)
+    table = compute_factor_table(panel, pd.Series(dtype=float), quotes, workers=0)
+    enough = table['n_bars'] >= 60
+    assert (table.loc[enough, 'beta'] == 1.0).all()
+    assert_same(table, reference_table(panel, pd.Series(dtype=float), quotes))
+
+
+def test_process_pool_matches_serial(monkeypatch):
+    panel, market_returns, quotes = synthetic_panel(n_tickers=64)
+    monkeypatch.setattr(factor_engine, 'MIN_PARALLEL_TICKERS', 1)
+    serial = compute_factor_table(panel, market_returns, quotes, workers=0)
+    REGISTRY.reset()
+    parallel = compute_factor_table(panel, market_returns, quotes, workers=2)
+    assert 'compute.factor_pool' not in REGISTRY.snapshot()  # 真的走行程池，沒有退回本行程計算
+    pd.testing.assert_frame_equal(parallel, serial)
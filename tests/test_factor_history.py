@@ -0,0 +1,92 @@
+"""因子歷史：串流更新 (RollingFactors) 與整段計算 (rolling_factors) 的對照，以及 FactorHistory.extend 的接續 / 重算"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from factor_engine import FACTOR_COLUMNS
+from factor_history import FactorHistory, RollingFactors, history_frame, rolling_factors
+
+
+def synthetic_bars(n_days=400, seed=0):
+    """單檔日K (含停牌缺值、成交量缺值) 與缺日的大盤報酬"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2023-01-02', periods=n_days)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+    close[rng.random(n_days) < 0.03] = np.nan
+    volume = rng.integers(0, 2_000_000, n_days).astype(float)
+    volume[rng.random(n_days) < 0.02] = np.nan
+    data = pd.DataFrame({'Close': close, 'Volume': volume}, index=dates)
+    market = pd.Series(rng.normal(0, 0.01, n_days), index=dates)
+    return data, market.drop(dates[rng.choice(n_days, 20, replace=False)])
+
+
+def batch(data, market, lookback):
+    m = market.reindex(data.index).to_numpy()
+    return rolling_factors(data[['Close']].to_numpy(), data[['Volume']].to_numpy(), m, lookback=lookback)
+
+
+def assert_row(streamed, cols, i):
+    for col in FACTOR_COLUMNS:
+        np.testing.assert_allclose(streamed[col], cols[col][i, 0], rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=col)
+
+
+@pytest.mark.parametrize('lookback', [250, 80])
+def test_streaming_matches_batch(lookback):
+    data, market = synthetic_bars()
+    cols = batch(data, market, lookback)
+    m = market.reindex(data.index).to_numpy()
+    start = 100
+    state = RollingFactors.from_history(data['Close'][:start], data['Volume'][:start], m[:start], lookback)
+    assert_row(state.factors(), cols, start - 1)
+    for i in range(start, len(data)):
+        assert_row(state.update(data['Close'].iloc[i], data['Volume'].iloc[i], m[i]), cols, i)
+
+
+def test_revise_last_bar():
+    data, market = synthetic_bars(seed=1)
+    cols = batch(data, market, 250)
+    m = market.reindex(data.index).to_numpy()
+    state = RollingFactors.from_history(data['Close'][:300], data['Volume'][:300], m[:300])
+    for i in range(300, 320):
+        state.update(data['Close'].iloc[i] * 1.05, 1.0, 0.0)   # 盤中K棒
+        assert_row(state.revise(data['Close'].iloc[i], data['Volume'].iloc[i], m[i]), cols, i)
+
+
+def assert_frame(history, data, market):
+    expected = history_frame(data, market)
+    pd.testing.assert_index_equal(history.frame.index, expected.index)
+    np.testing.assert_allclose(history.frame.to_numpy(dtype=float), expected.to_numpy(dtype=float),
+                               rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+def test_extend_appends_new_bars():
+    data, market = synthetic_bars(seed=2)
+    history = FactorHistory(data.iloc[:-5], market)
+    assert history.extend(data, market)
+    assert_frame(history, data, market)
+    assert history.extend(data, market)  # 沒有新K棒
+    assert_frame(history, data, market)
+
+
+def test_extend_revises_intraday_bar():
+    data, market = synthetic_bars(seed=3)
+    intraday = data.iloc[:-3].copy()
+    intraday.iloc[-1] = [intraday['Close'].iloc[-1] * 0.97, 123.0]
+    history = FactorHistory(intraday, market)
+    assert history.extend(data, market)
+    assert_frame(history, data, market)
+
+
+def test_extend_rebuilds_when_history_rewritten():
+    data, market = synthetic_bars(seed=4)
+    history = FactorHistory(data.iloc[:-5], market)
+    # 日K資料庫只保留最近一年：第一根往後移
+    rolled = data.iloc[5:]
+    assert not history.extend(rolled, market)
+    assert_frame(history, rolled, market)
+
+    # 還原權值：驗證視窗內較早的K棒被改寫
+    adjusted = rolled.copy()
+    adjusted.iloc[-4, 0] *= 0.9
+    assert not history.extend(adjusted, market)
+    assert_frame(history, adjusted, market)
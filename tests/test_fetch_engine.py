@@ -0,0 +1,126 @@
+"""FetchEngine 對合成資料源 (延遲 + 20% 429) 的行為：結果分類、重試次數、AIMD 並發退讓"""
+import asyncio
+
+import pytest
+
+from fetch_engine import (AIMDLimiter, FetchEngine, NoData, RateLimited, NO_DATA, RATE_LIMIT, TIMEOUT, NETWORK, ERROR,
+                          classify_error)
+from providers import SyntheticProvider
+
+N_TICKERS = 200
+LATENCY = 0.005
+
+
+def fast_engine(**kwargs):
+    options = dict(rate=2000.0, burst=200, initial_concurrency=10, max_concurrency=32, base_delay=0.01, max_delay=0.05)
+    return FetchEngine(**dict(options, **kwargs))
+
+
+def info_fetcher(provider, empty):
+    """同 scanner.fetch_fundamentals：.info 為空視為 NoData"""
+    def fetch(ticker):
+        info = {} if ticker in empty else provider.get_statement(ticker, 'info')
+        if not info:
+            raise NoData(f"{ticker} 無 .info 資料")
+        return info
+    return fetch
+
+
+def test_outcomes_under_synthetic_rate_limits():
+    provider = SyntheticProvider(n_tickers=N_TICKERS, latency=LATENCY, rate_limit_rate=0.2, seed=1)
+    tickers, _ = provider.get_universe()
+    empty = set(tickers[::10])
+    engine = fast_engine()
+    results = engine.run(tickers, info_fetcher(provider, empty))
+
+    assert set(engine.outcomes) == set(tickers)
+    assert sum(engine.summary().values()) == len(tickers)
+    ok = {t for t, o in engine.outcomes.items() if o['status'] == 'ok'}
+    assert set(results) == ok
+    assert all(results[t]['marketCap'] > 0 for t in ok)
+
+    for ticker in empty:
+        outcome = engine.outcomes[ticker]
+        assert (outcome['status'], outcome['error_class'], outcome['attempts']) == ('failed', NO_DATA, 1)
+
+    retried = [o for o in engine.outcomes.values() if o['attempts'] > 1]
+    assert len(retried) > len(tickers) // 10  # 約 20% 第一次就被 429
+    assert all(o['status'] == 'ok' or o['error_class'] == RATE_LIMIT for o in retried)
+    for outcome in engine.outcomes.values():
+        if outcome['error_class'] == RATE_LIMIT:
+            assert outcome['attempts'] == engine.max_retries + 1
+        if outcome['status'] == 'ok':
+            assert outcome['fetch_time'] >= LATENCY * outcome['attempts'] * 0.9
+        assert outcome['latency'] >= outcome['fetch_time']
+
+
+def run_sampling_limit(engine, tickers, fetch):
+    """執行並記錄每次請求當下的並發上限"""
+    samples = []
+
+    def sampled(ticker):
+        samples.append(engine.limiter.limit)
+        return fetch(ticker)
+
+    engine.run(tickers, sampled)
+    return samples
+
+
+def test_aimd_backs_off_on_429_and_grows_without():
+    provider = SyntheticProvider(n_tickers=N_TICKERS, latency=LATENCY, rate_limit_rate=0.2, seed=2)
+    tickers, _ = provider.get_universe()
+    throttled = fast_engine()
+    samples = run_sampling_limit(throttled, tickers, info_fetcher(provider, set()))
+    assert min(samples) <= 2
+    assert sum(samples) / len(samples) < throttled.initial_concurrency / 2
+    assert throttled.limiter.in_flight == 0
+
+    clean = fast_engine()
+    samples = run_sampling_limit(clean, tickers, info_fetcher(SyntheticProvider(n_tickers=N_TICKERS, latency=LATENCY), set()))
+    assert clean.summary() == {'ok': len(tickers)}
+    assert all(o['attempts'] == 1 for o in clean.outcomes.values())
+    assert min(samples) == clean.initial_concurrency
+    assert clean.limiter.limit > clean.initial_concurrency
+
+
+def test_aimd_limiter_steps():
+    async def steps():
+        limiter = AIMDLimiter(initial=8, minimum=1, maximum=10)
+        await limiter.acquire()
+        await limiter.release(throttled=True)
+        assert limiter.limit == 4
+        await limiter.acquire()
+        await limiter.release()
+        assert limiter.limit == pytest.approx(4.25)
+        for _ in range(10):
+            await limiter.acquire()
+            await limiter.release(throttled=True)
+        assert limiter.limit == 1
+        for _ in range(200):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 10
+    asyncio.run(steps())
+
+
+def test_timeouts_are_retried():
+    calls = {}
+
+    async def slow_once(key):
+        calls[key] = calls.get(key, 0) + 1
+        if calls[key] == 1:
+            await asyncio.sleep(1)
+        return key
+
+    engine = fast_engine(timeout=0.05)
+    assert engine.run(['a', 'b'], slow_once) == {'a': 'a', 'b': 'b'}
+    assert all(o['attempts'] == 2 for o in engine.outcomes.values())
+
+
+def test_classify_error():
+    assert classify_error(RateLimited("x")) == RATE_LIMIT
+    assert classify_error(Exception("HTTP Error 429: Too Many Requests")) == RATE_LIMIT
+    assert classify_error(asyncio.TimeoutError()) == TIMEOUT
+    assert classify_error(NoData("x")) == NO_DATA
+    assert classify_error(ConnectionResetError()) == NETWORK
+    assert classify_error(KeyError('marketCap')) == ERROR
@@ -0,0 +1,175 @@
+"""AlertDispatcher 對本機 HTTP stub (假 Telegram API) 的行為：連線池、合併、429 重送、限速、去重"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from notify import AlertDispatcher, batch_messages, split_message
+
+
+class TelegramStub(ThreadingHTTPServer):
+    """記錄每個 sendMessage 請求；responses 依序回應 (用完後一律 200)"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.requests = []
+        self.responses = []
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive，才看得出連線有沒有重用
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.requests.append({'path': self.path, 'port': self.client_address[1], 'at': time.monotonic(), **body})
+            status, payload = self.server.responses.pop(0) if self.server.responses else (200, {'ok': True})
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = TelegramStub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_dispatcher(stub, tmp_path):
+    created = []
+
+    def make(**kwargs):
+        options = dict(token='TEST', chat_id='42', api_base=stub.api_base, min_interval=0.0, batch_wait=0.05,
+                       sent_path=str(tmp_path / 'sent.json'))
+        dispatcher = AlertDispatcher(**dict(options, **kwargs))
+        created.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in created:
+        dispatcher.close(timeout=5)
+
+
+def test_batches_queued_messages_over_one_pooled_connection(stub, make_dispatcher):
+    dispatcher = make_dispatcher(batch_wait=0.2)
+    for i in range(5):
+        assert dispatcher.send(f"alert {i}")
+    assert dispatcher.flush(timeout=5)
+    assert len(stub.requests) == 1
+    assert stub.requests[0]['path'] == '/botTEST/sendMessage'
+    assert stub.requests[0]['chat_id'] == '42'
+    assert stub.requests[0]['text'] == "\n\n".join(f"alert {i}" for i in range(5))
+
+    for i in range(3):
+        dispatcher.send(f"later {i}")
+        assert dispatcher.flush(timeout=5)
+    assert len({r['port'] for r in stub.requests}) == 1  # 同一條 keep-alive 連線
+    assert dispatcher.stats['sent'] == 4
+
+
+def test_long_batches_are_split_at_max_len(stub, make_dispatcher):
+    dispatcher = make_dispatcher(max_len=50)
+    for i in range(6):
+        dispatcher.send(f"line {i} " + "x" * 20)
+    assert dispatcher.flush(timeout=5)
+    assert len(stub.requests) > 1
+    assert all(len(r['text']) <= 50 for r in stub.requests)
+    assert "".join(r['text'] for r in stub.requests).count("line") == 6
+
+
+def test_retries_after_429_retry_after(stub, make_dispatcher):
+    stub.responses = [(429, {'ok': False, 'parameters': {'retry_after': 0.3}})]
+    dispatcher = make_dispatcher()
+    dispatcher.send("hello")
+    assert dispatcher.flush(timeout=5)
+    assert len(stub.requests) == 2
+    assert stub.requests[1]['at'] - stub.requests[0]['at'] >= 0.3
+    assert dispatcher.stats['throttled'] == 1 and dispatcher.stats['sent'] == 1
+
+
+def test_rate_limits_each_chat(stub, make_dispatcher):
+    dispatcher = make_dispatcher(min_interval=0.3)
+    dispatcher.send("first")
+    assert dispatcher.flush(timeout=5)
+    dispatcher.send("second")
+    dispatcher.send("other chat", chat_id='7')
+    assert dispatcher.flush(timeout=5)
+    by_chat = {}
+    for r in stub.requests:
+        by_chat.setdefault(r['chat_id'], []).append(r['at'])
+    assert by_chat['42'][1] - by_chat['42'][0] >= 0.3
+    assert len(by_chat['7']) == 1
+
+
+def test_dedup_by_key_survives_restart(stub, make_dispatcher):
+    dispatcher = make_dispatcher()
+    assert dispatcher.send("2330 alert", key='2330')
+    assert not dispatcher.send("2330 again", key='2330')
+    assert dispatcher.send("2330 to another chat", chat_id='7', key='2330')
+    dispatcher.close(timeout=5)
+    assert dispatcher.stats['duplicates'] == 1
+
+    restarted = make_dispatcher()
+    assert not restarted.send("2330 after restart", key='2330')
+    assert restarted.send("2317 alert", key='2317')
+    assert restarted.flush(timeout=5)
+    assert [r['text'] for r in stub.requests].count("2330 alert") == 1
+
+
+def test_failed_send_releases_dedup_key(stub, make_dispatcher):
+    stub.responses = [(400, {'ok': False, 'description': 'Bad Request'})]
+    dispatcher = make_dispatcher()
+    dispatcher.send("2330 alert", key='2330')
+    assert dispatcher.flush(timeout=5)
+    assert dispatcher.stats['failed'] == 1
+    assert dispatcher.send("2330 alert", key='2330')  # 沒送成功的可以再送
+    assert dispatcher.flush(timeout=5)
+    assert dispatcher.stats['sent'] == 1
+
+
+def test_undelivered_keys_are_not_persisted(stub, make_dispatcher, tmp_path):
+    stub.delay = 1.0
+    dispatcher = make_dispatcher()
+    dispatcher.send("2330 alert", key='2330')
+    assert not dispatcher.close(timeout=0.1)  # 逾時：還在佇列 / 送出中
+    assert not (tmp_path / 'sent.json').exists() or '42:2330' not in json.loads((tmp_path / 'sent.json').read_text())
+
+    # 下一次排程執行仍會推播
+    stub.delay = 0.0
+    rerun = make_dispatcher()
+    assert rerun.send("2330 alert", key='2330')
+    assert rerun.flush(timeout=5)
+    assert '42:2330' in json.loads((tmp_path / 'sent.json').read_text())
+
+
+def test_unconfigured_token_is_disabled(make_dispatcher):
+    dispatcher = make_dispatcher(token='您的_BOT_TOKEN')
+    assert not dispatcher.enabled
+    assert not dispatcher.send("hello")
+
+
+def test_split_and_batch_messages():
+    assert split_message("a\nb", max_len=10) == ["a\nb"]
+    assert split_message("x" * 25, max_len=10) == ["x" * 10, "x" * 10, "x" * 5]
+    assert batch_messages(["aaa", "bbb", "ccc"], max_len=8) == ["aaa\n\nbbb", "ccc"]
@@ -0,0 +1,59 @@
+"""PriceStore 多個寫入者 (CLI 排程 + Streamlit 背景掃描) 同時更新同一個資料目錄"""
+import os
+import threading
+
+import price_store
+from price_store import PriceStore
+from providers import SyntheticProvider
+
+
+def run_writers(store_dir, groups, rounds=1, full_refresh=False):
+    """每組代號一個寫入者 (各自的 PriceStore 實例，如同不同行程)，同時開始更新"""
+    provider = SyntheticProvider(n_tickers=200, latency=0.05)
+    barrier = threading.Barrier(len(groups))
+    errors = []
+
+    def writer(group):
+        store = PriceStore(store_dir=store_dir, provider=provider)
+        try:
+            barrier.wait()
+            for _ in range(rounds):
+                store.update(group, full_refresh=full_refresh)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=writer, args=(group,)) for group in groups]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    return provider
+
+
+def check_store(store_dir, tickers):
+    store = PriceStore(store_dir=store_dir, provider=SyntheticProvider(n_tickers=200))
+    assert set(store.meta['tickers']) == set(tickers)
+    files = [part['file'] for part in store.meta['parts']]
+    assert len(files) == len(set(files))
+    assert all(os.path.exists(os.path.join(store_dir, name)) for name in files)
+    assert set(store.table()['ticker']) == set(tickers)
+    return store
+
+
+def test_concurrent_writers_keep_every_part(tmp_path):
+    tickers, _ = SyntheticProvider(n_tickers=200).get_universe()
+    groups = [tickers[i:i + 10] for i in range(0, 60, 10)]
+    run_writers(str(tmp_path), groups)
+    store = check_store(str(tmp_path), tickers[:60])
+    assert len(store.meta['parts']) == len(groups)
+
+
+def test_concurrent_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_store, 'MAX_PARTS', 2)
+    tickers, _ = SyntheticProvider(n_tickers=200).get_universe()
+    groups = [tickers[i:i + 5] for i in range(0, 20, 5)]
+    provider = run_writers(str(tmp_path), groups, rounds=3, full_refresh=True)
+    store = check_store(str(tmp_path), tickers[:20])
+    assert len(store.meta['parts']) <= 3
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith('.parquet')) == sorted(p['file'] for p in store.meta['parts'])
+    expected = provider.get_price_history(tickers[:1])['Close'][tickers[0]]
+    assert (store.load(tickers[0])['Close'].to_numpy() == expected.to_numpy()).all()
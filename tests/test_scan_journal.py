@@ -0,0 +1,50 @@
+"""掃描日誌的續跑 / 壓縮：正在寫入的日誌 (另一個掃描持有鎖) 不能被續寫或壓縮"""
+from scan_journal import FILTERED, SCORED, ScanJournal, _read_lines
+
+
+def open_journal(tmp_path, key, resume=True):
+    return ScanJournal.open(str(tmp_path), key, n_tickers=3, resume=resume, schema=1)
+
+
+def test_live_journal_is_not_resumed_or_compacted(tmp_path):
+    live = open_journal(tmp_path, 'k1')
+    live.record('2330.TW', SCORED, 'scoring', row={'代號': '2330'})
+
+    same_key = open_journal(tmp_path, 'k1')
+    other_key = open_journal(tmp_path, 'k2')
+    assert same_key.path != live.path and same_key.resumed == 0
+    lines = _read_lines(live.path)
+    assert not lines[-1].get('done') and lines[-1]['row'] == {'代號': '2330'}
+
+    live.record('2317.TW', FILTERED, 'technical', rule='bars<60')
+    live.finish()
+    assert [line['ticker'] for line in _read_lines(live.path)[1:-1]] == ['2330.TW', '2317.TW']
+    assert _read_lines(live.path)[-1]['done'] == 'done'
+    same_key.close()
+    other_key.close()
+
+
+def test_interrupted_journal_is_resumed_once(tmp_path):
+    first = open_journal(tmp_path, 'k1')
+    first.record('2330.TW', SCORED, 'scoring')
+    first.close()  # 中斷
+
+    resumed = open_journal(tmp_path, 'k1')
+    assert resumed.path == first.path and set(resumed.outcomes) == {'2330.TW'}
+    # 續跑中的日誌也持有鎖：同時開始的另一個掃描不會再接手
+    concurrent = open_journal(tmp_path, 'k1')
+    assert concurrent.path != first.path and concurrent.resumed == 0
+    concurrent.close()
+    resumed.finish()
+
+
+def test_unlocked_journal_with_other_key_is_abandoned(tmp_path):
+    old = open_journal(tmp_path, 'k1')
+    old.record('2330.TW', SCORED, 'scoring', row={'代號': '2330'})
+    old.close()
+
+    new = open_journal(tmp_path, 'k2')
+    lines = _read_lines(old.path)
+    assert lines[-1]['done'] == 'abandoned'
+    assert 'row' not in lines[1]
+    new.finish()
@@ -0,0 +1,121 @@
+"""run_scan 對合成資料源的增量行為：輸入指紋沒變的標的沿用評分，財報都在快取時不經 FetchEngine 限速"""
+import pytest
+
+import scanner
+from fetch_engine import FetchEngine
+from fundamentals_cache import FundamentalsCache
+from price_store import PriceStore
+from providers import SyntheticProvider
+from scanner import load_market_returns, run_scan
+
+N_TICKERS = 300
+
+
+class CountingProvider(SyntheticProvider):
+    """記錄每種財報被向資料源請求的次數"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = {}
+
+    def get_statement(self, ticker_symbol, kind):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        return super().get_statement(ticker_symbol, kind)
+
+
+def fast_engine():
+    return FetchEngine(rate=2000.0, burst=2000, initial_concurrency=32)
+
+
+@pytest.fixture
+def scan(tmp_path):
+    """回傳 scan(engine=None, panel=None)：同一份快取再掃一次 (預設同一份日K面板)，結果為 (results, stage_reports, engine)"""
+    provider = CountingProvider(n_tickers=N_TICKERS)
+    tickers, name_map = provider.get_universe()
+    store = PriceStore(store_dir=str(tmp_path / 'prices'), provider=provider)
+    market_returns = load_market_returns(store)
+    panel = store.update(tickers)
+    cache = FundamentalsCache(cache_dir=str(tmp_path / 'cache'))
+
+    def run(engine=None, panel=None):
+        engine = engine or fast_engine()
+        results, reports = run_scan(tickers, name_map, market_returns, panel if panel is not None else run.panel,
+                                    cache=cache, engine=engine, provider=provider)
+        return results, reports, engine
+
+    run.panel = panel
+    run.provider = provider
+    run.cache = cache
+    return run
+
+
+def by_ticker(results):
+    return {row['代號']: row for row in results}
+
+
+@pytest.fixture
+def score_calls(monkeypatch):
+    """記錄 score_ticker (評分) 被呼叫的代號"""
+    calls = []
+    score_ticker = scanner.score_ticker
+
+    def counting(ticker_symbol, *args, **kwargs):
+        calls.append(ticker_symbol)
+        return score_ticker(ticker_symbol, *args, **kwargs)
+
+    monkeypatch.setattr(scanner, 'score_ticker', counting)
+    return calls
+
+
+def test_unchanged_fingerprints_reuse_scores(scan, score_calls):
+    cold, cold_reports, _ = scan()
+    assert len(score_calls) == cold_reports[1]['out']
+    score_calls.clear()
+
+    warm, reports, engine = scan()
+    assert score_calls == []
+    assert engine.outcomes == {}
+    assert reports[-1]['reused'] == cold_reports[1]['out']
+    assert by_ticker(warm) == by_ticker(cold)
+
+
+def test_changed_inputs_force_rescore(scan, score_calls, monkeypatch):
+    cold, _, _ = scan()
+    score_calls.clear()
+
+    # 只改一檔的最新收盤：只有這檔重算
+    ticker = next(t for t in scan.panel['Close'].columns if t.replace('.TW', '').replace('.TWO', '') in by_ticker(cold))
+    panel = {field: frame.copy() for field, frame in scan.panel.items()}
+    panel['Close'].iloc[-1, panel['Close'].columns.get_loc(ticker)] *= 1.02
+    repriced, _, _ = scan(panel=panel)
+    assert score_calls == [ticker]
+    code = ticker.replace('.TW', '').replace('.TWO', '')
+    assert by_ticker(repriced)[code]['現價'] != by_ticker(cold)[code]['現價']
+    score_calls.clear()
+
+    # 改無風險利率：只有評分用到 RF (WACC / 合理價) 的標的重算，被安全濾網淘汰的沿用
+    monkeypatch.setattr(scanner, 'RF', scanner.RF + 0.01)
+    _, reports, _ = scan(panel=panel)
+    assert 0 < len(score_calls) < reports[1]['out']
+    assert set(by_ticker(cold)) <= {t.replace('.TW', '').replace('.TWO', '') for t in score_calls}
+
+
+def test_warm_rescore_bypasses_fetch_engine(scan, monkeypatch):
+    cold, _, cold_engine = scan()
+    assert cold_engine.outcomes and cold
+    provider_calls = dict(scan.provider.calls)
+
+    # 改無風險利率：用到 RF 的標的要重算，但財報都在快取裡，不必排進 FetchEngine
+    monkeypatch.setattr(scanner, 'RF', scanner.RF + 0.01)
+    slow = FetchEngine(rate=1.0, burst=1, initial_concurrency=1)
+    warm, reports, engine = scan(slow)
+    assert engine.outcomes == {}
+    assert scan.provider.calls == provider_calls
+    assert reports[1]['in'] == reports[1]['out'] == cold_engine.summary()['ok']
+    changed = [t for t, row in by_ticker(warm).items() if t in by_ticker(cold) and row['WACC'] != by_ticker(cold)[t]['WACC']]
+    assert changed
+
+    # 與清空快取後重抓重算的結果相同
+    scan.cache.clear()
+    fresh, _, _ = scan()
+    assert by_ticker(fresh) == by_ticker(warm)
@@ -0,0 +1,73 @@
+"""記憶體內篩選引擎：預設 Screen 與掃描的 rank_results 一致；條件字串的解析與錯誤"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fetch_engine import FetchEngine
+from providers import MARKET_INDEX, SyntheticProvider
+from scanner import rank_results, run_scan
+from screener import Screen, build_screen_table, compile_filter
+
+
+@pytest.fixture(scope='module')
+def scanned():
+    provider = SyntheticProvider(n_tickers=300, seed=5)
+    tickers, name_map = provider.get_universe()
+    panel = provider.get_price_history(tickers)
+    market_returns = provider.get_price_history([MARKET_INDEX])['Close'][MARKET_INDEX].pct_change().dropna()
+    factors = {}
+    results, _ = run_scan(tickers, name_map, market_returns, panel, provider=provider, factors=factors,
+                          engine=FetchEngine(rate=2000.0, burst=2000, initial_concurrency=32))
+    return results, build_screen_table(factors)
+
+
+def test_default_screen_matches_rank_results(scanned):
+    results, table = scanned
+    assert len(results) > 10
+    expected = rank_results(results, top_n=len(results)).set_index('代號')
+    screened = Screen().run(table, top_n=len(table)).set_index('代號')
+    assert set(screened.index) == set(expected.index)
+    screened = screened.loc[expected.index]
+    for col in ['現價', '合理價', 'AI綜合評分', '意圖因子', 'ROIC', 'FCF Yield', 'WACC', 'Beta']:
+        np.testing.assert_allclose(screened[col].to_numpy(float), expected[col].to_numpy(float), rtol=1e-9,
+                                   equal_nan=True, err_msg=col)
+    # 排序鍵相同：分數依序遞減
+    ranked = Screen().run(table, top_n=20)
+    assert ranked['AI綜合評分'].is_monotonic_decreasing
+    assert list(ranked['AI綜合評分']) == list(expected['AI綜合評分'].head(20))
+
+
+def test_stricter_filters_and_weights(scanned):
+    _, table = scanned
+    loose = Screen().run(table, top_n=len(table))
+    strict = Screen(filters=["n_bars >= 60", "current_price >= ma60", "fcf_yield >= 15%", "roic >= 0.08"]).run(table, top_n=len(table))
+    assert set(strict.index) < set(loose.index)
+    assert (strict['FCF Yield'] >= 0.15).all()
+    heavier = Screen(weights={'super_fcf': 100}).run(table, top_n=len(table))
+    super_fcf = heavier['FCF Yield'] > 0.15
+    np.testing.assert_allclose(heavier['AI綜合評分'][super_fcf],
+                               loose.loc[heavier.index[super_fcf], 'AI綜合評分'] + 70)
+
+
+def test_compile_filter():
+    cols = {'roic': np.array([0.05, 0.2, np.nan]), 'wacc': np.array([0.1, 0.1, 0.1])}
+    assert compile_filter("roic >= 10%")(cols).tolist() == [False, True, False]
+    assert compile_filter(" roic>wacc ")(cols).tolist() == [False, True, False]
+    assert compile_filter("roic != 0.2")(cols).tolist() == [True, False, True]
+    assert compile_filter("roic < 1e-1")(cols).tolist() == [True, False, False]
+
+
+@pytest.mark.parametrize('expr', ["roic", "roic >> 0.1", "0.1 <= roic", "roic >= 10%%", "roic >= 0.1 and pb < 1"])
+def test_compile_filter_rejects_bad_syntax(expr):
+    with pytest.raises(ValueError, match="無法解析"):
+        compile_filter(expr)
+
+
+def test_screen_rejects_unknown_names(scanned):
+    _, table = scanned
+    with pytest.raises(ValueError, match="未知的評分項目"):
+        Screen(weights={'momentum': 10})
+    with pytest.raises(ValueError, match="不存在的欄位"):
+        Screen(filters=["momentum > 0"]).run(table)
+    with pytest.raises(ValueError, match="不存在的欄位"):
+        Screen(filters=["roic >= hurdle"]).run(table)
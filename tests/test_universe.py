@@ -0,0 +1,52 @@
+"""股票池索引的 TTL 以建置時間為準，不受掃描後流動性回寫影響"""
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import universe
+from providers import SyntheticProvider
+
+
+class CountingProvider(SyntheticProvider):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.builds = 0
+
+    def get_universe_index(self):
+        self.builds += 1
+        return super().get_universe_index()
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(universe, 'provider_cache_dir', lambda name: str(tmp_path / name))
+    return CountingProvider(n_tickers=50)
+
+
+def test_liquidity_writes_do_not_extend_ttl(provider, monkeypatch):
+    index = universe.load_universe(provider)
+    assert provider.builds == 1
+    universe.load_universe(provider)
+    assert provider.builds == 1
+
+    # 建置後第 6 天掃描回寫流動性 (檔案修改時間跟著更新)，第 8 天再讀
+    now = time.time()
+    table = pd.DataFrame({'current_price': 10.0, 'avg_volume': 1000.0}, index=index.index[:5])
+    universe.update_liquidity(provider.name, table)
+    path = universe.universe_path(provider.name)
+    os.utime(path, (now + 6 * 86400, now + 6 * 86400))
+    monkeypatch.setattr(universe.time, 'time', lambda: now + 8 * 86400)
+    rebuilt = universe.load_universe(provider)
+    assert provider.builds == 2
+    assert rebuilt['liquidity'].notna().sum() == 5  # 重建保留流動性紀錄
+    universe.load_universe(provider)
+    assert provider.builds == 2
+
+
+def test_missing_build_time_rebuilds(provider, tmp_path):
+    universe.load_universe(provider)
+    (tmp_path / provider.name / universe.UNIVERSE_META).unlink()
+    universe.load_universe(provider)
+    assert provider.builds == 2
@@ -0,0 +1,77 @@
+"""估值引擎：蒙地卡羅分位數 (固定 seed)、Beta 不確定性、敏感度網格與逐點計算一致"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from scanner import global_params
+from valuation import fair_value, grid_frame, monte_carlo, sensitivity_grid, valuation_inputs, wacc
+
+
+@pytest.fixture
+def inputs():
+    rng = np.random.default_rng(7)
+    n = 30
+    table = pd.DataFrame({
+        'current_price': rng.uniform(20, 200, n),
+        'div_rate': np.where(rng.random(n) < 0.2, 0.0, rng.uniform(0.5, 8, n)),
+        'total_equity': np.where(np.arange(n) == 0, -1e9, rng.uniform(1e9, 1e11, n)),
+        'total_debt': rng.uniform(0, 5e10, n),
+        'roic': rng.uniform(-0.05, 0.3, n),
+        'beta': np.where(np.arange(n) == 1, np.nan, rng.uniform(0.3, 1.8, n)),
+        'volatility': rng.uniform(0.15, 0.6, n),
+    }, index=[f"{1000 + i}.TW" for i in range(n)])
+    return valuation_inputs(table, market_volatility=0.18)
+
+
+def test_monte_carlo_is_seeded(inputs):
+    pd.testing.assert_frame_equal(monte_carlo(inputs, n_draws=2000, seed=3), monte_carlo(inputs, n_draws=2000, seed=3))
+    assert not monte_carlo(inputs, n_draws=2000, seed=3).equals(monte_carlo(inputs, n_draws=2000, seed=4))
+
+
+def test_quantiles_are_ordered(inputs):
+    mc = monte_carlo(inputs, n_draws=5000, seed=1)
+    for value in ('fair_value', 'wacc'):
+        p5, p50, p95 = (mc[f'{value}_p{q}'].dropna() for q in (5, 50, 95))
+        assert (p5 <= p50).all() and (p50 <= p95).all()
+    has_dividend = inputs['div_rate'] != 0
+    assert (mc['fair_value_p5'][has_dividend] < mc['fair_value_p95'][has_dividend]).all()
+    assert (mc['fair_value_mean'][~has_dividend] == 0).all() and mc['p_undervalued'][~has_dividend].isna().all()
+    # 權益 <= 0：WACC 與價值創造機率為 NaN
+    assert mc.iloc[0][['wacc_mean', 'wacc_p50', 'p_value_creation']].isna().all()
+    assert mc['p_undervalued'].dropna().between(0, 1).all()
+
+
+def test_beta_uncertainty_widens_distribution(inputs):
+    fixed = monte_carlo(inputs, n_draws=5000, seed=2, beta_uncertainty=False)
+    noisy = monte_carlo(inputs, n_draws=5000, seed=2)
+    uncertain = (inputs['beta_se'] > 0) & (inputs['div_rate'] != 0) & (inputs['equity'] > 0)
+    assert uncertain.sum() > 10
+    width = lambda mc, value: (mc[f'{value}_p95'] - mc[f'{value}_p5'])[uncertain]
+    for value in ('fair_value', 'wacc'):
+        # Beta 標準誤很小的標的差異在抽樣誤差內，只要求不變窄
+        assert (width(noisy, value) >= width(fixed, value) * 0.98).all()
+        assert (width(noisy, value) > width(fixed, value)).mean() > 0.8
+        assert (width(noisy, value) / width(fixed, value)).median() > 1.05
+
+    # 參數與 Beta 都不抽樣：分布退化為目前參數下的點估計
+    p = global_params()
+    point = monte_carlo(inputs, n_draws=100, beta_uncertainty=False, param_std=dict.fromkeys(p, 0.0))
+    np.testing.assert_allclose(point['fair_value_p5'], point['fair_value_p95'])
+    np.testing.assert_allclose(point['fair_value_p50'],
+                               fair_value(inputs['div_rate'], inputs['beta'], p['RF'], p['MRP'], p['G_GROWTH']))
+
+
+def test_sensitivity_grid_matches_pointwise(inputs):
+    rf, growth = np.linspace(0.01, 0.03, 5), np.linspace(0.0, 0.04, 4)
+    grid = sensitivity_grid(inputs, RF=rf, G_GROWTH=growth)
+    assert grid['fair_value'].shape == (len(inputs['beta']), 5, 4)
+    p = global_params()
+    i, j = 3, 2
+    np.testing.assert_allclose(grid['fair_value'][:, i, j],
+                               fair_value(inputs['div_rate'], inputs['beta'], rf[i], p['MRP'], growth[j]))
+    np.testing.assert_allclose(grid['wacc'][:, i, j],
+                               wacc(inputs['beta'], inputs['equity'], inputs['debt'], rf[i], p['MRP'], p['COST_OF_DEBT_NET']))
+    frame = grid_frame(grid, ticker_pos=5)
+    assert frame.shape == (5, 4) and frame.index.name == 'RF' and frame.columns.name == 'G_GROWTH'
+    with pytest.raises(ValueError, match="未知的估值參數"):
+        sensitivity_grid(inputs, BETA=[1.0])
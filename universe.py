@@ -0,0 +1,111 @@
+"""
+股票池索引：代號 / 後綴 / 市場 / 產業別 / 名稱 / 流動性，存於 <快取>/<資料來源>/universe.parquet
+
+    tickers, name_map = select_tickers(provider, markets=['上市'], groups=['半導體業'], limit=200)
+
+- 索引建置 (走訪 twstock.codes) 只在檔案不存在或建置時間超過 UNIVERSE_TTL_DAYS 時執行
+  (建置時間另存於 universe.json；流動性回寫會改動 parquet，不能拿檔案修改時間判斷)
+- 流動性為近 60 日平均成交金額，每次掃描後由技術因子表回寫；掃描順序依流動性由高到低
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from fundamentals_cache import provider_cache_dir
+from providers import UNIVERSE_FIELDS
+
+# --- 股票池設定 ---
+UNIVERSE_FILE = 'universe.parquet'
+UNIVERSE_META = 'universe.json'   # {'built_at': 建置時間}
+UNIVERSE_TTL_DAYS = 7   # 上市櫃名單變動很少，每週重建一次
+MARKETS = ['上市', '上櫃']
+
+
+def universe_path(provider_name):
+    return os.path.join(provider_cache_dir(provider_name), UNIVERSE_FILE)
+
+
+def _read(path):
+    try:
+        return pd.read_parquet(path)
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+
+
+def _meta_path(path):
+    return os.path.join(os.path.dirname(path), UNIVERSE_META)
+
+
+def built_at(path):
+    """索引建置時間 (epoch 秒)；沒有紀錄時為 None"""
+    try:
+        with open(_meta_path(path), encoding='utf-8') as f:
+            return float(json.load(f)['built_at'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write(path, universe, built=None):
+    """built: 重建時傳入建置時間 (流動性回寫不傳，保留原本的建置時間)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    universe.to_parquet(tmp)
+    os.replace(tmp, path)
+    if built is not None:
+        with open(_meta_path(path) + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'built_at': built}, f)
+        os.replace(_meta_path(path) + '.tmp', _meta_path(path))
+
+
+def load_universe(provider, refresh=False):
+    """讀取股票池索引；不存在、過期或 refresh 時重建 (保留既有的流動性紀錄)"""
+    path = universe_path(provider.name)
+    cached = _read(path)
+    built = built_at(path)
+    if cached is not None and not refresh and built is not None and time.time() - built < UNIVERSE_TTL_DAYS * 86400:
+        return cached
+    universe = provider.get_universe_index()[UNIVERSE_FIELDS].copy()
+    universe['liquidity'] = cached['liquidity'].reindex(universe.index) if cached is not None else np.nan
+    _write(path, universe, built=time.time())
+    return universe
+
+
+def select_universe(universe, markets=None, groups=None, watchlist=None, limit=None):
+    """
+    依市場 / 產業 / 自選清單篩出子股票池 (條件之間為 AND)，依流動性由高到低排序，limit 取前 N 檔
+    watchlist: 代號 (2330) 或含後綴 (2330.TW) 皆可
+    """
+    mask = np.ones(len(universe), dtype=bool)
+    if markets:
+        mask &= universe['market'].isin(markets).to_numpy()
+    if groups:
+        mask &= universe['group'].isin(groups).to_numpy()
+    if watchlist:
+        wanted = {str(w).strip().upper() for w in watchlist}
+        mask &= (universe.index.str.upper().isin(wanted) | universe['code'].isin(wanted)).to_numpy()
+    selected = universe[mask]
+    # 沒有流動性紀錄的 (新上市 / 尚未掃描過) 排最後，維持原順序
+    order = np.argsort(-selected['liquidity'].fillna(-1).to_numpy(), kind='stable')
+    selected = selected.iloc[order]
+    return selected.head(limit) if limit else selected
+
+
+def select_tickers(provider, refresh=False, **scope):
+    """scope: select_universe 的條件 (markets / groups / watchlist / limit)；回傳 (tickers, name_map)"""
+    selected = select_universe(load_universe(provider, refresh=refresh), **scope)
+    return list(selected.index), dict(selected['name'])
+
+
+def update_liquidity(provider_name, factor_table):
+    """掃描後回寫流動性 (現價 × 60 日均量)"""
+    path = universe_path(provider_name)
+    universe = _read(path)
+    if universe is None or factor_table is None or factor_table.empty:
+        return
+    traded = (factor_table['current_price'] * factor_table['avg_volume']).dropna()
+    traded = traded[traded.index.isin(universe.index)]
+    universe.loc[traded.index, 'liquidity'] = traded
+    _write(path, universe)
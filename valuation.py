@@ -0,0 +1,150 @@
+"""
+向量化估值引擎：合理價 (股利折現) 與 WACC 的參數敏感度網格、蒙地卡羅分布
+全部以 NumPy broadcasting 計算 (代號 × 參數 / 代號 × 抽樣)，不逐檔迴圈
+
+    inputs = valuation_inputs(screen_table.loc[tickers])          # screener.build_screen_table 的列
+    grid = sensitivity_grid(inputs, RF=np.linspace(0.01, 0.03, 5), G_GROWTH=np.linspace(0, 0.04, 5))
+    mc = monte_carlo(inputs, n_draws=10000)                         # 每檔的分位數 / 低估機率
+"""
+import numpy as np
+import pandas as pd
+
+from factor_engine import TRADING_DAYS
+
+# --- 估值設定 ---
+KE_MINUS_G_FLOOR = 0.015   # 同 score_ticker：k - g 下限，避免分母趨近 0
+MARKET_VOLATILITY = 0.18   # 大盤年化波動 (掃描未提供時的預設，用於估 Beta 標準誤)
+BETA_OBS = TRADING_DAYS    # 估 Beta 的日報酬筆數 (約一年)
+PARAM_NAMES = ('RF', 'MRP', 'G_GROWTH', 'COST_OF_DEBT_NET')
+
+# 蒙地卡羅預設分布：參數 -> 常態分布標準差 (平均值為目前的全局參數)；同一次抽樣全市場共用
+PARAM_STD = {'RF': 0.0025, 'MRP': 0.01, 'G_GROWTH': 0.005, 'COST_OF_DEBT_NET': 0.003}
+MC_QUANTILES = (5, 50, 95)
+
+
+def cost_of_equity(beta, RF, MRP):
+    return RF + beta * MRP
+
+
+def fair_value(div_rate, beta, RF, MRP, G_GROWTH):
+    """股利折現合理價 div / max(ke - g, 下限)；無股利為 0 (同 score_ticker)"""
+    ke = cost_of_equity(beta, RF, MRP)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(div_rate != 0, div_rate / np.maximum(ke - G_GROWTH, KE_MINUS_G_FLOOR), 0.0)
+
+
+def wacc(beta, equity, debt, RF, MRP, COST_OF_DEBT_NET):
+    """加權平均資本成本；權益 <= 0 為 NaN (同 score_ticker)"""
+    ke = cost_of_equity(beta, RF, MRP)
+    capital = equity + debt
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(equity > 0, ke * equity / capital + COST_OF_DEBT_NET * debt / capital, np.nan)
+
+
+def beta_std_error(beta, volatility, market_volatility=MARKET_VOLATILITY, n_obs=BETA_OBS):
+    """
+    Beta 的 OLS 標準誤：殘差變異 = 個股變異 - β² × 大盤變異，se = sqrt(殘差變異 / ((n-2) × 大盤變異))
+    波動度缺值時視為 0 (不加不確定性)
+    """
+    with np.errstate(invalid='ignore'):
+        resid = np.maximum(np.nan_to_num(volatility) ** 2 - beta ** 2 * market_volatility ** 2, 0.0)
+        return np.sqrt(resid / ((n_obs - 2) * market_volatility ** 2))
+
+
+def valuation_inputs(table, market_volatility=None):
+    """
+    screener.build_screen_table 的列 -> 估值輸入 {欄位: 一維陣列}
+    缺值比照 score_ticker：股利 / 權益 / 負債視為 0，Beta 缺值為 1
+    """
+    market_volatility = market_volatility or table.attrs.get('market_volatility') or MARKET_VOLATILITY
+    col = lambda name: table[name].to_numpy(np.float64) if name in table else np.full(len(table), np.nan)
+    beta = np.where(np.isnan(col('beta')), 1.0, col('beta'))
+    return {
+        'tickers': np.asarray(table.index),
+        'price': col('current_price'),
+        'div_rate': np.nan_to_num(col('div_rate')),
+        'equity': np.nan_to_num(col('total_equity')),
+        'debt': np.nan_to_num(col('total_debt')),
+        'roic': col('roic'),
+        'beta': beta,
+        'beta_se': beta_std_error(beta, col('volatility'), market_volatility),
+    }
+
+
+def _params(params):
+    from scanner import global_params
+    return dict(global_params(), **(params or {}))
+
+
+def sensitivity_grid(inputs, params=None, **axes):
+    """
+    參數敏感度網格：axes 為 參數名 -> 數值序列 (最多四個參數，見 PARAM_NAMES)
+    回傳 {'fair_value', 'wacc': ndarray(代號, *各軸長度), 'axes': {參數: 數值}}；未列為軸的參數用 params / 全局參數
+    """
+    unknown = set(axes) - set(PARAM_NAMES)
+    if unknown:
+        raise ValueError(f"未知的估值參數: {', '.join(sorted(unknown))}")
+    p = _params(params)
+    ndim = 1 + len(axes)
+    # 第 0 軸為代號，第 i 軸為第 i 個參數
+    for i, (name, values) in enumerate(axes.items(), 1):
+        shape = [1] * ndim
+        shape[i] = -1
+        p[name] = np.asarray(values, dtype=np.float64).reshape(shape)
+    ticker = lambda a: np.asarray(a, dtype=np.float64).reshape([-1] + [1] * (ndim - 1))
+    beta = ticker(inputs['beta'])
+    fv = fair_value(ticker(inputs['div_rate']), beta, p['RF'], p['MRP'], p['G_GROWTH'])
+    wc = wacc(beta, ticker(inputs['equity']), ticker(inputs['debt']), p['RF'], p['MRP'], p['COST_OF_DEBT_NET'])
+    shape = (len(inputs['beta']),) + tuple(len(v) for v in axes.values())
+    return {
+        'fair_value': np.broadcast_to(fv, shape),
+        'wacc': np.broadcast_to(wc, shape),
+        'axes': {name: np.asarray(values, dtype=np.float64) for name, values in axes.items()},
+    }
+
+
+def grid_frame(grid, ticker_pos=0, value='fair_value'):
+    """二維網格 (兩個參數軸) 中的一檔 -> DataFrame(列 = 第一個參數, 欄 = 第二個參數)，方便顯示"""
+    (row_name, rows), (col_name, cols) = grid['axes'].items()
+    return pd.DataFrame(grid[value][ticker_pos], index=pd.Index(rows, name=row_name), columns=pd.Index(cols, name=col_name))
+
+
+def monte_carlo(inputs, n_draws=10000, params=None, param_std=None, beta_uncertainty=True, seed=0,
+                quantiles=MC_QUANTILES, return_draws=False):
+    """
+    蒙地卡羅：全局參數每次抽樣全市場共用 (1 × n_draws)，Beta 依各檔標準誤獨立抽樣 (代號 × n_draws)
+    回傳每檔一列的 DataFrame：合理價 / WACC 的平均與分位數、低估機率 P(合理價 > 現價)、價值創造機率 P(ROIC > WACC)
+    return_draws=True 時另回傳 {'fair_value', 'wacc': 代號 × n_draws}
+    """
+    p = _params(params)
+    std = dict(PARAM_STD, **(param_std or {}))
+    rng = np.random.default_rng(seed)
+    n = len(inputs['beta'])
+
+    draws = {name: p[name] + std.get(name, 0.0) * rng.standard_normal((1, n_draws)) for name in PARAM_NAMES}
+    beta = inputs['beta'][:, None]
+    if beta_uncertainty:
+        beta = beta + inputs['beta_se'][:, None] * rng.standard_normal((n, n_draws))
+
+    fv = fair_value(inputs['div_rate'][:, None], beta, draws['RF'], draws['MRP'], draws['G_GROWTH'])
+    wc = wacc(beta, inputs['equity'][:, None], inputs['debt'][:, None], draws['RF'], draws['MRP'], draws['COST_OF_DEBT_NET'])
+
+    # 權益 <= 0 的標的 WACC 整列為 NaN：先以 0 計算分位數再遮罩
+    has_wacc = inputs['equity'] > 0
+    wc_filled = np.where(has_wacc[:, None], wc, 0.0)
+    fv_q = np.percentile(fv, quantiles, axis=1)
+    wc_q = np.percentile(wc_filled, quantiles, axis=1)
+    with np.errstate(invalid='ignore'):
+        value_creation = np.where(has_wacc, (inputs['roic'][:, None] > wc_filled).mean(axis=1), np.nan)
+        undervalued = np.where(inputs['div_rate'] != 0, (fv > inputs['price'][:, None]).mean(axis=1), np.nan)
+    summary = pd.DataFrame({'fair_value_mean': fv.mean(axis=1)}, index=inputs['tickers'])
+    for q, values in zip(quantiles, fv_q):
+        summary[f'fair_value_p{q}'] = values
+    summary['wacc_mean'] = np.where(has_wacc, wc_filled.mean(axis=1), np.nan)
+    for q, values in zip(quantiles, wc_q):
+        summary[f'wacc_p{q}'] = np.where(has_wacc, values, np.nan)
+    summary['p_undervalued'] = undervalued
+    summary['p_value_creation'] = value_creation
+    if return_draws:
+        return summary, {'fair_value': fv, 'wacc': wc}
+    return summary